@@ -1,8 +1,6 @@
 import os
 import sys
 import numpy as np
-from scipy.io import savemat, loadmat
-import pandas as pd
 
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QGridLayout, 
                              QWidget,  QFileDialog, QShortcut, QMessageBox)
@@ -13,6 +11,84 @@ from plotcanvas import PlotCanvas
 from controlpanel import ControlPanel
 from fontsizeadjuster import FontSizeAdjuster
 from spatial_analysis_utils import *
+from projectwatcher import ProjectWatcher
+from projectscanner import iter_cluster_folders, CLEAN_EXPORT_FILE_NAME
+from clustersession import ClusterSession
+from datamanager import DataManager, load_edit_rules, save_edit_rules, EDIT_RULES_FILE_NAME
+from tasks import TaskRunner
+from cleanexport import build_export_data, write_mat_file, read_clean_export, LEGACY_LAYOUT, COMPACT_LAYOUT, LIMIT_NAMES
+from tracing import traced, span
+from tracingpanel import add_tracing_actions
+from memoryaccounting import MemoryAccountant, figure_nbytes, MEMORY_LOG_ENV_VAR, DEFAULT_MEMORY_LOG
+from memorypanel import MemoryPanel
+
+# Export formats offered by the editor: (layout, do_compression, hdf5). The first is the default.
+EXPORT_FORMATS = {
+    'Struct per sounding (legacy)': (LEGACY_LAYOUT, False, False),
+    'Matrix, compressed': (COMPACT_LAYOUT, True, False),
+    'Matrix, v7.3/HDF5': (COMPACT_LAYOUT, True, True),
+}
+# Attributes holding the state of the open cluster, kept in the session when switching clusters
+SESSION_ATTRIBUTES = ('file_colors', 'current_xlim_main', 'current_ylim_main', 'current_xlim_export',
+                      'current_ylim_export', 'current_plot_index', 'current_plot_index_loc',
+                      'integrated_data_ori', 'integrated_data_plot', 'integrated_data_export',
+                      'data_ori', 'keep_data_boolean_df', 'keep_file_boolean_df', 'file_name_list', 'nztm_data_dict',
+                      'nztmX_list', 'nztmY_list', 'closest_file_ids_dict', 'min_depth', 'max_depth', 'max_qt',
+                      'limits', 'edit_rules')
+SCAN_TASK = 'scan clusters'
+SESSION_MEMORY_BUDGET = 1024 ** 3  # Bytes of cluster state kept in memory before spilling to disk
+
+
+# Background tasks of the editor. They run on worker threads, so they only read
+# files and build data; the editor applies the results on the GUI thread.
+
+@traced('load cluster', 'task')
+def load_cluster(task, project_path, cluster_name):
+    manager = DataManager(project_path)
+    manager.select_cluster(cluster_name, progress=task.report_progress)
+    manager.closest_file_ids_dict = manager.create_closest_file_ids_dict()
+    return manager
+
+
+@traced('load processed cluster', 'task')
+def load_processed_cluster(task, project_path, cluster_name):
+    cluster_folder = os.path.join(project_path, cluster_name)
+    results = read_clean_export(os.path.join(cluster_folder, 'clean_data_from_python.mat'))
+    results['cluster_name'] = cluster_name
+    results['edit_rules'] = load_edit_rules(os.path.join(cluster_folder, EDIT_RULES_FILE_NAME))
+    if results['limits'] is None:
+        # Exports written before the limits were stored
+        manager = DataManager(project_path)
+        manager.find_max_min_values(os.path.join(cluster_folder, 'Extracted'))
+        results['limits'] = {name: getattr(manager, name) for name in LIMIT_NAMES}
+    if results['closest_file_ids_dict'] is None:
+        nztm_data_dict = results['nztm_data_dict']
+        file_ids = list(nztm_data_dict)
+        with span('neighbour search', 'compute'):
+            results['closest_file_ids_dict'] = find_all_closest_file_ids(
+                file_ids, [nztm_data_dict[f]['nztmX'] for f in file_ids], [nztm_data_dict[f]['nztmY'] for f in file_ids])
+    return results
+
+
+@traced('scan clusters', 'task')
+def scan_clusters(task, project_path):
+    # The cluster folders of the project, relative to it, and those holding a clean data export
+    clusters, mat_file_clusters = [], []
+    for cluster_folder in iter_cluster_folders(project_path):
+        cluster = os.path.relpath(cluster_folder, project_path)
+        clusters.append(cluster)
+        if os.path.isfile(os.path.join(cluster_folder, CLEAN_EXPORT_FILE_NAME)):
+            mat_file_clusters.append(cluster)
+    return sorted(clusters), sorted(mat_file_clusters)
+
+
+@traced('export cluster', 'task')
+def write_export(task, directory, tables, layout, do_compression, hdf5, edit_rules):
+    mat_data = build_export_data(**tables, layout=layout)
+    write_mat_file(os.path.join(directory, 'clean_data_from_python.mat'), mat_data,
+                   do_compression=do_compression, hdf5=hdf5)
+    # Save the edits so datamanager.py can redo the export without the GUI
+    save_edit_rules(os.path.join(directory, EDIT_RULES_FILE_NAME), edit_rules)
 
 
 class CPTDataEditor(QMainWindow):
@@ -22,11 +98,18 @@ class CPTDataEditor(QMainWindow):
         self.main_widget = QWidget(self)
         self.setCentralWidget(self.main_widget)
 
+        self.project_watcher = None  # Reports clusters exported while the project is open
+        self.tasks = TaskRunner(parent=self)  # Runs loading and exports off the GUI thread
+        self.cluster_session = ClusterSession(max_bytes=SESSION_MEMORY_BUDGET)  # Clusters opened before
+        self.project_path = ""
+        self.cluster_name = ""
         self.init_param()
         
         self.setup_shortcuts()
         self.font_size_adjuster = FontSizeAdjuster(self)
         self.setup_layout()
+        self.setup_memory_accounting()
+        self.setup_menu()
         self.showMaximized()
         
 
@@ -48,8 +131,13 @@ class CPTDataEditor(QMainWindow):
         self.integrated_data_export = None
         self.keep_data_boolean_df = None
         self.nztm_data = None
+        self.nztm_data_dict = {}
         self.keep_file_boolean_df = None
         self.file_name_list = None
+        self.edit_rules = [] # edits of this cluster, replayed by datamanager.py
+        self.closest_file_ids_dict = None
+        self.limits = None
+        self.data_ori = []
     
 
     def setup_layout(self):
@@ -74,6 +162,30 @@ class CPTDataEditor(QMainWindow):
         self.populate_right_panel()
 
     
+    def setup_memory_accounting(self):
+        # Structures of the open cluster, sized on demand by the Memory Usage panel
+        self.memory_accountant = MemoryAccountant(log_path=os.environ.get(MEMORY_LOG_ENV_VAR, DEFAULT_MEMORY_LOG))
+        for name in ('integrated_data_ori', 'integrated_data_plot', 'integrated_data_export', 'data_ori'):
+            self.memory_accountant.register(name, lambda name=name: getattr(self, name))
+        self.memory_accountant.register('keep masks', lambda: [self.keep_data_boolean_df, self.keep_file_boolean_df])
+        self.memory_accountant.register('locations and neighbours',
+                                        lambda: [self.nztm_data_dict, self.closest_file_ids_dict])
+        self.memory_accountant.register('cluster session (in memory)', lambda: self.cluster_session.current_bytes)
+        self.memory_accountant.register('rendered artists', lambda: sum(
+            figure_nbytes(canvas.fig) for canvas in (self.loc_plot_canvas, self.main_plot_canvas, self.export_plot_canvas)))
+        self.memory_panel = MemoryPanel(self.memory_accountant, parent=self)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.memory_panel)
+        self.memory_panel.hide()
+
+
+    def setup_menu(self):
+        self.help_menu = self.menuBar().addMenu("Help")
+        add_tracing_actions(self.help_menu, self)
+        memory_action = self.memory_panel.toggleViewAction()
+        memory_action.setText("Memory usage")
+        self.help_menu.addAction(memory_action)
+
+
     def setup_shortcuts(self):
         # Connect key press events to methods
         self.shortcut_previous = QShortcut(Qt.Key_Minus, self)
@@ -108,9 +220,11 @@ class CPTDataEditor(QMainWindow):
             ('button', 'Submit', self.on_submit_depth),
             ('button', 'Clear', self.on_delete_file)
         ])
-        self.left_control_panel.addFlexibleRow([
+        export_widgets = self.left_control_panel.addFlexibleRow([
+            ('combo', 'Format', list(EXPORT_FORMATS)),
             ('button', 'Export to .mat file', self.exportToMATLAB)
         ])
+        self.export_format_combobox = export_widgets.get('combo_Format')
         
         self.cluster_combobox = select_cluster_widgets.get('combo_Select Cluster')
         self.mat_file_clusters_combobox = select_processed_cluster_widgets.get('combo_Select Processed Cluster')
@@ -141,80 +255,142 @@ class CPTDataEditor(QMainWindow):
         self.mat_file_clusters_combobox.clear()
 
         if project_path:
-            try:
-                # clusters = [d for d in os.listdir(project_path) if os.path.isdir(os.path.join(project_path, d)) and d.startswith('Cluster ')]
-                clusters = [d for d in os.listdir(project_path) if os.path.isdir(os.path.join(project_path, d))]
-                mat_file_clusters = []  # List to hold clusters containing the .mat file
-                for cluster in clusters:
-                    cluster_path = os.path.join(project_path, cluster)
-                    if "clean_data_from_python.mat" in os.listdir(cluster_path):
-                        mat_file_clusters.append(cluster)  # Add to the list if .mat file is found
-                
-                # Populate the original cluster combobox
-                if clusters:
-                    self.cluster_combobox.addItems(clusters)
-                else:
-                    QMessageBox.information(self, "No Clusters Found", "No cluster directories found in the selected path.")
-                
-                # Populate the new combobox with clusters containing the .mat file
-                if mat_file_clusters:
-                    self.mat_file_clusters_combobox.addItems(mat_file_clusters)
-                    self.mat_file_clusters_combobox.setVisible(True)  # Ensure the combobox is visible
-                else:
-                    self.mat_file_clusters_combobox.setVisible(False)  # Hide if no such clusters exist
-                    QMessageBox.information(self, "No Data Files Found", "No clusters with 'clean_data_from_python.mat' found.")
-                
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Failed to list directories: {e}")
+            # The project is walked on a worker thread; a scan of a previous choice is dropped
+            self.tasks.submit(SCAN_TASK, scan_clusters, project_path, replace=True,
+                              on_result=self.on_clusters_scanned,
+                              on_error=lambda error: QMessageBox.critical(self, "Error", f"Failed to list directories: {error}"))
         else:
+            self.tasks.discard(SCAN_TASK)
             QMessageBox.warning(self, "No Directory Selected", "No directory was selected.")
         
         # Update project_path attribute only if a valid path was chosen
+        if project_path != self.project_path:
+            self.cluster_session.clear()
+            self.cluster_name = ""
         self.project_path = project_path if project_path else ""
+        self.watch_project()
 
-    def select_cluster(self):
+    def on_clusters_scanned(self, result):
+        clusters, mat_file_clusters = result
+        # Populate the original cluster combobox
+        if clusters:
+            self.cluster_combobox.addItems(clusters)
+        else:
+            QMessageBox.information(self, "No Clusters Found", "No cluster directories found in the selected path.")
+
+        # Populate the new combobox with clusters containing the .mat file; the project
+        # watcher may have added some of them meanwhile
+        if mat_file_clusters:
+            self.mat_file_clusters_combobox.addItems(
+                [cluster for cluster in mat_file_clusters if self.mat_file_clusters_combobox.findText(cluster) < 0])
+            self.mat_file_clusters_combobox.setVisible(True)  # Ensure the combobox is visible
+        else:
+            self.mat_file_clusters_combobox.setVisible(False)  # Hide if no such clusters exist
+            QMessageBox.information(self, "No Data Files Found", f"No clusters with '{CLEAN_EXPORT_FILE_NAME}' found.")
+
+    def closeEvent(self, event):
+        # Let a running export finish writing, then remove the clusters spilled to disk by this session
+        self.tasks.wait()
+        self.cluster_session.clear()
+        super().closeEvent(event)
+
+    def watch_project(self):
+        # Follow clean_data_from_python.mat exports written by other sessions or tools
+        if self.project_watcher is not None:
+            self.project_watcher.stop()
+            self.project_watcher.deleteLater()
+            self.project_watcher = None
+        if self.project_path:
+            self.project_watcher = ProjectWatcher(self.project_path, parent=self)
+            self.project_watcher.clean_exports_changed.connect(self.on_clean_exports_changed)
+            self.project_watcher.start()
+
+    def on_clean_exports_changed(self, paths):
+        # Add newly exported clusters to the processed cluster list. State kept in the
+        # session predates the export, so the cluster is loaded afresh when opened again
+        for path in paths:
+            cluster = os.path.relpath(os.path.dirname(path), self.project_path)  # Named like scan_clusters
+            self.cluster_session.discard(cluster)
+            if self.mat_file_clusters_combobox.findText(cluster) < 0:
+                self.mat_file_clusters_combobox.addItem(cluster)
+                self.mat_file_clusters_combobox.setVisible(True)
+
+    @traced('switch cluster', 'compute')
+    def switch_cluster(self, cluster_name):
+        """
+        Keeps the open cluster in the session and opens cluster_name, restoring it
+        from the session if it was opened before.
+
+        Submitting the open cluster again reloads it from disk, as before.
+
+        :param cluster_name: The cluster to open.
+        :return: True if the cluster was restored, False if it still has to be loaded.
+        """
+        if self.cluster_name and self.integrated_data_ori is not None:
+            if cluster_name == self.cluster_name:
+                self.cluster_session.discard(cluster_name)
+            else:
+                self.cluster_session.put(self.cluster_name, {name: getattr(self, name) for name in SESSION_ATTRIBUTES})
+        state = self.cluster_session.get(cluster_name)
         self.init_param()
-        self.cluster_name = self.cluster_combobox.currentText()
-        self.process_cpt_locations()
+        self.cluster_name = cluster_name
+        if state is None:
+            return False
+        for name, value in state.items():
+            setattr(self, name, value)
+        self.show_locations_plot(self.current_plot_index_loc)
+        self.show_main_plot(self.current_plot_index)
+        self.show_export_plot(keep_limits=self.current_xlim_export is not None)
+        self.memory_panel.check()
+        return True
+
+    def select_cluster(self):
+        if self.switch_cluster(self.cluster_combobox.currentText()):
+            return
         self.process_cpt_data()
-        # print(self.file_name_list[0], self.nztmX_list, self.nztmY_list)
 
 
-    def select_cluster_processed(self):
-        self.init_param()
-        self.cluster_name = self.mat_file_clusters_combobox.currentText()
-        mat_file_path = os.path.join(self.project_path, self.cluster_name, "clean_data_from_python.mat")
-        self.load_and_store_data(mat_file_path)
-        cluster_path =  os.path.join(self.project_path, self.cluster_name, 'Extracted')
-        cluster_file_path = os.path.join(self.project_path, self.cluster_name, f"{self.cluster_name}.csv")
-        cluster_data = pd.read_csv(cluster_file_path)
-        self.find_max_min_values(cluster_path) 
-        self.nztm_data_dict = self.create_nztm_data_dict(cluster_data)
-        self.closest_file_ids_dict = {}
-        self.data_ori = [(file, pd.read_csv(os.path.join(cluster_path, f"{file}.csv"))) for file in self.file_name_list]
-        file_ids, nztmX_values, nztmY_values = self.file_name_list.copy(), self.nztmX_list.copy(), self.nztmY_list.copy()
-        p1, p2, _ = ranking_pairwise_distances(nztmX_values, nztmY_values)
-        index_sort = get_unique_set(np.vstack((p1, p2)).T)
-        self.file_name_list = [file_ids[i] for i in index_sort]
-        self.nztmX_list = [nztmX_values[i] for i in index_sort]
-        self.nztmY_list = [nztmY_values[i] for i in index_sort]
-        file_ids, nztmX_values, nztmY_values = self.file_name_list, self.nztmX_list, self.nztmY_list
-        # Iterate through each file ID
-        for file_id in file_ids:
-            # Find 5 closest file IDs
-            closest_file_ids = find_closest_file_ids(file_id, file_ids, nztmX_values, nztmY_values, num_closest=5)
-            # Store the result in the dictionary
-            self.closest_file_ids_dict[file_id] = closest_file_ids
-        
+    def process_cpt_data(self):
+        # The CSVs are read and interpolated by a background task
+        self.tasks.submit(('load cluster', self.project_path, self.cluster_name), load_cluster,
+                          self.project_path, self.cluster_name,
+                          on_result=self.on_cpt_data_processed,
+                          on_error=lambda error: QMessageBox.warning(self, "Loading Failed", error),
+                          progress_title="Loading Cluster",
+                          progress_message=f"Reading the CPT files of {self.cluster_name} ...")
+
+
+    @traced('show loaded cluster', 'render')
+    def on_cpt_data_processed(self, manager):
+        if manager.cluster_name != self.cluster_name:
+            return  # Another cluster was opened meanwhile
+        for name in ('nztm_data_dict', 'file_name_list', 'nztmX_list', 'nztmY_list', 'data_ori',
+                     'integrated_data_ori', 'integrated_data_plot', 'integrated_data_export',
+                     'keep_data_boolean_df', 'keep_file_boolean_df', 'min_depth', 'max_depth', 'max_qt'):
+            setattr(self, name, getattr(manager, name))
+        self.closest_file_ids_dict = manager.closest_file_ids_dict
         self.set_color_for_files()
         self.show_locations_plot(0)
         self.show_main_plot(0)
         self.show_export_plot()
+        self.memory_panel.check()
+
+
+    def select_cluster_processed(self):
+        if self.switch_cluster(self.mat_file_clusters_combobox.currentText()):
+            return
+        self.tasks.submit(('load export', self.project_path, self.cluster_name), load_processed_cluster,
+                          self.project_path, self.cluster_name,
+                          on_result=self.load_and_store_data,
+                          on_error=lambda error: QMessageBox.warning(self, "Loading Failed", error),
+                          progress_title="Loading Cluster",
+                          progress_message=f"Reading the export of {self.cluster_name} ...")
     
 
-    def load_and_store_data(self, filepath):
-        # Call read_mat_file to load data from the file
-        results = self.read_mat_file(filepath)
+    @traced('show processed cluster', 'render')
+    def load_and_store_data(self, results):
+        if results['cluster_name'] != self.cluster_name:
+            return  # Another cluster was opened meanwhile
 
         # Store each piece of data into its corresponding instance variable
         self.integrated_data_ori = results['integrated_data_ori']
@@ -222,68 +398,21 @@ class CPTDataEditor(QMainWindow):
         self.integrated_data_export = results['integrated_data_export']
         self.keep_data_boolean_df = results['keep_data_boolean_df']
         self.keep_file_boolean_df = results['keep_file_boolean_df']
+        self.nztm_data_dict = results['nztm_data_dict']
         self.file_name_list = results['file_name_list']
-        # self.file_ids = results['file_ids']
-        self.nztmX_list = results['nztmX_values']
-        self.nztmY_list = results['nztmY_values']
-
-
-    def read_mat_file(self, filepath):
-
-        def matlab_struct_to_df(struct):
-            header_names = struct.dtype.names
-            df = pd.DataFrame(struct.tolist()).T
-            df.columns = header_names
-            return df
-        # Load the MATLAB file
-        data = loadmat(filepath, squeeze_me=True)
-
-        integrated_data_ori = matlab_struct_to_df(data['integrated_data_ori'])
-        integrated_data_plot = matlab_struct_to_df(data['integrated_data_plot'])
-        integrated_data_export = matlab_struct_to_df(data['integrated_data_export'])
-        keep_data_boolean_df = matlab_struct_to_df(data['keep_data_boolean_df'])
-        keep_data_boolean_df = keep_data_boolean_df.astype(bool)
-
-        keep_file_boolean_tuple = data['keep_file_boolean_df'][()]
-
-        # Now, keep_file_boolean_tuple is the tuple, so you can proceed as planned
-        keep_file_boolean_df = pd.Series(keep_file_boolean_tuple[0].astype(bool), index=keep_file_boolean_tuple[1],
-                                        name='1')
-        nztm_data = data['nztm_data'][()]
-        file_ids = nztm_data[0].tolist()
-        nztmX_values = nztm_data[1].tolist()
-        nztmY_values = nztm_data[2].tolist()
-
-        file_name_list = data['fileNameList']
-
-        # Return the data in a dictionary
-        return {
-            'integrated_data_ori': integrated_data_ori,
-            'integrated_data_plot': integrated_data_plot,
-            'integrated_data_export': integrated_data_export,
-            'keep_data_boolean_df': keep_data_boolean_df,
-            'keep_file_boolean_df': keep_file_boolean_df,
-            'file_name_list': file_ids,
-            # 'file_ids': file_ids,
-            'nztmX_values': nztmX_values,
-            'nztmY_values': nztmY_values
-        }
-    
+        self.nztmX_list, self.nztmY_list = self.extract_nztm_for_file_ids(self.file_name_list)
+        self.closest_file_ids_dict = results['closest_file_ids_dict']
+        self.limits = results['limits']
+        self.min_depth, self.max_depth, self.max_qt = (self.limits[name] for name in LIMIT_NAMES)
+        self.edit_rules = results['edit_rules']
 
-    def process_cpt_locations(self):
-        cluster_file_path = os.path.join(self.project_path, self.cluster_name, f"{self.cluster_name}.csv")
-        if not os.path.exists(cluster_file_path):
-            QMessageBox.warning(self, "File Not Found", f"Cluster file not found: {cluster_file_path}")
-            return
-        
-        cluster_data = pd.read_csv(cluster_file_path)
-        self.nztm_data_dict = self.create_nztm_data_dict(cluster_data)
-        self.update_file_lists()
         self.set_color_for_files()
-        self.closest_file_ids_dict = self.create_closest_file_ids_dict()
-
-    
+        self.show_locations_plot(0)
+        self.show_main_plot(0)
+        self.show_export_plot()
+        self.memory_panel.check()
     
+
     def enable_rectangle_selector(self, action):
         if self.rect_selector is not None:
             self.rect_selector.set_active(False)  # Disable any existing selector
@@ -319,6 +448,7 @@ class CPTDataEditor(QMainWindow):
         self.process_selected_region(x1, y1, x2, y2, action='recover')
 
 
+    @traced('edit region', 'compute')
     def process_selected_region(self, x1, y1, x2, y2, action):
         # Convert the plot coordinates to data indices
         depth_range = [min(y1, y2), max(y1, y2)]
@@ -337,78 +467,15 @@ class CPTDataEditor(QMainWindow):
             # Recover data by copying from the original dataset
             self.integrated_data_plot.loc[within_region, self.file_name_list[self.current_plot_index]] = \
                 self.integrated_data_ori.loc[within_region, self.file_name_list[self.current_plot_index]]
+        self.edit_rules.append({'action': action, 'file': self.file_name_list[self.current_plot_index],
+                                'depth': depth_range, 'qt': qt_range})
         self.current_xlim_main = self.main_plot_canvas.get_x_lim()
         self.current_ylim_main = self.main_plot_canvas.get_y_lim()
         # Redraw the plot to reflect the changes
         self.show_main_plot(self.current_plot_index)
 
 
-    def create_nztm_data_dict(self, cluster_data):
-        nztm_data_dict = {}
-        for _, row in cluster_data.iterrows():
-            # file_id = f"{row['ID']}.csv"  # Append ".csv" to each file_id
-            file_id = row['ID']
-            # Store nztmX and nztmY as a nested dictionary
-            nztm_data_dict[file_id] = {'nztmX': row['nztmX'], 'nztmY': row['nztmY']}
-
-        return nztm_data_dict
-    
-    
-    def update_file_lists(self):
-        file_ids, nztmX_values, nztmY_values = self.extract_nztm_data()
-        p1, p2, _ = ranking_pairwise_distances(nztmX_values, nztmY_values)
-        index_sort = get_unique_set(np.vstack((p1, p2)).T)
-        self.file_name_list = [file_ids[i] for i in index_sort]
-        self.file_name_list = [file.replace('.csv', '') for file in self.file_name_list]
-        self.nztmX_list, self.nztmY_list = self.extract_nztm_for_file_ids(self.file_name_list)
-
-
-    def create_closest_file_ids_dict(self):
-        # Initialize dictionary to store closest file IDs for each file ID
-        closest_file_ids_dict = {}
-        
-        file_ids, nztmX_values, nztmY_values = self.extract_nztm_data()
-
-        # Iterate through each file ID
-        for file_id in file_ids:
-            # Find 5 closest file IDs
-            closest_file_ids = find_closest_file_ids(file_id, file_ids, nztmX_values, nztmY_values, num_closest=5)
-            # Store the result in the dictionary
-            closest_file_ids_dict[file_id] = closest_file_ids
-        return closest_file_ids_dict
-
-
-    def process_cpt_data(self):
-        cluster_path = os.path.join(self.project_path, self.cluster_name, 'Extracted')
-        if os.path.exists(cluster_path):
-            self.data_ori = [(file, pd.read_csv(os.path.join(cluster_path, f"{file}.csv"))) for file in self.file_name_list]
-            self.find_max_min_values(cluster_path) 
-            # Updating data_ori and data_copy with interpolated data
-            integrated_data_ori = []
-            # Creating a uniform depth array
-            depth_array = np.arange(self.min_depth, self.max_depth, 0.02)
-            integrated_data_ori = pd.DataFrame({'Depth (m)': depth_array})
-            # Interpolating and adding qt data as new columns
-            for file, data in self.data_ori:
-                interpolated_qt = self.interpolate_data(data, depth_array)
-                integrated_data_ori[file] = interpolated_qt  # Using filename as the column name
-            self.integrated_data_ori = integrated_data_ori  # Storing the integrated data
-            self.integrated_data_plot = integrated_data_ori.copy()
-            self.integrated_data_export = integrated_data_ori.copy()
-            self.integrated_data_export.iloc[:, 1:] = np.nan # Initialize the export data
-            self.keep_data_boolean_df = self.integrated_data_ori.iloc[:, 1:].copy()  # Copy all columns except the first (depth)
-            self.keep_data_boolean_df[:] = True  # Set all values to True 
-            self.keep_file_boolean_df = self.integrated_data_ori.iloc[1, 1:].copy()
-            self.keep_file_boolean_df[:] = False 
-
-            self.show_locations_plot(0)
-            self.show_main_plot(0)
-            self.show_export_plot()
-
-            # Extracting nztmX and nztmY values
-            file_ids, nztmX_values, nztmY_values = self.extract_nztm_data()
-
-
+    @traced('plot locations', 'render')
     def show_locations_plot(self, index):
         if 0 <= index < len(self.file_name_list):
             self.current_plot_index_loc = index
@@ -447,8 +514,9 @@ class CPTDataEditor(QMainWindow):
         self.loc_plot_canvas.draw()  # Ensure the canvas is updated with all changes
 
 
+    @traced('plot sounding', 'render')
     def show_main_plot(self, index, keep_limits=False):
-        if 0 <= index < len(self.data_ori):
+        if 0 <= index < len(self.file_name_list):
             
             self.current_plot_index = index
             file = self.file_name_list[index]
@@ -499,6 +567,7 @@ class CPTDataEditor(QMainWindow):
             self.main_plot_canvas.draw()  # Redraw the canvas with all changes
 
     
+    @traced('plot export', 'render')
     def show_export_plot(self, keep_limits=False):
         self.export_plot_canvas.clear_plot()
         for col in self.integrated_data_ori.columns[1:]:
@@ -526,54 +595,29 @@ class CPTDataEditor(QMainWindow):
 
     def exportToMATLAB(self):
         directory = os.path.join(self.project_path, self.cluster_name)
-        # Convert DataFrames to dictionaries with 2D array for each column
-        def df_to_dict(df):
-            return {col: df[col].values[:, None] for col in df.columns}
-        # For the 1D DataFrame, convert both index and values
-        def series_to_dict(series):
-            return {
-                'values': series.values[:, None],
-                'index': np.array(series.index, dtype=object)[:, None]
-            }
-        # Convert nztm_data_dict to MATLAB format
-        file_ids = []
-        nztmX_values = []
-        nztmY_values = []
-
-        for file_id, coords in self.nztm_data_dict.items():
-            file_ids.append(file_id)
-            nztmX_values.append(coords['nztmX'])
-            nztmY_values.append(coords['nztmY'])
-
-        try:
-            mat_data = {
-                'integrated_data_ori': df_to_dict(self.integrated_data_ori),
-                'integrated_data_plot': df_to_dict(self.integrated_data_plot),
-                'integrated_data_export': df_to_dict(self.integrated_data_export),
-                'keep_data_boolean_df': df_to_dict(self.keep_data_boolean_df),
-                # Handle 1D DataFrame (boolean) by converting to 2D numpy array
-                'keep_file_boolean_df': series_to_dict(self.keep_file_boolean_df),
-                # # Convert lists to numpy arrays
-                # 'X': np.array(self.nztmX_list),
-                # 'Y': np.array(self.nztmY_list),
-                'nztm_data': {
-                        'file_id': np.array(file_ids, dtype=object),
-                        'nztmX': np.array(nztmX_values),
-                        'nztmY': np.array(nztmY_values)
-                    },
-                'fileNameList': np.array(self.file_name_list, dtype=object)  # dtype=object for string array
-            }
-
-            # Save as .mat file
-            filepath = os.path.join(directory, 'clean_data_from_python.mat')
-            savemat(filepath, mat_data)
-            # Save the object instance
-            object_filepath = os.path.join(directory, 'object_instance.pkl')
-            # Pop-up message upon successful export
-            QMessageBox.information(self, "Export Complete", "Data successfully exported to MATLAB .mat file.")
-        except Exception as e:
-            # Pop-up message in case of an error
-            QMessageBox.critical(self, "Export Failed", f"An error occurred during export: {e}")
+        layout, do_compression, hdf5 = EXPORT_FORMATS[self.export_format_combobox.currentText()]
+        tables = {
+            'integrated_data_ori': self.integrated_data_ori,
+            'integrated_data_plot': self.integrated_data_plot,
+            'integrated_data_export': self.integrated_data_export,
+            'keep_data_boolean_df': self.keep_data_boolean_df,
+            'keep_file_boolean_df': self.keep_file_boolean_df,
+            'nztm_data_dict': self.nztm_data_dict,
+            'file_name_list': self.file_name_list,
+            'closest_file_ids_dict': self.closest_file_ids_dict,
+            'limits': {'min_depth': self.min_depth, 'max_depth': self.max_depth, 'max_qt': self.max_qt}
+        }
+        # The file is written by a background task; the modal progress dialog keeps the data unchanged meanwhile
+        self.tasks.submit(('export', directory), write_export, directory, tables, layout, do_compression, hdf5,
+                          list(self.edit_rules),
+                          # Pop-up message upon successful export
+                          on_result=lambda _: QMessageBox.information(
+                              self, "Export Complete", "Data successfully exported to MATLAB .mat file."),
+                          # Pop-up message in case of an error
+                          on_error=lambda error: QMessageBox.critical(
+                              self, "Export Failed", f"An error occurred during export: {error}"),
+                          progress_title="Exporting", progress_message=f"Writing the export of {self.cluster_name} ...",
+                          cancelable=False)
 
 
     def show_previous_plot(self):
@@ -587,7 +631,7 @@ class CPTDataEditor(QMainWindow):
     def show_next_plot(self):
         self.current_xlim_main = self.main_plot_canvas.get_x_lim()
         self.current_ylim_main = self.main_plot_canvas.get_y_lim()
-        if self.current_plot_index < len(self.data_ori) - 1:
+        if self.current_plot_index < len(self.file_name_list) - 1:
             self.show_main_plot(self.current_plot_index + 1)
             self.show_locations_plot(self.current_plot_index_loc + 1)
 
@@ -603,6 +647,7 @@ class CPTDataEditor(QMainWindow):
         within_region = (self.integrated_data_ori['Depth (m)'] >= start_depth) & (self.integrated_data_ori['Depth (m)'] <= end_depth)
         # Set values to NaN outside the specified depth range
         self.integrated_data_export[file] = np.where(within_region, self.integrated_data_plot[file], np.nan)
+        self.edit_rules.append({'action': 'keep', 'file': file, 'depth': [start_depth, end_depth]})
         self.current_xlim_export = self.export_plot_canvas.get_x_lim()
         self.current_ylim_export = self.export_plot_canvas.get_y_lim()
         self.show_export_plot(keep_limits=True)
@@ -611,27 +656,12 @@ class CPTDataEditor(QMainWindow):
     def on_delete_file(self):
         file = self.file_name_list[self.current_plot_index]
         self.keep_file_boolean_df[file] = False
+        self.edit_rules.append({'action': 'delete', 'file': file})
         self.current_xlim_export = self.export_plot_canvas.get_x_lim()
         self.current_ylim_export = self.export_plot_canvas.get_y_lim()
         self.show_export_plot(keep_limits=True)
 
 
-    def interpolate_data(self, data, depth_array):
-        interpolated_qt = np.interp(depth_array, data['Depth (m)'], data['qt (MPa)'], left=np.nan, right=np.nan)
-        return interpolated_qt
-    
-
-    def extract_nztm_data(self):
-        # Assuming self.nztm_data_dict is a dictionary with the structure {file_id: {'nztmX': value, 'nztmY': value}, ...}
-
-        # Extracting file IDs, nztmX, and nztmY while maintaining the original order
-        file_ids = sorted(self.nztm_data_dict.keys(), key=lambda x: list(self.nztm_data_dict).index(x))
-        nztmX_values = [self.nztm_data_dict[file_id]['nztmX'] for file_id in file_ids]
-        nztmY_values = [self.nztm_data_dict[file_id]['nztmY'] for file_id in file_ids]
-
-        return file_ids, nztmX_values, nztmY_values
-
-
     def extract_nztm_for_file_ids(self, file_ids):
         nztmX_values = []
         nztmY_values = []
@@ -655,18 +685,6 @@ class CPTDataEditor(QMainWindow):
         return self.closest_file_ids_dict[file_ids]
     
 
-    def find_max_min_values(self, cluster_path):
-        self.max_qt = 0
-        self.max_depth = 0
-        self.min_depth = float('inf')
-        for file in os.listdir(cluster_path):
-            if file.endswith('.csv'):
-                data = pd.read_csv(os.path.join(cluster_path, file))
-                self.max_qt = max(self.max_qt, data['qt (MPa)'].max())
-                self.max_depth = max(self.max_depth, data['Depth (m)'].max())
-                self.min_depth = min(self.min_depth, data['Depth (m)'].min())
-
-
 if __name__ == "__main__":
     import sys
     app = QApplication(sys.argv)
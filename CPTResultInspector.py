@@ -1,37 +1,72 @@
 from PyQt5.QtWidgets import (QMainWindow, QApplication, QWidget, QGridLayout,
                              QVBoxLayout, QFileDialog, QShortcut, QProgressBar,
-                             QHBoxLayout, QLineEdit, QPushButton, QCheckBox)
-from PyQt5.QtCore import Qt
+                             QHBoxLayout, QLineEdit, QPushButton, QCheckBox, QStackedWidget)
+from PyQt5.QtCore import Qt, QTimer
 from plotcanvas import PlotCanvas
 from controlpanel import ControlPanel
 from fontsizeadjuster import FontSizeAdjuster
-from scipy.io import loadmat
-import numpy as np
+from resultcache import ResultCache
+from resultloader import summarize_result_files, scan_result_files, load_result_file
+from tasks import TaskRunner
+from projectscanner import iter_result_files
+from projectwatcher import ProjectWatcher
+from resultsummary import SummarySidecar, GEOMETRY_METRICS
+from resultstore import ResultStore, suggestion_column, SUGGESTION_COLUMNS
+from fastkde import hpd_contour_paths, log_histogram2d
+from posteriorstats import PARAM_NAMES
+from identifiability import range_ratios, classify, suggested_values
+from tracing import traced, span
+from tracingpanel import add_tracing_actions
+from memoryaccounting import MemoryAccountant, figure_nbytes, MEMORY_LOG_ENV_VAR, DEFAULT_MEMORY_LOG
+from memorypanel import MemoryPanel
+from multiprocessing import freeze_support
 import pandas as pd
 import sys, os
 import math
 
+# Keys of the background tasks that load a project; only one of each runs at a time
+SCAN_TASK = 'scan project'
+SUMMARIZE_TASK = 'summarize result files'
+SUGGESTION_STYLE = "color: gray; font-style: italic;"  # Auto-classification suggestions not yet confirmed
+
+
 class CPTResultInspector(QMainWindow):
-    def __init__(self):
+    # (x, y) parameters of the four log-log result subplots
+    result_subplot_params = [('nuv', 'sofv'), ('nuh', 'sofh'), ('sig', 'sigt'), ('sofvt', 'sofht')]
+
+    def __init__(self, cache_budget_mb=512, prefetch_radius=1):
         super().__init__()
         
+        self.cache_budget_mb = cache_budget_mb  # Memory budget of the sample cache
+        self.prefetch_radius = prefetch_radius  # Number of next/previous files to prefetch and render ahead
         self.main_widget = QWidget(self)
         self.setCentralWidget(self.main_widget)
+        self.tasks = TaskRunner(parent=self)  # Runs scans, parsing and exports off the GUI thread
 
         self.initParam()
         self.setup_layout()
         self.setup_shortcuts()
+        self.setup_memory_accounting()
+        self.setup_menu()
         self.showMaximized()
 
         self.font_size_adjuster = FontSizeAdjuster(self)
         self.full_precision_values = {}  # Add this line to store full precision values
 
     def initParam(self):
-        self.data_cache = {}  # Initialize the cache
+        self.data_cache = ResultCache(self.load_mat_file, max_bytes=self.cache_budget_mb * 1024 ** 2)  # LRU cache of processed samples
         self.mat_files = []  # To store paths of .mat files
         self.current_file_index = 0  # To keep track of the current .mat file being plotted
         self.checkbox_states = {}  # To store checkbox states
         self.folder_path = ""  # Directory of .mat files
+        self.summaries = {}  # Posterior summary of each .mat file, keyed by path
+        self.sidecar = None  # Persistent store of the summaries
+        self.pending_paths = []  # Files found by the project scan that are missing from the sidecar
+        self.watcher = None  # Reports result files MATLAB adds while the project is open
+        self.found_mat_files = []  # All .mat files found in the project, loaded or not
+        self.result_store = None  # Results table, persisted in results_summary.db
+        self.show_contours = True  # Mirrors contour_checkbox for the prefetch thread
+        self.show_density = False  # Mirrors density_checkbox for the prefetch thread
     
         
     def setup_layout(self):
@@ -57,6 +92,27 @@ class CPTResultInspector(QMainWindow):
         self.populate_right_panel()
 
 
+    def setup_memory_accounting(self):
+        # Caches and rendered pages, sized on demand by the Memory Usage panel
+        self.memory_accountant = MemoryAccountant(log_path=os.environ.get(MEMORY_LOG_ENV_VAR, DEFAULT_MEMORY_LOG))
+        self.memory_accountant.register('data_cache entries', lambda: self.data_cache.current_bytes)
+        self.memory_accountant.register('summaries', lambda: self.summaries)
+        self.memory_accountant.register('results table', lambda: self.result_store.df if self.result_store else None)
+        self.memory_accountant.register('rendered artists', lambda: sum(
+            figure_nbytes(canvas.fig) for canvas in self.result_pages))
+        self.memory_panel = MemoryPanel(self.memory_accountant, parent=self)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.memory_panel)
+        self.memory_panel.hide()
+
+
+    def setup_menu(self):
+        self.help_menu = self.menuBar().addMenu("Help")
+        add_tracing_actions(self.help_menu, self)
+        memory_action = self.memory_panel.toggleViewAction()
+        memory_action.setText("Memory usage")
+        self.help_menu.addAction(memory_action)
+
+
     def setup_shortcuts(self):
         # Connect key press events to methods
         self.shortcut_previous = QShortcut(Qt.Key_Minus, self)
@@ -84,9 +140,31 @@ class CPTResultInspector(QMainWindow):
             ('button', 'Previous', self.prev_mat_file),
             ('button', 'Next', self.next_mat_file),
         ])
-
-        self.plot_canvas_result = PlotCanvas(parent=self, use_subplots=True, nrows=2, ncols=2)
-        self.control_panel_1.addPlotCanvas(self.plot_canvas_result.get_layout())
+        self.contour_checkbox = QCheckBox("Show 95% contours")
+        self.contour_checkbox.setChecked(True)
+        self.contour_checkbox.stateChanged.connect(lambda _: self.on_plot_options_changed())
+        self.control_panel_1.addWidget(self.contour_checkbox)
+        self.density_checkbox = QCheckBox("Density view")
+        self.density_checkbox.setToolTip("Draw the samples as a 2D histogram instead of one marker per sample")
+        self.density_checkbox.stateChanged.connect(lambda _: self.on_plot_options_changed())
+        self.control_panel_1.addWidget(self.density_checkbox)
+
+        # One page per file in the render-ahead window: the current file plus the
+        # next/previous prefetch_radius files, so navigation only switches pages
+        self.result_stack = QStackedWidget()
+        self.result_pages = []
+        for _ in range(1 + 2 * self.prefetch_radius):
+            canvas = PlotCanvas(parent=self, use_subplots=True, nrows=2, ncols=2)
+            page = QWidget()
+            page.setLayout(canvas.get_layout())
+            self.result_stack.addWidget(page)
+            self.result_pages.append(canvas)
+        self.page_files = [None] * len(self.result_pages)  # .mat path rendered on each page
+        self.plot_canvas_result = self.result_pages[0]
+        self.control_panel_1.addWidget(self.result_stack)
+        self.render_ahead_timer = QTimer(self)
+        self.render_ahead_timer.setSingleShot(True)
+        self.render_ahead_timer.timeout.connect(self.render_ahead)
         
         self.checkbox_params = ['sofv', 'nuv', 'sofh', 'nuh', 'sig', 'sigt', 'sofvt', 'sofht']
         self.checkbox_widgets = {}
@@ -130,8 +208,13 @@ class CPTResultInspector(QMainWindow):
             ('combo', 'Select File', ["Please Choose Project Path first"])
         ])
         self.left_control_panel.addFlexibleRow([
-            ('button', 'Export to csv', self.export_to_csv)
+            ('button', 'Export to csv', self.export_to_csv),
+            ('button', 'Auto-classify', self.auto_classify)
         ])
+        self.watch_checkbox = QCheckBox("Watch for new results")
+        self.watch_checkbox.setToolTip("Add result files to the list as soon as MATLAB writes them")
+        self.watch_checkbox.stateChanged.connect(lambda _: self.update_watcher())
+        self.left_control_panel.addWidget(self.watch_checkbox)
         self.mat_file_dropdown = temp.get('combo_Select File')
         self.mat_file_dropdown.setGeometry(50, 50, 400, 30)  # Set position and size
         self.mat_file_dropdown.currentIndexChanged.connect(self.on_mat_file_selected)  # Connect to the handler
@@ -151,33 +234,34 @@ class CPTResultInspector(QMainWindow):
     def choose_project_path(self):
         folder_path = QFileDialog.getExistingDirectory(self, "Select Project Folder")
         # self.folder_path = r"D:\MATLAB_DRIVE\MATLAB_PROJ\Xu\CPT数据库 (1)"
-        if self.folder_path:
+        if folder_path:
+            self.folder_path = folder_path
+            self.data_cache.clear()
+            self.page_files = [None] * len(self.result_pages)
             self.initPD()
+            self.update_watcher()
             self.load_mat_files(self.folder_path)
-            self.update_mat_file_dropdown()  # Update the dropdown list
-            self.plot_current_mat_file(initial=True)
 
 
     def initPD(self):
-        input_csv_file_path = os.path.join(self.folder_path, 'results_summary.csv')
-        if os.path.exists(input_csv_file_path):
-            self.df = pd.read_csv(input_csv_file_path)
-        else:
-            self.df = pd.DataFrame(columns=["Site Name", "Cluster", "File Name", "sofv", "nuv", "sofh", "nuh", "sig", "sigt", "sofvt", "sofht", "no_of_soundings", "length", "min_dist_1", "min_dist_2", "min_dist_3", "max_dist"])    
-        
+        # Open the project's SQLite store (imported from results_summary.csv on first use)
+        if self.result_store is not None:
+            self.result_store.close()
+        self.result_store = ResultStore.open(self.folder_path)
+
 
     def update_mat_file_dropdown(self):
         # Clear existing items
         self.mat_file_dropdown.clear()
         # Populate the dropdown with .mat file names
         for mat_path in self.mat_files:
-            # Split the path into directory and base file
-            directory, base_file = os.path.split(mat_path)
-            # Get the directory 2 levels up
-            up_two_levels = os.path.abspath(os.path.join(directory, '..'))
-            # Get the folder name from the 2 levels up directory
-            folder_name = os.path.basename(up_two_levels)
-            self.mat_file_dropdown.addItem(f"{folder_name}-{os.path.basename(mat_path)}", mat_path)
+            self.add_mat_file_dropdown_item(mat_path)
+
+
+    def add_mat_file_dropdown_item(self, mat_path):
+        # Get the folder name from the 2 levels up directory
+        folder_name, base_file = self.split_mat_path(mat_path)
+        self.mat_file_dropdown.addItem(f"{folder_name}-{base_file}", mat_path)
 
 
     # def update_checkbox_state(self, checkbox_name, state):
@@ -215,232 +299,366 @@ class CPTResultInspector(QMainWindow):
 
 
     def list_mat_files(self, project_folder):
-        mat_files = []
-        # Walk through the directory tree starting from the project_folder
-        for root, dirs, files in os.walk(project_folder):
-            # Check if the current folder's name is 'results TMCMC'
-            if 'results_TMCMC' in root:
-                for file in files:
-                    # Check if the file ends with '.mat'
-                    if file.endswith('.mat'):
-                        # Construct the file's path and add it to the list
-                        mat_files.append(os.path.join(root, file))
-        return mat_files
+        # All <Cluster>/results_TMCMC/*.mat files of the project
+        return list(iter_result_files(project_folder))
 
 
     def load_mat_files(self, folder_path):
+        # The project is scanned by a background task. Files found in the summary
+        # sidecar are listed as they are found; the rest are parsed on a process pool
+        # once the scan is complete and added to the dropdown as they arrive.
+        # Tasks of a previously opened project are discarded with their pending signals
+        self.tasks.discard(SCAN_TASK)
+        self.tasks.discard(SUMMARIZE_TASK)
         self.mat_files.clear()
-        # Walk through the directory
-        i = 0
-        for root, dirs, files in os.walk(folder_path):
-            # Check if 'results_TMCMC' is in the path and the folder starts with "Cluster"
-            if 'results_TMCMC' in root and any(dir_name.startswith("Cluster ") for dir_name in root.split(os.sep)):
-                for file in files:
-                    if file.endswith(".mat"):
-                        mat_path = os.path.join(root, file)
-                        self.mat_files.append(mat_path)
-                        print(f'Caching {mat_path} ...')
-                        self.cache_mat_file(mat_path)
-
-                        processed_data = self.data_cache.get(mat_path)  # This now returns processed_data with additional metrics
-                        directory, base_file = os.path.split(mat_path)
-                        up_two_levels = os.path.abspath(os.path.join(directory, '..'))
-                        cluster_name = os.path.basename(up_two_levels)
-                        # Append a new row to the DataFrame
-                        if self.df[(self.df["Cluster"] == cluster_name) & (self.df["File Name"] == base_file)].empty:
-                            new_row = pd.DataFrame({
-                                "Site Name": "",  # Assuming Site Name is not determined here
-                                "Cluster": cluster_name,
-                                "File Name": base_file,
-                                "sofv": "",
-                                "nuv": "",
-                                "sofh": "",
-                                "nuh": "",
-                                "sig": "",
-                                "sigt": "",
-                                "sofvt": "",
-                                "sofht": "",
-                                "no_of_soundings": processed_data["no_of_soundings"],
-                                "length": processed_data["length"],
-                                "min_dist_1": processed_data["min_dist_1"],
-                                "min_dist_2": processed_data["min_dist_2"],
-                                "min_dist_3": processed_data["min_dist_3"],
-                                "max_dist": processed_data["max_dist"]
-                            }, index=[0])
-                            # print(new_row)
-                            # Correct usage of append method
-                            self.df = pd.concat([self.df, new_row], ignore_index=True)
+        self.mat_file_dropdown.clear()
         self.current_file_index = 0
-        # print(self.df)
+        self.summaries = {}
+        self.sidecar = SummarySidecar(folder_path)
+        self.found_mat_files = []
+        self.pending_paths = []
+        self.tasks.submit(SCAN_TASK, scan_result_files, folder_path,
+                          on_partial=self.on_files_found, on_finished=self.on_scan_finished)
+
+
+    def on_files_found(self, paths):
+        cached_items = []
+        for mat_path in paths:
+            self.found_mat_files.append(mat_path)
+            summary = self.sidecar.get(mat_path)
+            if summary is None:
+                self.pending_paths.append(mat_path)
+            else:
+                cached_items.append((mat_path, summary))
+        self.add_mat_files(cached_items)
+
+
+    def on_scan_finished(self):
+        if not self.pending_paths:
+            self.finish_loading()
+            return
+        self.start_loader(show_progress=True)
+
+
+    def start_loader(self, show_progress=True):
+        # Parse the pending files on a process pool
+        pending_paths, self.pending_paths = self.pending_paths, []
+        progress_title = "Loading Result Files" if show_progress else None
+        self.tasks.submit(SUMMARIZE_TASK, summarize_result_files, pending_paths,
+                          on_partial=self.on_results_ready, on_finished=self.finish_loading,
+                          progress_title=progress_title, modal=False,
+                          progress_message=f"Parsing {len(pending_paths)} new or changed result files ...")
+
+
+    def update_watcher(self):
+        # (Re)start the project watcher if it is enabled and a project is open
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher.deleteLater()
+            self.watcher = None
+        if self.watch_checkbox.isChecked() and self.folder_path:
+            self.watcher = ProjectWatcher(self.folder_path, parent=self)
+            self.watcher.result_files_changed.connect(self.on_watched_files_changed)
+            self.watcher.start()
+
+
+    def on_watched_files_changed(self, paths):
+        # Only the new or changed files are (re)loaded; everything else is kept
+        changed_paths = []
+        for mat_path in paths:
+            if mat_path in self.summaries and self.sidecar.get(mat_path) is not None:
+                continue  # Already loaded in this state, e.g. found by the initial scan
+            self.data_cache.discard(mat_path)
+            if mat_path in self.page_files:
+                self.page_files[self.page_files.index(mat_path)] = None
+            if mat_path not in self.found_mat_files:
+                self.found_mat_files.append(mat_path)
+            changed_paths.append(mat_path)
+        if not changed_paths:
+            return
+        self.statusBar().showMessage(f"Loading {len(changed_paths)} new or changed result files ...", 5000)
+        self.pending_paths.extend(changed_paths)
+        if not self.tasks.is_running(SCAN_TASK) and not self.tasks.is_running(SUMMARIZE_TASK):
+            self.start_loader(show_progress=False)
+
+
+    def on_results_ready(self, batch):
+        items, failures = batch
+        for mat_path, error in failures:
+            print(f"Failed to load {mat_path}: {error}")
+        for mat_path, summary in items:
+            self.sidecar.put(mat_path, summary)
+        self.add_mat_files(items)
+
+
+    def finish_loading(self):
+        self.sidecar.prune(self.found_mat_files)
+        self.sidecar.save()
+        self.memory_panel.check()
+        if self.pending_paths:
+            self.start_loader(show_progress=False)  # Files reported by the watcher meanwhile
+
+
+    @traced('add result files', 'compute')
+    def add_mat_files(self, items):
+        # Append (mat_path, summary) pairs to the file list, dropdown and results table
+        if not items:
+            return
+        was_empty = not self.mat_files
+        current_changed = False
+        self.mat_file_dropdown.blockSignals(True)
+        for mat_path, summary in items:
+            cluster_name, base_file = self.split_mat_path(mat_path)
+            metrics = {metric: summary[metric] for metric in GEOMETRY_METRICS}
+            if mat_path in self.summaries:
+                # A result file that changed on disk: update its summary and metrics in place,
+                # and drop the suggestions made from its previous samples
+                self.summaries[mat_path] = summary
+                for metric, value in metrics.items():
+                    self.result_store.set(cluster_name, base_file, metric, value)
+                self.result_store.clear_suggestions(cluster_name, base_file)
+                self.result_store.commit_row(cluster_name, base_file, columns=GEOMETRY_METRICS + SUGGESTION_COLUMNS)
+                current_changed |= mat_path == self.mat_files[self.current_file_index]
+                continue
+            self.mat_files.append(mat_path)
+            self.summaries[mat_path] = summary
+            self.add_mat_file_dropdown_item(mat_path)
+            if not self.result_store.add_row(cluster_name, base_file, **{"Site Name": ""}, **metrics):
+                # Fill missing metrics of rows read from an older results_summary.csv
+                self.result_store.fill_missing(cluster_name, base_file, metrics)
+        self.mat_file_dropdown.blockSignals(False)
+        self.result_store.flush()
+        if was_empty:
+            self.mat_file_dropdown.setCurrentIndex(0)
+            self.plot_current_mat_file()
+        elif current_changed:
+            self.plot_current_mat_file()
+
+
+    def split_mat_path(self, mat_path):
+        # Result files live in <Cluster>/results_TMCMC/<file>.mat
+        directory, base_file = os.path.split(mat_path)
+        up_two_levels = os.path.abspath(os.path.join(directory, '..'))
+        cluster_name = os.path.basename(up_two_levels)
+        return cluster_name, base_file
 
 
     def cache_mat_file(self, mat_path):
-        # Check if data is in cache
-        if mat_path in self.data_cache:
-            return self.data_cache[mat_path]
-
-        # Load and process data if not in cache
-        data = loadmat(mat_path)
-        x, x_low_GP, x_up_GP = data['x'], data['x_low'], data['x_up']
-        X, Y, z, temp_z, temp_h = data['X'], data['Y'], data['z'], data['temp_z'], data['temp_h']
-        processed_data = self.extract_data(x, x_low_GP, x_up_GP)  # Assume this is a method you define to process your data
-
-        # Add additional data processing here as needed, for example:
-        processed_data['X'] = X
-        processed_data['Y'] = Y
-        processed_data['z'] = Y
-        processed_data['temp_z'] = temp_z
-        processed_data['temp_h'] = temp_h
-
-        # Calculate additional metrics
-        no_of_soundings = len(X)
-        length = max(z) - min(z)
-        min_dists = sorted(np.diag(temp_h, -1))[:3]  # Take the first 3 minimum distances
-        max_dist = np.max(np.diag(temp_h, -1))
-
-        # Store in processed_data
-        processed_data.update({
-            "no_of_soundings": no_of_soundings,
-            "length": length,
-            "min_dist_1": min_dists[0] if len(min_dists) > 0 else np.nan,
-            "min_dist_2": min_dists[1] if len(min_dists) > 1 else np.nan,
-            "min_dist_3": min_dists[2] if len(min_dists) > 2 else np.nan,
-            "max_dist": max_dist
-        })
-
-        # Store in cache
-        self.data_cache[mat_path] = processed_data
-
-
-    def extract_data(self, x, x_low_GP, x_up_GP):
-        # Calculating various parameters from x
-        x_low_GP = x_low_GP.flatten()
-        x_up_GP = x_up_GP.flatten()
-    
-        sig = np.sqrt(1/np.exp(x[:, 0]))
-        sofv = np.exp(x[:, 1])
-        sofh = np.exp(x[:, 2])
-        nuv = np.exp(x[:, 3])
-        nuh = np.exp(x[:, 4])
-        sig_t = np.sqrt(1/np.exp(x[:, 5]))
-        sofv_t = np.exp(x[:, 6])
-        sofh_t = np.exp(x[:, 7])
-        
-        # Adjusting limits
-        xlim_low = np.exp(x_low_GP)
-        xlim_low[0], xlim_low[5] = np.sqrt(1/xlim_low[0]), np.sqrt(1/xlim_low[5])
-        xlim_up = np.exp(x_up_GP)
-        xlim_up[0], xlim_up[5] = np.sqrt(1/xlim_up[0]), np.sqrt(1/xlim_up[5])
-        
-        # Package results into a dictionary
-        data_dict = {
-            'sig': sig,
-            'sofv': sofv,
-            'sofh': sofh,
-            'nuv': nuv,
-            'nuh': nuh,
-            'sigt': sig_t,
-            'sofvt': sofv_t,
-            'sofht': sofh_t,
-            'xlim_low': xlim_low,
-            'xlim_up': xlim_up
-        }
-
-        return data_dict
-    
-    
-    def plot_current_mat_file(self, initial=False, show_95_line=False):
+        # Return processed data from the LRU cache, loading it on a miss
+        return self.data_cache.get(mat_path)
+
+
+    @traced('load and prepare result file', 'io')
+    def load_mat_file(self, mat_path):
+        # Loader of the sample cache; runs on its prefetch thread, so the contours and
+        # histograms of the next/previous files are also computed off the GUI thread when shown
+        processed_data = load_result_file(mat_path)
+        if self.show_contours:
+            self.get_contour_paths(mat_path, processed_data)
+        if self.show_density:
+            self.get_density_histograms(mat_path, processed_data)
+        return processed_data
+
+
+    def neighbour_paths(self):
+        # The next/previous files within prefetch_radius, nearest first
+        paths = []
+        for offset in range(1, self.prefetch_radius + 1):
+            for index in (self.current_file_index + offset, self.current_file_index - offset):
+                if 0 <= index < len(self.mat_files):
+                    paths.append(self.mat_files[index])
+        return paths
+
+
+    def prefetch_neighbours(self):
+        # Load the next/previous files in the background so navigation is instant
+        self.data_cache.prefetch(self.neighbour_paths())
+
+
+    @traced('show result file', 'render')
+    def plot_current_mat_file(self, show_95_line=False):
         if not self.mat_files:
             return
 
-        self.plot_canvas_result.clear_plot()  # Clear existing plots
-
         mat_path = self.mat_files[self.current_file_index]
-        # processed_data = self.cache_mat_file(mat_path)
-        processed_data = self.data_cache.get(mat_path)
-        # Accessing each parameter directly from the dictionary
-        sig = processed_data.get('sig')
-        sofv = processed_data.get('sofv')
-        sofh = processed_data.get('sofh')
-        nuv = processed_data.get('nuv')
-        nuh = processed_data.get('nuh')
-        sig_t = processed_data.get('sigt')
-        sofv_t = processed_data.get('sofvt')
-        sofh_t = processed_data.get('sofht')
+        page_index = self.page_files.index(mat_path) if mat_path in self.page_files else None
+        if page_index is None or show_95_line:
+            page_index = self.free_page_index()
+            self.render_result_page(page_index, mat_path, show_95_line=show_95_line)
+        self.plot_canvas_result = self.result_pages[page_index]
+        self.result_stack.setCurrentIndex(page_index)
+        self.prefetch_neighbours()
+
+        cluster_name, base_file = self.split_mat_path(mat_path)
+        self.set_checkboxes(cluster_name, base_file)
+        self.render_ahead_timer.start(0)
+
+
+    def free_page_index(self):
+        # A page that holds neither the current file nor one of its neighbours; with
+        # 1 + 2 * prefetch_radius pages there always is one
+        wanted = set(self.neighbour_paths())
+        wanted.add(self.mat_files[self.current_file_index])
+        for page_index, mat_path in enumerate(self.page_files):
+            if mat_path is None:
+                return page_index
+        for page_index, mat_path in enumerate(self.page_files):
+            if mat_path not in wanted:
+                return page_index
+        return self.result_stack.currentIndex()
+
+
+    def render_ahead(self):
+        # Render one neighbour per event loop turn onto a hidden page, once its
+        # samples and contours have arrived from the prefetch thread
+        for mat_path in self.neighbour_paths():
+            if mat_path in self.page_files:
+                continue
+            if mat_path not in self.data_cache:
+                if self.data_cache.is_loading(mat_path):
+                    self.render_ahead_timer.start(50)
+                    return
+                continue  # Evicted or failed to load; it is rendered on demand
+            self.render_result_page(self.free_page_index(), mat_path)
+            self.render_ahead_timer.start(0)
+            return
+
+
+    def on_plot_options_changed(self):
+        # The prefetch thread reads these flags rather than the widgets
+        self.show_contours = self.contour_checkbox.isChecked()
+        self.show_density = self.density_checkbox.isChecked()
+        self.replot_all_pages()
+
+
+    def replot_all_pages(self):
+        # Plot options changed: discard the pages rendered ahead and redraw
+        self.page_files = [None] * len(self.result_pages)
+        self.plot_current_mat_file()
+
+
+    @traced('render result page', 'render')
+    def render_result_page(self, page_index, mat_path, show_95_line=False):
+        canvas = self.result_pages[page_index]
+        canvas.clear_plot()  # Clear existing plots
+        self.page_files[page_index] = None
+
+        processed_data = self.cache_mat_file(mat_path)
         xlim_low = processed_data.get('xlim_low')
         xlim_up = processed_data.get('xlim_up')
+        stats = processed_data['stats']  # Means and 2.5/97.5 percentiles, computed once at load time
+        mean = stats['mean']
 
-        # Plot the data
+        # Plot the data; the page is drawn once at the end rather than after every line
         # self.plot_canvas_multiple.plot_extracted_data(sig, sofv, sofh, nuv, nuh, sig_t, sofv_t, sofh_t, xlim_low, xlim_up)
-        plot_param = {'marker':'s', 'markersize':4, 'color':'lightgrey', 'linestyle':'', 'alpha':0.5}
-        plot_param_mean = {'marker':'o', 'markersize':4, 'color':'red', 'linestyle':''}
+        plot_param = {'marker':'s', 'markersize':4, 'color':'lightgrey', 'linestyle':'', 'alpha':0.5, 'redraw':False}
+        plot_param_mean = {'marker':'o', 'markersize':4, 'color':'red', 'linestyle':'', 'redraw':False}
         line_param = {'color':'lightblue', 'linestyle':'--'}
-        self.plot_canvas_result.loglog(nuv, sofv, subplot_index=0, **plot_param)
-        self.plot_canvas_result.loglog(np.mean(nuv), np.mean(sofv), subplot_index=0, **plot_param_mean)
-        self.plot_canvas_result.set_plot_attributes(subplot_index=0, xlim=(xlim_low[3], xlim_up[3]), ylim=(xlim_low[1], xlim_up[1]))
-        self.plot_canvas_result.set_aspect_ratio(aspect='auto', subplot_index=0)
-        self.plot_canvas_result.loglog(nuh, sofh, subplot_index=1, **plot_param)
-        self.plot_canvas_result.loglog(np.mean(nuh), np.mean(sofh), subplot_index=1, **plot_param_mean)
-        self.plot_canvas_result.set_plot_attributes(subplot_index=1, xlim=(xlim_low[4], xlim_up[4]), ylim=(xlim_low[2], xlim_up[2]))
-        self.plot_canvas_result.loglog(sig, sig_t, subplot_index=2, **plot_param)
-        self.plot_canvas_result.loglog(np.mean(sig), np.mean(sig_t), subplot_index=2, **plot_param_mean)
-        self.plot_canvas_result.set_plot_attributes(subplot_index=2, xlim=(xlim_up[0], xlim_low[0]), ylim=(xlim_up[5], xlim_low[5]))
-        self.plot_canvas_result.loglog(sofv_t, sofh_t, subplot_index=3, **plot_param)
-        self.plot_canvas_result.loglog(np.mean(sofv_t), np.mean(sofh_t), subplot_index=3, **plot_param_mean)
-        self.plot_canvas_result.set_plot_attributes(subplot_index=3, xlim=(xlim_low[6], xlim_up[6]), ylim=(xlim_low[7], xlim_up[7]))
+        contour_param = {'colors':'blue', 'linewidths':1.5}
+        density_param = {'cmap':'Greys'}
+        # Sample clouds, either one marker per sample or binned counts whose cost does not depend on the sample count
+        if self.density_checkbox.isChecked():
+            for subplot_index, histogram in enumerate(self.get_density_histograms(mat_path, processed_data)):
+                if histogram is not None:
+                    canvas.add_density(*histogram, subplot_index=subplot_index, **density_param)
+        else:
+            for subplot_index, (x_param, y_param) in enumerate(self.result_subplot_params):
+                canvas.loglog(processed_data[x_param], processed_data[y_param], subplot_index=subplot_index, **plot_param)
+        canvas.loglog(mean['nuv'], mean['sofv'], subplot_index=0, **plot_param_mean)
+        canvas.set_plot_attributes(subplot_index=0, xlim=(xlim_low[3], xlim_up[3]), ylim=(xlim_low[1], xlim_up[1]))
+        canvas.set_aspect_ratio(aspect='auto', subplot_index=0)
+        canvas.loglog(mean['nuh'], mean['sofh'], subplot_index=1, **plot_param_mean)
+        canvas.set_plot_attributes(subplot_index=1, xlim=(xlim_low[4], xlim_up[4]), ylim=(xlim_low[2], xlim_up[2]))
+        canvas.loglog(mean['sig'], mean['sigt'], subplot_index=2, **plot_param_mean)
+        canvas.set_plot_attributes(subplot_index=2, xlim=(xlim_up[0], xlim_low[0]), ylim=(xlim_up[5], xlim_low[5]))
+        canvas.loglog(mean['sofvt'], mean['sofht'], subplot_index=3, **plot_param_mean)
+        canvas.set_plot_attributes(subplot_index=3, xlim=(xlim_low[6], xlim_up[6]), ylim=(xlim_low[7], xlim_up[7]))
 
         if show_95_line:
-            self.plot_canvas_result.add_hline(np.percentile(sofv, 2.5), subplot_index=0, **line_param)
-            self.plot_canvas_result.add_hline(np.percentile(sofv, 97.5), subplot_index=0, **line_param)
-            self.plot_canvas_result.add_vline(np.percentile(nuv, 2.5), subplot_index=0, **line_param)
-            self.plot_canvas_result.add_vline(np.percentile(nuv, 97.5), subplot_index=0, **line_param)
-            self.plot_canvas_result.add_hline(np.percentile(sofh, 2.5), subplot_index=1, **line_param)
-            self.plot_canvas_result.add_hline(np.percentile(sofh, 97.5), subplot_index=1, **line_param)
-            self.plot_canvas_result.add_vline(np.percentile(nuh, 2.5), subplot_index=1, **line_param)
-            self.plot_canvas_result.add_vline(np.percentile(nuh, 97.5), subplot_index=1, **line_param)
-            self.plot_canvas_result.add_hline(np.percentile(sig_t, 2.5), subplot_index=2, **line_param)
-            self.plot_canvas_result.add_hline(np.percentile(sig_t, 97.5), subplot_index=2, **line_param)
-            self.plot_canvas_result.add_vline(np.percentile(sig, 2.5), subplot_index=2, **line_param)
-            self.plot_canvas_result.add_vline(np.percentile(sig, 97.5), subplot_index=2, **line_param)
-            self.plot_canvas_result.add_hline(np.percentile(sofh_t, 2.5), subplot_index=3, **line_param)
-            self.plot_canvas_result.add_hline(np.percentile(sofh_t, 97.5), subplot_index=3, **line_param)
-            self.plot_canvas_result.add_vline(np.percentile(sofv_t, 2.5), subplot_index=3, **line_param)
-            self.plot_canvas_result.add_vline(np.percentile(sofv_t, 97.5), subplot_index=3, **line_param)
-        if initial:
-            self.plot_canvas_result.store_initial_limits()
+            for subplot_index, (x_param, y_param) in enumerate(self.result_subplot_params):
+                for key in ('p2.5', 'p97.5'):
+                    canvas.add_hline(stats[key][y_param], subplot_index=subplot_index, **line_param)
+                    canvas.add_vline(stats[key][x_param], subplot_index=subplot_index, **line_param)
+        if self.contour_checkbox.isChecked():
+            for subplot_index, paths in enumerate(self.get_contour_paths(mat_path, processed_data)):
+                canvas.add_paths(paths, subplot_index=subplot_index, **contour_param)
         # self.plot_canvas_result.set_axis_to_log(axis='both')
         # Set the title
         cluster_name = os.path.basename(os.path.dirname(os.path.dirname(mat_path)))
         mat_file_name = os.path.basename(mat_path)
         title = f"{cluster_name}, {mat_file_name.replace('_', '-')}"
-        self.plot_canvas_result.set_suptitle(title)
+        canvas.set_suptitle(title)
 
-        directory, base_file = os.path.split(mat_path)
-        up_two_levels = os.path.abspath(os.path.join(directory, '..'))
-        cluster_name = os.path.basename(up_two_levels)
-        self.set_checkboxes(cluster_name, base_file)
+        # Render now, so a page rendered ahead is only blitted when it is shown
+        canvas.draw()
+        canvas.store_initial_limits()
+        self.page_files[page_index] = mat_path
 
     
+    def get_contour_paths(self, mat_path, processed_data):
+        # 95% HPD contours of the four subplots, computed once per file with the binned FFT KDE.
+        # They are kept in the cached samples, so they are evicted with them and count
+        # towards the cache budget
+        if 'contour_paths' not in processed_data:
+            with span('HPD contours', 'compute'):
+                processed_data['contour_paths'] = [
+                    hpd_contour_paths(processed_data[x_param], processed_data[y_param], mass=0.95)
+                    for x_param, y_param in self.result_subplot_params
+                ]
+            self.data_cache.resize(mat_path)  # No-op while the loader is still producing processed_data
+        return processed_data['contour_paths']
+
+
+    def get_density_histograms(self, mat_path, processed_data):
+        # Log-space 2D histograms of the four subplots over the prior bounds, computed once per
+        # file and kept in the cached samples like the contours
+        if 'density_histograms' not in processed_data:
+            xlim_low, xlim_up = processed_data['xlim_low'], processed_data['xlim_up']
+            histograms = []
+            with span('density histograms', 'compute'):
+                for x_param, y_param in self.result_subplot_params:
+                    x_index, y_index = PARAM_NAMES.index(x_param), PARAM_NAMES.index(y_param)
+                    histograms.append(log_histogram2d(
+                        processed_data[x_param], processed_data[y_param],
+                        x_range=(xlim_low[x_index], xlim_up[x_index]), y_range=(xlim_low[y_index], xlim_up[y_index])))
+            processed_data['density_histograms'] = histograms
+            self.data_cache.resize(mat_path)
+        return processed_data['density_histograms']
+
+
+    @traced('show identifiability', 'compute')
     def set_checkboxes(self, cluster_name, base_file):
-        row = self.df[(self.df["Cluster"] == cluster_name) & (self.df["File Name"] == base_file)]
-        if not row.empty:
+        self.result_store.refresh_row(cluster_name, base_file)  # Pick up other reviewers' submissions
+        row = self.result_store.get_row(cluster_name, base_file)
+        if row is not None:
             for param in self.checkbox_params:
-                value = row.iloc[0][param]
+                value = row[param]
                 checkbox = self.checkbox_widgets[param]
                 text_input = self.input_fields[param] 
 
+                # Without a reviewer decision, an auto-classification suggestion is shown
+                # greyed out; submitting it confirms it
+                suggested = pd.isna(value) and not pd.isna(row[suggestion_column(param)])
+                if suggested:
+                    value = row[suggestion_column(param)]
+                label = f"{param} (suggested)" if suggested else param
+
                 if pd.isna(value):
                     checkbox.setChecked(False)
                     checkbox.setText(f"{param} to check")
                     text_input.setText("")  # Clear the text box
                 elif isinstance(value, str) and not value.replace('.', '', 1).isdigit():
                     checkbox.setChecked(False)
-                    checkbox.setText(f"{param} Unidentifiable")
+                    checkbox.setText(f"{label} Unidentifiable")
                     text_input.setText(value)  # Set text to non-float string
                 else:
                     checkbox.setChecked(True)
-                    checkbox.setText(f"{param} Identifiable")
+                    checkbox.setText(f"{label} Identifiable")
                     text_input.setText(str(value))  # Convert float or int to string
+                # Styled after setChecked, whose stateChanged handler clears the style
+                style = SUGGESTION_STYLE if suggested else ""
+                checkbox.setStyleSheet(style)
+                text_input.setStyleSheet(style)
                         
 
     def update_checkbox_and_textbox(self, param, isChecked, checkbox, text_input):
@@ -450,14 +668,17 @@ class CPTResultInspector(QMainWindow):
             return
 
         mat_path = self.mat_files[self.current_file_index]
-        data = self.data_cache.get(mat_path, {})
-        param_data = data.get(param)
+        summary = self.summaries.get(mat_path)
+
+        # The reviewer decides now, so the value no longer shows as a suggestion
+        checkbox.setStyleSheet("")
+        text_input.setStyleSheet("")
 
         # Determine the current state based on the checkbox's isChecked status
         if isChecked:
             # State transition to Identifiable
-            if param_data is not None and len(param_data) > 0:
-                mean_value = np.nanmean(param_data)
+            if summary is not None:
+                mean_value = summary['mean'][param]
                 # Store the full precision value
                 self.full_precision_values[param] = mean_value
                 # Display the value with two decimal places
@@ -470,9 +691,9 @@ class CPTResultInspector(QMainWindow):
             # State transition to Unidentifiable or "to check"
             # This can be refined based on your logic for what constitutes unidentifiable vs "to check"
             checkbox.setText(f"{param}: Unidentifiable")
-            if param_data is not None and len(param_data) > 0:
-                low_percentile = np.nanpercentile(param_data, 2.5)
-                high_percentile = np.nanpercentile(param_data, 97.5)
+            if summary is not None:
+                low_percentile = summary['p2.5'][param]
+                high_percentile = summary['p97.5'][param]
                 text_input.setText(f"{low_percentile:.2f} < {param} < {high_percentile:.2f}")
             else:
                 text_input.setText("N/A")
@@ -484,15 +705,11 @@ class CPTResultInspector(QMainWindow):
             print("No mat file selected.")
             return
         mat_path = self.mat_files[self.current_file_index]
-        directory, base_file = os.path.split(mat_path)
-        up_two_levels = os.path.abspath(os.path.join(directory, '..'))
-        cluster_name = os.path.basename(up_two_levels)
+        cluster_name, base_file = self.split_mat_path(mat_path)
 
-        row_indices = self.df[(self.df["Cluster"] == cluster_name) & (self.df["File Name"] == base_file)].index.tolist()
-        if not row_indices:
+        if (cluster_name, base_file) not in self.result_store:
             print("Row not found for the current mat file.")
             return
-        row_index = row_indices[0]
 
         for param in self.checkbox_params:
             text_input = self.input_fields[param]
@@ -500,38 +717,76 @@ class CPTResultInspector(QMainWindow):
 
             # Determine the current checkbox state to decide how to process the value
             checkbox = self.checkbox_widgets[param]
-            if checkbox.text().endswith("Identifiable"):
+            if checkbox.text().endswith("to check") or not text_value.strip():
+                # Not decided yet; stored empty so it shows as "to check" again
+                self.result_store.set(cluster_name, base_file, param, math.nan)
+            elif checkbox.text().endswith("Identifiable"):
                 # For identifiable, try to save a numeric value, preserving precision
                 try:
                     # Convert text to float to store numeric values with full precision
                     numeric_value = float(text_value)
-                    self.df.at[row_index, param] = numeric_value
+                    self.result_store.set(cluster_name, base_file, param, numeric_value)
                 except ValueError:
                     # If conversion fails, it means the input wasn't purely numeric; save as text
-                    self.df.at[row_index, param] = text_value
+                    self.result_store.set(cluster_name, base_file, param, text_value)
             else:
                 # For unidentifiable, save the text as is
-                self.df.at[row_index, param] = text_value
+                self.result_store.set(cluster_name, base_file, param, text_value)
 
-        print("DataFrame updated successfully.")
-        self.export_to_csv()
+        # Only the submitted row is written, in its own transaction
+        self.result_store.commit_row(cluster_name, base_file)
+        print("Results updated successfully.")
+        self.set_checkboxes(cluster_name, base_file)  # Submitted suggestions now show as decisions
 
     
+    def auto_classify(self):
+        # Suggest clear-cut Identifiable/Unidentifiable decisions for all loaded files. The
+        # suggestions are stored apart from the decisions and shown until a reviewer submits;
+        # borderline parameters and parameters already decided get none
+        if self.result_store is None or not self.mat_files:
+            return
+        summaries = [self.summaries[mat_path] for mat_path in self.mat_files]
+        labels = classify(range_ratios(summaries))
+        for mat_path, summary, file_labels in zip(self.mat_files, summaries, labels):
+            cluster_name, base_file = self.split_mat_path(mat_path)
+            self.result_store.suggest(cluster_name, base_file, suggested_values(summary, file_labels))
+        self.result_store.flush()  # Writes all suggestions in one transaction
+        print(f"Auto-classified {len(self.mat_files)} result files.")
+        self.set_checkboxes(*self.split_mat_path(self.mat_files[self.current_file_index]))
+
+
     def export_to_csv(self):
+        if self.result_store is None:
+            return
         output_csv_file_path = os.path.join(self.folder_path, 'results_summary.csv')
-        self.df.to_csv(output_csv_file_path, index=False)
+        # Pending rows are written on this thread; the export reads them back on a worker.
+        # Without a database the table is copied here, as the GUI keeps changing it
+        self.result_store.flush()
+        store = self.result_store
+        df = store.df.copy() if store.db_path is None else None
+        self.tasks.submit(('export csv', output_csv_file_path), lambda task: store.write_csv(output_csv_file_path, df=df),
+                          on_result=lambda _: self.statusBar().showMessage(f"Exported {output_csv_file_path}", 5000),
+                          on_error=lambda error: print(f"Failed to export {output_csv_file_path}: {error}"))
+
+
+    def closeEvent(self, event):
+        # Stop scans and parsing; let running exports finish writing
+        self.tasks.discard(SCAN_TASK)
+        self.tasks.discard(SUMMARIZE_TASK)
+        self.tasks.wait()
+        super().closeEvent(event)
 
 
     def prev_mat_file(self):
         if self.current_file_index > 0:
             self.current_file_index -= 1
-            self.plot_current_mat_file(initial=True)
+            self.plot_current_mat_file()
 
 
     def next_mat_file(self):
         if self.current_file_index < len(self.mat_files) - 1:
             self.current_file_index += 1
-            self.plot_current_mat_file(initial=True)
+            self.plot_current_mat_file()
 
 
         # Helper method to check if a string can be converted to float
@@ -544,6 +799,7 @@ class CPTResultInspector(QMainWindow):
 
 
 if __name__ == '__main__':
+    freeze_support()  # Needed by the process pool in the packaged executable
     app = QApplication(sys.argv)
     window = CPTResultInspector()
     window.show()
@@ -0,0 +1,271 @@
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from datamanager import DataManager
+from cleanexport import read_clean_export, LEGACY_LAYOUT, COMPACT_LAYOUT, h5py
+from projectscanner import iter_result_files, CLEAN_EXPORT_FILE_NAME
+from resultloader import load_result_file, summarize_result_file
+from extract_data import extract_results
+from syntheticproject import generate_project, SYNTHETIC_RESULTS_CSV
+
+DEFAULT_SIZES = ('2x10x10', '4x40x20', '8x80x30')  # clusters x soundings x depth (m)
+DEFAULT_OUTPUT = 'benchmark_results.json'
+# (name, layout, do_compression, hdf5) of the export variants that are timed
+EXPORT_VARIANTS = [
+    ('legacy', LEGACY_LAYOUT, False, False),
+    ('compact', COMPACT_LAYOUT, False, False),
+    ('compact_compressed', COMPACT_LAYOUT, True, False),
+    ('compact_v73', COMPACT_LAYOUT, True, True),
+]
+
+
+def parse_size(text):
+    """
+    Parses a project size written as <clusters>x<soundings>x<depth>, e.g. 4x40x20.
+
+    :return: A tuple (num_clusters, num_soundings, depth_length).
+    """
+    try:
+        clusters, soundings, depth = text.lower().split('x')
+        return int(clusters), int(soundings), float(depth)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{text}' is not a size like 4x40x20 (clusters x soundings x depth)")
+
+
+def time_stage(function, repeat=3):
+    """
+    Runs function repeat times and times each run.
+
+    :return: A tuple (timing, result) of a dictionary with the best, mean and all run
+             times in seconds, and the return value of the last run.
+    """
+    runs = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        runs.append(time.perf_counter() - start)
+    return {'best': min(runs), 'mean': sum(runs) / len(runs), 'runs': runs}, result
+
+
+def _load_cluster(project_path, cluster_name):
+    # The reading half of DataManager.select_cluster; the interpolation is timed on its own
+    manager = DataManager(project_path)
+    manager.cluster_name = cluster_name
+    manager.process_cpt_locations()
+    manager.read_cpt_data()
+    return manager
+
+
+def run_stage(stages, name, function, repeat=3, requires=()):
+    """
+    Times one stage with time_stage and records it in stages. A stage that raises is
+    recorded with its error instead, so the timings of the other stages are kept.
+
+    :param stages: The dictionary of stage timings to add to.
+    :param requires: Names of earlier stages whose results this stage uses; it is
+                     skipped if one of them failed. Default is ().
+    :return: The return value of the last run, or None if the stage failed or was skipped.
+    """
+    failed = [required for required in requires if 'error' in stages.get(required, {'error': None})]
+    if failed:
+        stages[name] = {'error': f"skipped, {', '.join(failed)} failed"}
+        return None
+    try:
+        stages[name], result = time_stage(function, repeat)
+    except Exception as e:
+        stages[name] = {'error': f"{type(e).__name__}: {e}"}
+        print(f"Stage {name} failed: {type(e).__name__}: {e}")
+        return None
+    return result
+
+
+def _summarize_all(mat_paths):
+    # summarize_result_file returns its errors rather than raising them
+    results = [summarize_result_file(path) for path in mat_paths]
+    errors = [f"{os.path.basename(path)}: {error}" for path, _, error in results if error is not None]
+    if errors:
+        raise RuntimeError(f"{len(errors)} files failed, e.g. {errors[0]}")
+    return results
+
+
+def benchmark_project(project_path, cluster_names, repeat=3, max_workers=None):
+    """
+    Times each stage of the workflow on a generated project. Every stage runs over
+    all clusters (or all result files) of the project.
+
+    :param project_path: A project written by syntheticproject.generate_project.
+    :param cluster_names: The clusters of the project.
+    :param repeat: Number of timed runs per stage. Default is 3.
+    :param max_workers: Worker processes of the batch summary. Default is None, which uses all CPUs.
+    :return: A dictionary mapping each stage name to its timing (see time_stage), or to
+             {'error': message} for stages that failed or were skipped.
+    """
+    stages = {}
+    managers = run_stage(stages, 'cluster_load',
+                         lambda: [_load_cluster(project_path, cluster_name) for cluster_name in cluster_names], repeat)
+    run_stage(stages, 'interpolation', lambda: [manager.integrate_cpt_data() for manager in managers], repeat,
+              requires=['cluster_load'])
+    run_stage(stages, 'neighbours', lambda: [manager.create_closest_file_ids_dict() for manager in managers], repeat,
+              requires=['cluster_load'])
+
+    for name, layout, do_compression, hdf5 in EXPORT_VARIANTS:
+        if hdf5 and h5py is None:
+            continue
+        paths = run_stage(stages, f'export_{name}',
+                          lambda: [manager.export_to_matlab(layout=layout, do_compression=do_compression, hdf5=hdf5)
+                                   for manager in managers], repeat, requires=['interpolation'])
+        run_stage(stages, f'load_export_{name}', lambda: [read_clean_export(path) for path in paths], repeat,
+                  requires=[f'export_{name}'])
+    for cluster_name in cluster_names:
+        export_path = os.path.join(project_path, cluster_name, CLEAN_EXPORT_FILE_NAME)
+        if os.path.exists(export_path):
+            os.remove(export_path)
+
+    mat_paths = list(iter_result_files(project_path))
+    run_stage(stages, 'result_loading', lambda: [load_result_file(path) for path in mat_paths], repeat)
+    run_stage(stages, 'summary_extraction', lambda: _summarize_all(mat_paths), repeat)
+
+    output_folder = tempfile.mkdtemp(prefix='cpt_benchmark_extract_')
+    try:
+        def run_extract_data():
+            with contextlib.redirect_stdout(io.StringIO()):  # extract_results reports every file
+                reused, summarized, errors = extract_results(
+                    project_path, os.path.join(project_path, SYNTHETIC_RESULTS_CSV),
+                    os.path.join(output_folder, 'results_final.csv'), max_workers=max_workers, force=True)
+            if errors:
+                raise RuntimeError(f"{len(errors)} files failed, e.g. {errors[0]}")
+            return summarized
+        run_stage(stages, 'batch_summary', run_extract_data, repeat)
+    finally:
+        shutil.rmtree(output_folder, ignore_errors=True)
+    return stages
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, repeat=3, work_folder=None, keep=False, num_result_files=4,
+                   num_samples=2000, seed=0, max_workers=None):
+    """
+    Generates a fake project of each size and times the workflow on it.
+
+    :param sizes: Project sizes as <clusters>x<soundings>x<depth> strings. Default is DEFAULT_SIZES.
+    :param repeat: Number of timed runs per stage. Default is 3.
+    :param work_folder: The folder to generate the projects in. Default is None, which uses a temporary folder.
+    :param keep: Keep the generated projects. Default is False.
+    :param num_result_files, num_samples, seed: Passed to syntheticproject.generate_project.
+    :param max_workers: Worker processes of the batch summary. Default is None, which uses all CPUs.
+    :return: The report, a JSON-serializable dictionary describing the machine and the timings of every size.
+    """
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'h5py': h5py is not None,
+        'repeat': repeat,
+        'runs': [],
+    }
+    root = work_folder or tempfile.mkdtemp(prefix='cpt_benchmark_')
+    try:
+        for size in sizes:
+            num_clusters, num_soundings, depth_length = parse_size(size)
+            project_path = os.path.join(root, size)
+            start = time.perf_counter()
+            cluster_names = generate_project(project_path, num_clusters, num_soundings, depth_length,
+                                             num_result_files=num_result_files, num_samples=num_samples, seed=seed)
+            generation = time.perf_counter() - start
+            stages = benchmark_project(project_path, cluster_names, repeat=repeat, max_workers=max_workers)
+            report['runs'].append({
+                'size': size,
+                'num_clusters': num_clusters,
+                'num_soundings': num_soundings,
+                'depth_length': depth_length,
+                'num_result_files': num_result_files,
+                'num_samples': num_samples,
+                'generation': generation,
+                'stages': stages,
+            })
+            print_run(report['runs'][-1])
+            if not keep:
+                shutil.rmtree(project_path, ignore_errors=True)
+    finally:
+        if not keep and work_folder is None:
+            shutil.rmtree(root, ignore_errors=True)
+    return report
+
+
+def print_run(run, baseline=None):
+    """
+    Prints the timings of one size, with the speedup over a baseline run of the same size if given.
+    """
+    print(f"{run['size']}: {run['num_clusters']} clusters x {run['num_soundings']} soundings x "
+          f"{run['depth_length']:g} m (generated in {run['generation']:.2f} s)")
+    for stage, timing in run['stages'].items():
+        if 'error' in timing:
+            print(f"  {stage:<32}{'failed':>15}  {timing['error']}")
+            continue
+        line = f"  {stage:<32}{timing['best'] * 1000:>12.1f} ms"
+        baseline_timing = baseline['stages'].get(stage, {}) if baseline is not None else {}
+        if 'best' in baseline_timing:
+            line += f"  {baseline_timing['best'] / timing['best']:>6.2f}x"
+        print(line)
+
+
+def compare_reports(report, baseline):
+    # Matches the runs by size; the speedup is baseline time / new time, on the best runs
+    baseline_runs = {run['size']: run for run in baseline['runs']}
+    print(f"Speedup over the baseline of {baseline.get('created', 'unknown date')}:")
+    for run in report['runs']:
+        print_run(run, baseline_runs.get(run['size']))
+
+
+def write_report(path, report):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1)
+    os.replace(temp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time cluster loading, interpolation, neighbours, export, result loading and summary "
+                    "extraction on generated projects of several sizes, and store the timings as JSON.")
+    parser.add_argument('sizes', nargs='*', type=parse_size, default=None,
+                        help=f"Project sizes as <clusters>x<soundings>x<depth m> (default: {' '.join(DEFAULT_SIZES)})")
+    parser.add_argument('-o', '--output', default=DEFAULT_OUTPUT, help=f"JSON report (default: {DEFAULT_OUTPUT})")
+    parser.add_argument('-n', '--repeat', type=int, default=3, help="Timed runs per stage; the best is reported (default: 3)")
+    parser.add_argument('-r', '--results', type=int, default=4, help="TMCMC result files per cluster (default: 4)")
+    parser.add_argument('--samples', type=int, default=2000, help="Posterior samples per result file (default: 2000)")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed of the generated projects (default: 0)")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="Worker processes of the batch summary (default: all CPUs)")
+    parser.add_argument('--work-folder', help="Folder to generate the projects in (default: a temporary folder)")
+    parser.add_argument('--keep', action='store_true', help="Keep the generated projects")
+    parser.add_argument('--baseline', help="A previous JSON report to compare against")
+    args = parser.parse_args(argv)
+
+    # argparse has already validated the sizes; keep them as written for the report
+    sizes = [f"{c}x{s}x{d:g}" for c, s, d in args.sizes] if args.sizes else DEFAULT_SIZES
+    report = run_benchmarks(sizes, repeat=args.repeat, work_folder=args.work_folder, keep=args.keep,
+                            num_result_files=args.results, num_samples=args.samples, seed=args.seed,
+                            max_workers=args.jobs)
+    write_report(args.output, report)
+    print(f"Done: timings written to {args.output}")
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            compare_reports(report, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,296 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+from scipy.io import savemat, loadmat
+from tracing import traced
+
+try:
+    import h5py
+except ImportError:  # h5py is only needed for MATLAB v7.3 exports
+    h5py = None
+
+# Layouts of clean_data_from_python.mat
+LEGACY_LAYOUT = 'legacy'  # One struct per table with one field per column, read by the original MATLAB scripts
+COMPACT_LAYOUT = 'compact'  # One depth x sounding matrix per table plus a vector of sounding names
+EXPORT_LAYOUTS = (LEGACY_LAYOUT, COMPACT_LAYOUT)
+
+DEPTH_COLUMN = 'Depth (m)'
+HDF5_CHUNK_ELEMENTS = 2 ** 17  # About 1 MB of doubles per chunk of a v7.3 matrix
+HDF5_SIGNATURE = b'\x89HDF\r\n\x1a\n'
+LIMIT_NAMES = ('min_depth', 'max_depth', 'max_qt')
+
+
+@traced('build export data', 'compute')
+def build_export_data(integrated_data_ori, integrated_data_plot, integrated_data_export,
+                      keep_data_boolean_df, keep_file_boolean_df, nztm_data_dict, file_name_list,
+                      layout=LEGACY_LAYOUT, closest_file_ids_dict=None, limits=None):
+    """
+    Arranges a cleaned cluster as the variables of clean_data_from_python.mat.
+
+    The legacy layout is the one the MATLAB analysis scripts were written for. The
+    compact layout stores the depth column as 'depth', each table as an N x F matrix
+    ('qt_ori', 'qt_plot', 'qt_export', 'keep_data') and names the F soundings in
+    'file_names'; it is much faster to write and for MATLAB to load.
+
+    Either layout can also store what the editor needs to reopen the cluster without
+    the Extracted CSVs: the neighbours of each sounding in 'closest_index' (1-based
+    indices into fileNameList, padded with 0) and the plot limits as scalars.
+
+    :param layout: LEGACY_LAYOUT or COMPACT_LAYOUT. Default is LEGACY_LAYOUT.
+    :param closest_file_ids_dict: The closest file IDs of each file ID. Default is None (not stored).
+    :param limits: A dictionary with a value for each of LIMIT_NAMES. Default is None (not stored).
+    :return: A dictionary to pass to write_mat_file.
+    """
+    if layout == LEGACY_LAYOUT:
+        build = _build_legacy_data
+    elif layout == COMPACT_LAYOUT:
+        build = _build_compact_data
+    else:
+        raise ValueError(f"Unknown export layout '{layout}', expected one of {EXPORT_LAYOUTS}")
+    mat_data = build(integrated_data_ori, integrated_data_plot, integrated_data_export,
+                     keep_data_boolean_df, keep_file_boolean_df, nztm_data_dict, file_name_list)
+    if closest_file_ids_dict is not None:
+        mat_data['closest_index'] = _closest_index(closest_file_ids_dict, file_name_list)
+    if limits is not None:
+        mat_data.update((name, float(limits[name])) for name in LIMIT_NAMES)
+    return mat_data
+
+
+def _closest_index(closest_file_ids_dict, file_name_list):
+    position = {file: index for index, file in enumerate(file_name_list)}
+    width = max((len(closest) for closest in closest_file_ids_dict.values()), default=0)
+    closest_index = np.zeros((len(file_name_list), width))
+    for file, closest in closest_file_ids_dict.items():
+        if file in position:
+            closest_index[position[file], :len(closest)] = [position[other] + 1 for other in closest]
+    return closest_index
+
+
+def _build_legacy_data(integrated_data_ori, integrated_data_plot, integrated_data_export,
+                       keep_data_boolean_df, keep_file_boolean_df, nztm_data_dict, file_name_list):
+    # Convert DataFrames to dictionaries with 2D array for each column
+    def df_to_dict(df):
+        return {col: df[col].values[:, None] for col in df.columns}
+    # For the 1D DataFrame, convert both index and values
+    def series_to_dict(series):
+        return {
+            'values': series.values[:, None],
+            'index': np.array(series.index, dtype=object)[:, None]
+        }
+
+    return {
+        'integrated_data_ori': df_to_dict(integrated_data_ori),
+        'integrated_data_plot': df_to_dict(integrated_data_plot),
+        'integrated_data_export': df_to_dict(integrated_data_export),
+        'keep_data_boolean_df': df_to_dict(keep_data_boolean_df),
+        # Handle 1D DataFrame (boolean) by converting to 2D numpy array
+        'keep_file_boolean_df': series_to_dict(keep_file_boolean_df),
+        'nztm_data': {
+            'file_id': np.array(list(nztm_data_dict.keys()), dtype=object),
+            'nztmX': np.array([coords['nztmX'] for coords in nztm_data_dict.values()]),
+            'nztmY': np.array([coords['nztmY'] for coords in nztm_data_dict.values()])
+        },
+        'fileNameList': np.array(file_name_list, dtype=object)  # dtype=object for string array
+    }
+
+
+def _build_compact_data(integrated_data_ori, integrated_data_plot, integrated_data_export,
+                        keep_data_boolean_df, keep_file_boolean_df, nztm_data_dict, file_name_list):
+    files = [column for column in integrated_data_ori.columns if column != DEPTH_COLUMN]
+    return {
+        'export_layout': COMPACT_LAYOUT,
+        'depth': integrated_data_ori[DEPTH_COLUMN].to_numpy(dtype=float)[:, None],
+        'qt_ori': integrated_data_ori[files].to_numpy(dtype=float),
+        'qt_plot': integrated_data_plot[files].to_numpy(dtype=float),
+        'qt_export': integrated_data_export[files].to_numpy(dtype=float),
+        'keep_data': keep_data_boolean_df[files].to_numpy(dtype=bool),
+        'keep_file': keep_file_boolean_df[files].to_numpy(dtype=bool)[:, None],
+        'file_names': _cellstr(files),
+        'nztm_file_id': _cellstr(nztm_data_dict.keys()),
+        'nztmX': np.array([coords['nztmX'] for coords in nztm_data_dict.values()], dtype=float)[:, None],
+        'nztmY': np.array([coords['nztmY'] for coords in nztm_data_dict.values()], dtype=float)[:, None],
+        'fileNameList': _cellstr(file_name_list)
+    }
+
+
+def _cellstr(names):
+    # An object array of str is written as a MATLAB cell array of char
+    return np.array([str(name) for name in names], dtype=object)[:, None]
+
+
+@traced('write .mat file', 'io')
+def write_mat_file(filepath, mat_data, do_compression=False, hdf5=False):
+    """
+    Writes the variables built by build_export_data. The file is written next to
+    filepath and swapped in at the end, so MATLAB or the project watcher never
+    read it half written.
+
+    :param do_compression: Compress the variables (zlib for v5, gzip for v7.3). Default is False.
+    :param hdf5: Write a MATLAB v7.3 (HDF5) file with chunked matrices; needs h5py and the
+                 compact layout. Default is False, which writes a v5 file with scipy.
+    """
+    temp_path = filepath + '.tmp'
+    if hdf5:
+        _write_hdf5_mat_file(temp_path, mat_data, do_compression)
+    else:
+        savemat(temp_path, mat_data, appendmat=False, do_compression=do_compression)
+    os.replace(temp_path, filepath)
+
+
+def _write_hdf5_mat_file(filepath, mat_data, do_compression):
+    if h5py is None:
+        raise ImportError("h5py is required to write MATLAB v7.3 files.")
+    if any(isinstance(value, dict) for value in mat_data.values()):
+        raise ValueError("MATLAB v7.3 export is only available for the compact layout.")
+
+    compression = 'gzip' if do_compression else None
+    with h5py.File(filepath, 'w', userblock_size=512) as f:
+        for name, value in mat_data.items():
+            _write_hdf5_variable(f, name, value, compression)
+    # MATLAB recognises v7.3 files by the text header in the HDF5 user block
+    header = (f"MATLAB 7.3 MAT-file, Platform: GLNXA64, "
+              f"Created on: {time.strftime('%a %b %d %H:%M:%S %Y')} HDF5 schema 1.00 .").encode('ascii')
+    with open(filepath, 'r+b') as f:
+        f.write(header.ljust(116) + b'\x00' * 8 + b'\x00\x02' + b'IM')
+
+
+def _write_hdf5_variable(parent, name, value, compression):
+    # MATLAB arrays are column-major, so every dataset holds the transpose of the array
+    if isinstance(value, str):
+        dataset = parent.create_dataset(name, data=np.array([[ord(c)] for c in value], dtype=np.uint16))
+        dataset.attrs['MATLAB_class'] = np.bytes_('char')
+        dataset.attrs['MATLAB_int_decode'] = np.int32(2)
+        return dataset
+    value = np.atleast_2d(value)
+    if value.dtype == object:
+        refs = parent.file.require_group('#refs#')
+        cell = np.empty(value.T.shape, dtype=h5py.ref_dtype)
+        for index, item in np.ndenumerate(value.T):
+            cell[index] = _write_hdf5_variable(refs, f'{name}_{len(refs)}', str(item), None).ref
+        dataset = parent.create_dataset(name, data=cell)
+        dataset.attrs['MATLAB_class'] = np.bytes_('cell')
+        return dataset
+
+    if value.dtype == bool:
+        data, matlab_class = value.T.astype(np.uint8), 'logical'
+    else:
+        data, matlab_class = value.T.astype(np.float64), 'double'
+    chunks = None
+    if compression is not None or data.size > HDF5_CHUNK_ELEMENTS:
+        # Whole soundings per chunk, so MATLAB can read single columns of the matrix
+        rows = max(1, min(data.shape[0], HDF5_CHUNK_ELEMENTS // max(1, data.shape[1])))
+        chunks = (rows, data.shape[1])
+    dataset = parent.create_dataset(name, data=data, chunks=chunks, compression=compression)
+    dataset.attrs['MATLAB_class'] = np.bytes_(matlab_class)
+    if matlab_class == 'logical':
+        dataset.attrs['MATLAB_int_decode'] = np.int32(1)
+    return dataset
+
+
+@traced('read clean export', 'io')
+def read_clean_export(filepath):
+    """
+    Loads clean_data_from_python.mat in either layout and file format.
+
+    Each table is assembled as one contiguous float (or bool) matrix and wrapped in
+    a DataFrame, instead of boxing every value into Python objects; only the name
+    vectors are converted element by element.
+
+    :param filepath: The path of clean_data_from_python.mat.
+    :return: A dictionary with the DataFrames 'integrated_data_ori', 'integrated_data_plot',
+             'integrated_data_export' and 'keep_data_boolean_df', the Series 'keep_file_boolean_df',
+             'nztm_data_dict', 'file_name_list', and 'closest_file_ids_dict' and 'limits',
+             which are None for exports written without them.
+    """
+    variables = _read_hdf5_mat_file(filepath) if _is_hdf5_file(filepath) else loadmat(filepath, simplify_cells=True)
+    if variables.get('export_layout') == COMPACT_LAYOUT:
+        files = _str_list(variables['file_names'])
+        depth = np.ravel(variables['depth']).astype(float)
+
+        def matrix(name, dtype):
+            return np.asarray(variables[name], dtype=dtype).reshape(len(depth), len(files))
+
+        def with_depth(name):
+            return pd.DataFrame(np.column_stack((depth, matrix(name, float))), columns=[DEPTH_COLUMN] + files)
+
+        tables = {
+            'integrated_data_ori': with_depth('qt_ori'),
+            'integrated_data_plot': with_depth('qt_plot'),
+            'integrated_data_export': with_depth('qt_export'),
+            'keep_data_boolean_df': pd.DataFrame(matrix('keep_data', bool), columns=files),
+            'keep_file_boolean_df': pd.Series(np.ravel(variables['keep_file']).astype(bool), index=files, name='1')
+        }
+        nztm_file_ids = _str_list(variables['nztm_file_id'])
+        nztmX, nztmY = variables['nztmX'], variables['nztmY']
+    else:
+        keep_file = variables['keep_file_boolean_df']
+        tables = {
+            'integrated_data_ori': _struct_to_df(variables['integrated_data_ori'], float),
+            'integrated_data_plot': _struct_to_df(variables['integrated_data_plot'], float),
+            'integrated_data_export': _struct_to_df(variables['integrated_data_export'], float),
+            'keep_data_boolean_df': _struct_to_df(variables['keep_data_boolean_df'], bool),
+            'keep_file_boolean_df': pd.Series(np.ravel(keep_file['values']).astype(bool),
+                                              index=_str_list(keep_file['index']), name='1')
+        }
+        nztm_data = variables['nztm_data']
+        nztm_file_ids = _str_list(nztm_data['file_id'])
+        nztmX, nztmY = nztm_data['nztmX'], nztm_data['nztmY']
+
+    file_name_list = _str_list(variables['fileNameList'])
+    tables['nztm_data_dict'] = {file_id: {'nztmX': x, 'nztmY': y}
+                                for file_id, x, y in zip(nztm_file_ids, np.ravel(nztmX).tolist(), np.ravel(nztmY).tolist())}
+    tables['file_name_list'] = file_name_list
+    tables['closest_file_ids_dict'] = None
+    if 'closest_index' in variables:
+        closest_index = np.asarray(variables['closest_index'], dtype=int).reshape(len(file_name_list), -1)
+        tables['closest_file_ids_dict'] = {file: [file_name_list[j - 1] for j in row if j > 0]
+                                           for file, row in zip(file_name_list, closest_index)}
+    tables['limits'] = None
+    if all(name in variables for name in LIMIT_NAMES):
+        tables['limits'] = {name: float(np.ravel(variables[name])[0]) for name in LIMIT_NAMES}
+    return tables
+
+
+def _struct_to_df(struct, dtype):
+    # All fields of a table have the same length, so they stack into one (N, columns) matrix
+    columns = list(struct)
+    matrix = np.column_stack([np.ravel(struct[column]) for column in columns]).astype(dtype, copy=False)
+    return pd.DataFrame(matrix, columns=columns)
+
+
+def _str_list(cell):
+    # simplify_cells turns a 1 x 1 cell into a bare string
+    if isinstance(cell, str):
+        return [cell]
+    return [str(item) for item in np.ravel(np.asarray(cell, dtype=object))]
+
+
+def _is_hdf5_file(filepath):
+    with open(filepath, 'rb') as f:
+        header = f.read(512 + len(HDF5_SIGNATURE))
+    return header[512:] == HDF5_SIGNATURE or header.startswith(HDF5_SIGNATURE)
+
+
+def _read_hdf5_mat_file(filepath):
+    # Returns the variables in the form loadmat(simplify_cells=True) does
+    if h5py is None:
+        raise ImportError(f"h5py is required to read MATLAB v7.3 file '{filepath}'.")
+    with h5py.File(filepath, 'r') as f:
+        return {name: _read_hdf5_value(f, item) for name, item in f.items() if not name.startswith('#')}
+
+
+def _read_hdf5_value(f, item):
+    if isinstance(item, h5py.Group):  # A struct
+        return {name: _read_hdf5_value(f, field) for name, field in item.items()}
+    matlab_class = item.attrs.get('MATLAB_class', b'double')
+    matlab_class = matlab_class.decode() if isinstance(matlab_class, bytes) else str(matlab_class)
+    values = item[()]
+    if matlab_class == 'char':
+        return ''.join(map(chr, np.ravel(values)))
+    if matlab_class == 'cell':
+        return [_read_hdf5_value(f, f[ref]) for ref in np.ravel(values.T)]
+    values = np.squeeze(values.T)
+    if matlab_class == 'logical':
+        values = values.astype(bool)
+    return values
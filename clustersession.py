@@ -0,0 +1,132 @@
+import os
+import pickle
+import shutil
+import tempfile
+from collections import OrderedDict
+from itertools import count
+from resultcache import estimate_nbytes
+
+
+class ClusterSession:
+    """
+    Keeps the clusters opened in the CPT Data Editor, so switching back to a cluster
+    restores it, unexported edits included, without reloading it from disk.
+
+    Clusters are held in memory in least-recently-used order within a memory
+    budget. Clusters pushed out of the budget are spilled to a pickle file in a
+    temporary cache folder and read back when they are opened again. The cache
+    folder is removed by clear().
+    """
+
+    def __init__(self, max_bytes=1024 ** 3):
+        """
+        Initializes the ClusterSession instance.
+
+        :param max_bytes: The memory budget in bytes. Default is 1 GB.
+        """
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.cache_folder = None  # Created on the first spill
+        self._entries = OrderedDict()  # cluster name -> (state, nbytes), oldest first
+        self._spilled = {}  # cluster name -> pickle path
+        self._spill_ids = count()
+
+    def __contains__(self, cluster_name):
+        return cluster_name in self._entries or cluster_name in self._spilled
+
+    def __len__(self):
+        return len(self._entries) + len(self._spilled)
+
+    def put(self, cluster_name, state):
+        """
+        Stores the state of a cluster as the most recently used one.
+
+        :param cluster_name: The cluster folder name.
+        :param state: A dictionary of the editor attributes of the cluster.
+        """
+        self.discard(cluster_name)
+        nbytes = estimate_nbytes(state)
+        self._entries[cluster_name] = (state, nbytes)
+        self.current_bytes += nbytes
+        self._evict(keep=cluster_name)
+
+    def get(self, cluster_name):
+        """
+        Takes the state of a cluster out of the session, reading it back if it was spilled.
+
+        The editor puts the state back when it switches away from the cluster, so
+        the open cluster is not counted against the budget twice.
+
+        :param cluster_name: The cluster folder name.
+        :return: The stored state, or None if the cluster is not in the session.
+        """
+        if cluster_name in self._entries:
+            state, nbytes = self._entries.pop(cluster_name)
+            self.current_bytes -= nbytes
+            return state
+        path = self._spilled.pop(cluster_name, None)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError) as e:
+            print(f"Cannot read the cached state of '{cluster_name}', reloading it instead: {e}")
+            return None
+        finally:
+            self._remove_file(path)
+
+    def discard(self, cluster_name):
+        entry = self._entries.pop(cluster_name, None)
+        if entry is not None:
+            self.current_bytes -= entry[1]
+        path = self._spilled.pop(cluster_name, None)
+        if path is not None:
+            self._remove_file(path)
+
+    def set_max_bytes(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._evict()
+
+    def clear(self):
+        """
+        Drops every cluster and removes the cache folder.
+        """
+        self._entries.clear()
+        self._spilled.clear()
+        self.current_bytes = 0
+        if self.cache_folder is not None:
+            shutil.rmtree(self.cache_folder, ignore_errors=True)
+            self.cache_folder = None
+
+    def _evict(self, keep=None):
+        # Spill the least recently used clusters until the budget is met, never
+        # spilling the cluster that was just stored.
+        while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            if oldest == keep:
+                self._entries.move_to_end(oldest)
+                continue
+            state, nbytes = self._entries.pop(oldest)
+            self.current_bytes -= nbytes
+            self._spill(oldest, state)
+
+    def _spill(self, cluster_name, state):
+        if self.cache_folder is None:
+            self.cache_folder = tempfile.mkdtemp(prefix='cpt_editor_session_')
+        path = os.path.join(self.cache_folder, f'{next(self._spill_ids)}.pkl')
+        try:
+            with open(path, 'wb') as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError as e:
+            print(f"Cannot cache '{cluster_name}', its unexported edits are dropped: {e}")
+            self._remove_file(path)
+            return
+        self._spilled[cluster_name] = path
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,109 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+
+COLUMNS_SUFFIX = '.npcols'
+SCHEMA_FILE_NAME = 'schema.json'
+SCHEMA_VERSION = 1
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan  # Empty cells and 'N/A' placeholders
+
+
+def columns_from_rows(rows, fieldnames, float_fields=(), int_fields=()):
+    """
+    Converts table rows to typed column arrays.
+
+    :param rows: A list of dictionaries, e.g. the rows written to a CSV.
+    :param fieldnames: The column order.
+    :param float_fields: Columns stored as float64; unparseable cells become NaN.
+    :param int_fields: Columns stored as int64, or as float64 if a cell is not an integer.
+    :return: A dictionary mapping column names to 1D arrays, in fieldnames order.
+             Other columns are stored as fixed-width unicode strings.
+    """
+    columns = {}
+    for field in fieldnames:
+        values = [row.get(field) for row in rows]
+        if field in float_fields or field in int_fields:
+            array = np.array([_to_float(value) for value in values], dtype=np.float64)
+            if field in int_fields and np.all(np.isfinite(array)) and np.all(array == np.round(array)):
+                array = array.astype(np.int64)
+        else:
+            array = np.array(['' if value is None else str(value) for value in values], dtype=str)
+            if array.dtype.itemsize == 0:
+                array = array.astype('U1')  # Zero-width strings cannot be saved
+        columns[field] = array
+    return columns
+
+
+def write_columns(path, columns):
+    """
+    Writes a table as a folder of one .npy file per column plus a JSON schema.
+
+    Each column keeps its binary type, so floats round-trip exactly, and can be
+    memory-mapped on its own with read_columns. The folder is written next to
+    its final location and swapped in at the end, so readers never see a half
+    written table.
+
+    :param path: The output folder, conventionally ending in COLUMNS_SUFFIX.
+    :param columns: A dictionary mapping column names to 1D arrays of equal length.
+    """
+    lengths = {len(array) for array in columns.values()}
+    if len(lengths) > 1:
+        raise ValueError(f"Columns have different lengths: {sorted(lengths)}")
+
+    temp_path = path + '.tmp'
+    if os.path.exists(temp_path):
+        shutil.rmtree(temp_path)
+    os.makedirs(temp_path)
+    schema = {'version': SCHEMA_VERSION, 'n_rows': lengths.pop() if lengths else 0, 'columns': []}
+    for index, (name, array) in enumerate(columns.items()):
+        file_name = f'{index:03d}.npy'
+        array = np.ascontiguousarray(array)
+        np.save(os.path.join(temp_path, file_name), array, allow_pickle=False)
+        schema['columns'].append({'name': name, 'file': file_name, 'dtype': array.dtype.str})
+    with open(os.path.join(temp_path, SCHEMA_FILE_NAME), 'w', encoding='utf-8') as f:
+        json.dump(schema, f, indent=1)
+
+    old_path = path + '.old'
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(temp_path, path)
+    if os.path.exists(old_path):
+        shutil.rmtree(old_path)
+
+
+def read_schema(path):
+    with open(os.path.join(path, SCHEMA_FILE_NAME), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def read_columns(path, columns=None, mmap_mode='r'):
+    """
+    Opens the columns of a table written by write_columns.
+
+    :param path: The table folder.
+    :param columns: Names of the columns to open. Default is None, which opens all of them.
+    :param mmap_mode: Passed to numpy.load. Default is 'r', which memory-maps the
+                      files so only the pages actually used are read.
+    :return: A dictionary mapping column names to arrays, in schema order.
+    """
+    schema = read_schema(path)
+    wanted = None if columns is None else set(columns)
+    return {column['name']: np.load(os.path.join(path, column['file']), mmap_mode=mmap_mode, allow_pickle=False)
+            for column in schema['columns'] if wanted is None or column['name'] in wanted}
+
+
+def read_dataframe(path, columns=None):
+    """
+    Reads a table written by write_columns into a DataFrame.
+
+    :param columns: Names of the columns to read. Default is None, which reads all of them.
+    """
+    return pd.DataFrame({name: np.asarray(array) for name, array in read_columns(path, columns).items()})
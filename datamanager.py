@@ -1,14 +1,65 @@
 import os
+import sys
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
 import pandas as pd
-from scipy.io import savemat
+from spatial_analysis_utils import ranking_pairwise_distances, get_unique_set, find_all_closest_file_ids
+from projectscanner import EXTRACTED_FOLDER_NAME, CLEAN_EXPORT_FILE_NAME
+from cleanexport import build_export_data, write_mat_file, LEGACY_LAYOUT, COMPACT_LAYOUT, EXPORT_LAYOUTS
+from tracing import traced
+
+EDIT_RULES_FILE_NAME = 'edit_rules.json'
+DEPTH_STEP = 0.02  # Depth spacing of the integrated matrix (m)
+
+
+def load_edit_rules(path):
+    """
+    Reads the edits recorded by the CPT Data Editor for a cluster.
+
+    :param path: The path of edit_rules.json.
+    :return: A list of edit dictionaries in the order they were made; empty if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_edit_rules(path, rules):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(rules, f, indent=1)
+    os.replace(temp_path, path)
+
 
 class DataManager:
-    def __init__(self):
-        self.project_path = ""
+    """
+    The non-GUI core of the CPT Data Editor: loads a cluster, builds the integrated
+    qt matrix on a uniform depth grid, applies edits and writes clean_data_from_python.mat.
+
+    Edits are the operations of the editor, replayed in order from edit_rules.json:
+    - {"action": "clear" | "recover", "file": ..., "depth": [low, high], "qt": [low, high]}
+    - {"action": "keep", "file": ..., "depth": [start, end]}
+    - {"action": "delete", "file": ...}
+    """
+
+    def __init__(self, project_path="", depth_step=DEPTH_STEP):
+        """
+        Initializes the DataManager instance.
+
+        :param project_path: The project folder holding the cluster folders. Default is "".
+        :param depth_step: Depth spacing of the integrated matrix in m. Default is DEPTH_STEP.
+        """
+        self.project_path = project_path
+        self.depth_step = depth_step
         self.cluster_name = ""
         self.file_name_list = []
         self.nztm_data_dict = {}
+        self.nztmX_list = []
+        self.nztmY_list = []
+        self.data_ori = []
         self.integrated_data_ori = None
         self.integrated_data_plot = None
         self.integrated_data_export = None
@@ -21,86 +72,276 @@ class DataManager:
         self.cluster_name = ""
         self.file_name_list = []
         self.nztm_data_dict = {}
-        # Load data according to your project's structure
-        # This method needs to be implemented based on your specific project data format
 
-    def select_cluster(self):
-        self.cluster_name = self.cluster_combobox.currentText()
+    def list_clusters(self):
+        # Cluster folders are the direct subfolders of the project, as in the editor
+        return sorted(d for d in os.listdir(self.project_path) if os.path.isdir(os.path.join(self.project_path, d)))
+
+    def select_cluster(self, cluster_name, progress=None):
+        """
+        Loads a cluster: the CPT locations and the qt profiles of its Extracted folder.
+
+        :param cluster_name: The cluster folder name.
+        :param progress: Called as progress(files read, files total) while the CSVs are read. Default is None.
+        """
+        self.cluster_name = cluster_name
         self.process_cpt_locations()
-        self.process_cpt_data()
-        # Enable the hover func of plot only after the Cluster is selected
-        self.loc_plot_canvas.activate_hover()
-        self.main_plot_canvas.activate_hover()
-        self.export_plot_canvas.activate_hover()
+        self.process_cpt_data(progress)
+
+    def cluster_folder(self):
+        return os.path.join(self.project_path, self.cluster_name)
 
+    @traced('read cluster locations', 'io')
     def process_cpt_locations(self):
-        cluster_file_path = os.path.join(self.project_path, self.cluster_name, f"{self.cluster_name}.csv")
+        cluster_file_path = os.path.join(self.cluster_folder(), f"{self.cluster_name}.csv")
         if not os.path.exists(cluster_file_path):
-            QMessageBox.warning(self, "File Not Found", f"Cluster file not found: {cluster_file_path}")
-            return
-        
+            raise FileNotFoundError(f"Cluster file not found: {cluster_file_path}")
+
         cluster_data = pd.read_csv(cluster_file_path)
-        self.nztm_data_dict = self.create_nztm_data_dict(cluster_data)
+        self.nztm_data_dict = {file_id: {'nztmX': x, 'nztmY': y}
+                               for file_id, x, y in zip(cluster_data['ID'], cluster_data['nztmX'], cluster_data['nztmY'])}
         self.update_file_lists()
-        self.set_color_for_files()
-        self.closest_file_ids_dict = self.create_closest_file_ids_dict()
-
-    def process_cpt_data(self):
-        cluster_path = os.path.join(self.project_path, self.cluster_name, 'Extracted')
-        if os.path.exists(cluster_path):
-            self.data_ori = [(file, pd.read_csv(os.path.join(cluster_path, f"{file}.csv"))) for file in self.file_name_list]
-            self.find_max_min_values(cluster_path) 
-            # Updating data_ori and data_copy with interpolated data
-            integrated_data_ori = []
-            # Creating a uniform depth array
-            depth_array = np.arange(self.min_depth, self.max_depth, 0.02)
-            integrated_data_ori = pd.DataFrame({'Depth (m)': depth_array})
-            # Interpolating and adding qt data as new columns
-            for file, data in self.data_ori:
-                interpolated_qt = self.interpolate_data(data, depth_array)
-                integrated_data_ori[file] = interpolated_qt  # Using filename as the column name
-            self.integrated_data_ori = integrated_data_ori  # Storing the integrated data
-            self.integrated_data_plot = integrated_data_ori.copy()
-            self.integrated_data_export = integrated_data_ori.copy()
-            self.integrated_data_export.iloc[:, 1:] = np.nan # Initialize the export data
-            self.keep_data_boolean_df = self.integrated_data_ori.iloc[:, 1:].copy()  # Copy all columns except the first (depth)
-            self.keep_data_boolean_df[:] = True  # Set all values to True 
-            self.keep_file_boolean_df = self.integrated_data_ori.iloc[1, 1:].copy()
-            self.keep_file_boolean_df[:] = False 
-
-            self.show_locations_plot(0)
-            self.show_main_plot(0)
-            self.show_export_plot()
-
-    def export_to_matlab(self, directory=None):
+
+    def update_file_lists(self):
+        # Order the files as the editor does: by first appearance in the ranked pairwise distances
+        file_ids = list(self.nztm_data_dict)
+        nztmX_values = [self.nztm_data_dict[file_id]['nztmX'] for file_id in file_ids]
+        nztmY_values = [self.nztm_data_dict[file_id]['nztmY'] for file_id in file_ids]
+        p1, p2, _ = ranking_pairwise_distances(nztmX_values, nztmY_values)
+        index_sort = list(get_unique_set(np.vstack((p1, p2)).T))
+        index_sort += [i for i in range(len(file_ids)) if i not in index_sort]  # A single CPT has no pairs
+        self.file_name_list = [str(file_ids[i]).replace('.csv', '') for i in index_sort]
+        self.nztmX_list = [self.nztm_data_dict[f]['nztmX'] for f in self.file_name_list if f in self.nztm_data_dict]
+        self.nztmY_list = [self.nztm_data_dict[f]['nztmY'] for f in self.file_name_list if f in self.nztm_data_dict]
+
+    @traced('neighbour search', 'compute')
+    def create_closest_file_ids_dict(self, num_closest=5):
+        # Stored in the export so the editor can reopen the cluster without recomputing them
+        file_ids = list(self.nztm_data_dict)
+        return find_all_closest_file_ids(file_ids, [self.nztm_data_dict[f]['nztmX'] for f in file_ids],
+                                         [self.nztm_data_dict[f]['nztmY'] for f in file_ids], num_closest=num_closest)
+
+    def process_cpt_data(self, progress=None):
+        self.read_cpt_data(progress)
+        self.integrate_cpt_data()
+
+    @traced('read CPT CSVs', 'io')
+    def read_cpt_data(self, progress=None):
+        # Reads the profiles of the Extracted folder and the plot limits, without interpolating them
+        cluster_path = os.path.join(self.cluster_folder(), EXTRACTED_FOLDER_NAME)
+        if not os.path.exists(cluster_path):
+            raise FileNotFoundError(f"Extracted folder not found: {cluster_path}")
+        self.data_ori = []
+        for file in self.file_name_list:
+            self.data_ori.append((file, pd.read_csv(os.path.join(cluster_path, f"{file}.csv"))))
+            if progress is not None:
+                progress(len(self.data_ori), len(self.file_name_list))
+        self.find_max_min_values(cluster_path)
+
+    @traced('interpolate profiles', 'compute')
+    def integrate_cpt_data(self):
+        # Interpolate every profile onto a uniform depth array and build the matrix in one go
+        depth_array = np.arange(self.min_depth, self.max_depth, self.depth_step)
+        columns = {'Depth (m)': depth_array}
+        for file, data in self.data_ori:
+            columns[file] = self.interpolate_data(data, depth_array)
+        integrated_data_ori = pd.DataFrame(columns)
+
+        self.integrated_data_ori = integrated_data_ori
+        self.integrated_data_plot = integrated_data_ori.copy()
+        self.integrated_data_export = integrated_data_ori.copy()
+        self.integrated_data_export.iloc[:, 1:] = np.nan  # Initialize the export data
+        self.keep_data_boolean_df = self.integrated_data_ori.iloc[:, 1:].copy()
+        self.keep_data_boolean_df[:] = True
+        self.keep_file_boolean_df = self.integrated_data_ori.iloc[1, 1:].copy()
+        self.keep_file_boolean_df[:] = False
+
+    def interpolate_data(self, data, depth_array):
+        return np.interp(depth_array, data['Depth (m)'], data['qt (MPa)'], left=np.nan, right=np.nan)
+
+    @traced('find plot limits', 'io')
+    def find_max_min_values(self, cluster_path):
+        # Limits over every CSV of the Extracted folder; profiles already loaded are not read again
+        loaded = {f"{file}.csv": data for file, data in self.data_ori}
+        self.max_qt = 0
+        self.max_depth = 0
+        self.min_depth = float('inf')
+        for file in os.listdir(cluster_path):
+            if file.endswith('.csv'):
+                data = loaded[file] if file in loaded else pd.read_csv(os.path.join(cluster_path, file))
+                self.max_qt = max(self.max_qt, data['qt (MPa)'].max())
+                self.max_depth = max(self.max_depth, data['Depth (m)'].max())
+                self.min_depth = min(self.min_depth, data['Depth (m)'].min())
+
+    @traced('apply edit rules', 'compute')
+    def apply_edit_rules(self, rules):
+        """
+        Replays edits recorded by the CPT Data Editor.
+
+        :param rules: A list of edit dictionaries as returned by load_edit_rules.
+        :return: The set of files the edits touched.
+        """
+        depth = self.integrated_data_ori['Depth (m)']
+        touched = set()
+        for rule in rules:
+            file = rule['file']
+            if file not in self.integrated_data_ori.columns:
+                print(f"{self.cluster_name}: ignoring edit of unknown file '{file}'")
+                continue
+            touched.add(file)
+            action = rule['action']
+            if action in ('clear', 'recover'):
+                depth_low, depth_high = sorted(rule['depth'])
+                qt_low, qt_high = sorted(rule['qt'])
+                qt = self.integrated_data_ori[file]
+                within_region = (depth >= depth_low) & (depth <= depth_high) & (qt >= qt_low) & (qt <= qt_high)
+                if action == 'clear':
+                    self.integrated_data_plot.loc[within_region, file] = np.nan
+                else:
+                    self.integrated_data_plot.loc[within_region, file] = qt[within_region]
+            elif action == 'keep':
+                start_depth, end_depth = rule['depth']
+                within_region = (depth >= start_depth) & (depth <= end_depth)
+                self.keep_file_boolean_df[file] = True
+                self.integrated_data_export[file] = np.where(within_region, self.integrated_data_plot[file], np.nan)
+            elif action == 'delete':
+                self.keep_file_boolean_df[file] = False
+            else:
+                print(f"{self.cluster_name}: ignoring unknown edit action '{action}'")
+        return touched
+
+    @traced('auto clean', 'compute')
+    def auto_clean(self, files=None, max_qt=None, spike_ratio=None, window=11):
+        """
+        Cleans profiles without manual edits and keeps each over its full valid depth range.
+
+        Non-positive values are always cleared. Optionally, values above max_qt and
+        spikes, i.e. values more than spike_ratio times the running median of the
+        surrounding window, are cleared too.
+
+        :param files: The files to clean. Default is None, which cleans every file.
+        :param max_qt: Upper bound of plausible qt (MPa). Default is None (no bound).
+        :param spike_ratio: Spike threshold relative to the running median. Default is None (no spike removal).
+        :param window: Number of depth steps of the running median. Default is 11.
+        """
+        files = list(self.file_name_list if files is None else files)
+        if not files:
+            return
+        qt = self.integrated_data_plot[files]
+        mask = qt > 0
+        if max_qt is not None:
+            mask &= qt <= max_qt
+        if spike_ratio is not None:
+            median = qt.rolling(window, center=True, min_periods=1).median()
+            mask &= qt <= spike_ratio * median
+        cleaned = qt.where(mask)
+        self.integrated_data_plot[files] = cleaned
+        self.integrated_data_export[files] = cleaned
+        self.keep_file_boolean_df[files] = cleaned.notna().any().values
+
+    def export_to_matlab(self, directory=None, layout=LEGACY_LAYOUT, do_compression=False, hdf5=False):
+        """
+        Writes clean_data_from_python.mat into the cluster folder.
+
+        :param directory: The folder holding the cluster folders. Default is the project folder.
+        :param layout: The variable layout, see cleanexport.build_export_data. Default is LEGACY_LAYOUT.
+        :param do_compression: Compress the variables. Default is False.
+        :param hdf5: Write a MATLAB v7.3 (HDF5) file; compact layout only. Default is False.
+        :return: The path of the written file.
+        """
         if directory is None:
             directory = self.project_path
-        filepath = os.path.join(directory, self.cluster_name, 'clean_data_from_python.mat')
-        mat_data = {
-            'integrated_data_ori': self._df_to_mat(self.integrated_data_ori),
-            'integrated_data_plot': self._df_to_mat(self.integrated_data_plot),
-            'integrated_data_export': self._df_to_mat(self.integrated_data_export),
-            'keep_data_boolean_df': self._df_to_mat(self.keep_data_boolean_df),
-            'keep_file_boolean_df': self._series_to_mat(self.keep_file_boolean_df),
-            'file_name_list': self.file_name_list,
-            'nztm_data': self._nztm_to_mat(),
-            # Add other data as needed
-        }
-        savemat(filepath, mat_data)
-        print(f"Data successfully exported to {filepath}")
-
-    def _df_to_mat(self, df):
-        # Convert DataFrame to MATLAB-compatible format
-        return {col: df[col].values for col in df.columns}
-
-    def _series_to_mat(self, series):
-        # Convert Series to MATLAB-compatible format
-        return {series.name: series.values}
-
-    def _nztm_to_mat(self):
-        # Convert NZTM data dictionary to MATLAB-compatible format
-        return {
-            'file_ids': list(self.nztm_data_dict.keys()),
-            'nztmX': [data['nztmX'] for data in self.nztm_data_dict.values()],
-            'nztmY': [data['nztmY'] for data in self.nztm_data_dict.values()],
-        }
+        filepath = os.path.join(directory, self.cluster_name, CLEAN_EXPORT_FILE_NAME)
+        mat_data = build_export_data(self.integrated_data_ori, self.integrated_data_plot, self.integrated_data_export,
+                                     self.keep_data_boolean_df, self.keep_file_boolean_df,
+                                     self.nztm_data_dict, self.file_name_list, layout=layout,
+                                     closest_file_ids_dict=self.create_closest_file_ids_dict(),
+                                     limits={'min_depth': self.min_depth, 'max_depth': self.max_depth,
+                                             'max_qt': self.max_qt})
+        write_mat_file(filepath, mat_data, do_compression=do_compression, hdf5=hdf5)
+        return filepath
+
+
+def prepare_cluster(project_path, cluster_name, auto_clean=False, max_qt=None, spike_ratio=None, skip_existing=False,
+                    layout=LEGACY_LAYOUT, do_compression=False, hdf5=False):
+    """
+    Loads one cluster, applies its edit_rules.json and/or auto-cleaning and writes
+    clean_data_from_python.mat. Runs in a worker process of prepare_clusters.
+
+    :param auto_clean: Auto-clean the files that have no recorded edits. Default is False.
+    :param skip_existing: Leave clusters that already have an export alone. Default is False.
+    :param layout, do_compression, hdf5: Passed to DataManager.export_to_matlab.
+    :return: A tuple (cluster_name, status, message) with status 'written', 'skipped' or 'failed'.
+    """
+    cluster_folder = os.path.join(project_path, cluster_name)
+    if skip_existing and os.path.exists(os.path.join(cluster_folder, CLEAN_EXPORT_FILE_NAME)):
+        return cluster_name, 'skipped', 'export exists'
+    try:
+        rules = load_edit_rules(os.path.join(cluster_folder, EDIT_RULES_FILE_NAME))
+        if not rules and not auto_clean:
+            return cluster_name, 'skipped', 'no edit rules'
+        manager = DataManager(project_path)
+        manager.select_cluster(cluster_name)
+        touched = manager.apply_edit_rules(rules)
+        if auto_clean:
+            manager.auto_clean([file for file in manager.file_name_list if file not in touched],
+                               max_qt=max_qt, spike_ratio=spike_ratio)
+        return cluster_name, 'written', manager.export_to_matlab(layout=layout, do_compression=do_compression, hdf5=hdf5)
+    except Exception as e:  # One broken cluster must not stop the batch
+        return cluster_name, 'failed', f"{type(e).__name__}: {e}"
+
+
+def prepare_clusters(project_path, cluster_names=None, max_workers=None, **options):
+    """
+    Runs prepare_cluster for many clusters on a process pool.
+
+    :param cluster_names: The clusters to prepare. Default is None, which prepares every cluster.
+    :param max_workers: Number of worker processes. Default is None, which uses all CPUs.
+    :param options: Passed to prepare_cluster.
+    :return: A list of (cluster_name, status, message) tuples in completion order.
+    """
+    if cluster_names is None:
+        cluster_names = DataManager(project_path).list_clusters()
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(prepare_cluster, project_path, cluster_name, **options)
+                   for cluster_name in cluster_names]
+        for done, future in enumerate(as_completed(futures), start=1):
+            cluster_name, status, message = future.result()
+            print(f"{done}/{len(futures)} {cluster_name}: {status} ({message})")
+            results.append((cluster_name, status, message))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Write clean_data_from_python.mat for many clusters without the GUI, "
+                    "replaying the edits saved by the CPT Data Editor and/or auto-cleaning.")
+    parser.add_argument('project', help="Project folder holding the cluster folders")
+    parser.add_argument('clusters', nargs='*', help="Clusters to prepare (default: all)")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="Number of worker processes (default: all CPUs)")
+    parser.add_argument('--auto-clean', action='store_true', help="Auto-clean and keep files without saved edits")
+    parser.add_argument('--max-qt', type=float, default=None, help="With --auto-clean, clear qt above this value (MPa)")
+    parser.add_argument('--spike-ratio', type=float, default=None,
+                        help="With --auto-clean, clear qt above this multiple of the running median")
+    parser.add_argument('--skip-existing', action='store_true', help="Skip clusters that already have an export")
+    parser.add_argument('--layout', choices=EXPORT_LAYOUTS, default=LEGACY_LAYOUT,
+                        help="'legacy': one struct field per sounding; 'compact': one matrix per table (default: legacy)")
+    parser.add_argument('--compress', action='store_true', help="Compress the exported variables")
+    parser.add_argument('--v73', action='store_true', help="Write MATLAB v7.3 (HDF5) files; needs h5py and --layout compact")
+    args = parser.parse_args(argv)
+    if args.v73 and args.layout != COMPACT_LAYOUT:
+        parser.error("--v73 requires --layout compact")
+
+    results = prepare_clusters(args.project, args.clusters or None, max_workers=args.jobs,
+                               auto_clean=args.auto_clean, max_qt=args.max_qt, spike_ratio=args.spike_ratio,
+                               skip_existing=args.skip_existing, layout=args.layout, do_compression=args.compress,
+                               hdf5=args.v73)
+    failed = [result for result in results if result[1] == 'failed']
+    print(f"Done: {sum(result[1] == 'written' for result in results)} written, "
+          f"{sum(result[1] == 'skipped' for result in results)} skipped, {len(failed)} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
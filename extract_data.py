@@ -1,62 +1,102 @@
 import os
+import sys
 import csv
-import scipy.io
+import json
+import argparse
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from matreader import read_result_file
+from posteriorstats import summarize_samples, batch_summarize_samples
+from columnar import columns_from_rows, write_columns, COLUMNS_SUFFIX
+import tracing
+from tracing import traced, span
+
+# Per-cluster location columns of the input CSV, joined onto every result file of the cluster
+GEOCODING_FIELDS = ['X_c', 'Y_c', 'lon_c', 'lat_c', 'road', 'suburb', 'city', 'county', 'state', 'postcode', 'site name']
+SUMMARY_FIELDS = ['no_of_soundings', 'length', 'min_dist_1', 'min_dist_2', 'min_dist_3', 'max_dist',
+                  'sig_mean', 'sig_2.5', 'sig_97.5', 'sof_v_mean', 'sof_v_2.5', 'sof_v_97.5',
+                  'sof_h_mean', 'sof_h_2.5', 'sof_h_97.5', 'nu_v_mean', 'nu_v_2.5', 'nu_v_97.5',
+                  'nu_h_mean', 'nu_h_2.5', 'nu_h_97.5', 'sig_t_mean', 'sig_t_2.5', 'sig_t_97.5',
+                  'sof_v_t_mean', 'sof_v_t_2.5', 'sof_v_t_97.5', 'sof_h_t_mean', 'sof_h_t_2.5', 'sof_h_t_97.5']
+FIELDNAMES = ['Cluster', 'mat_file_name'] + GEOCODING_FIELDS + SUMMARY_FIELDS
+MANIFEST_SUFFIX = '.manifest.jsonl'
+ERRORS_SUFFIX = '.errors.csv'
+# Column types of the columnar copy of the output; the remaining columns are text
+FLOAT_FIELDS = ['X_c', 'Y_c', 'lon_c', 'lat_c'] + [field for field in SUMMARY_FIELDS if field != 'no_of_soundings']
+INT_FIELDS = ['no_of_soundings']
+CHUNK_SIZE = 8  # Result files per worker call; their samples are summarized together
 
-def read_mat_file(root_directory, cluster_folder, mat_file, writer, X_c, Y_c, lon_c, lat_c, road, suburb, city, county, state, postcode, site_name):
-    mat_file_path = os.path.join(root_directory, cluster_folder, 'results_TMCMC', mat_file)
-    mat_data = scipy.io.loadmat(mat_file_path)
-    X, Y = mat_data['X'], mat_data['Y']
 
+def _read_summary_data(root_directory, cluster_folder, mat_file):
+    # The variables of a result file that the summary uses
+    mat_file_path = os.path.join(root_directory, cluster_folder, 'results_TMCMC', mat_file)
+    mat_data = read_result_file(mat_file_path, variables=('x', 'X', 'Y', 'z', 'temp_h'))
     # Example of how to read additional data from the mat file
     # Update these variables based on actual data structure
-    temp_h = mat_data.get('temp_h', np.array([]))
-    z = mat_data.get('z', np.array([]))
-    x = mat_data.get('x', np.zeros((2000, 8)))  # Assuming 'x' is the matrix mentioned for calculations
+    mat_data.setdefault('temp_h', np.array([]))
+    mat_data.setdefault('z', np.array([]))
+    mat_data.setdefault('x', np.zeros((2000, 8)))  # Assuming 'x' is the matrix mentioned for calculations
+    return mat_data
+
+
+@traced('summarize result files', 'io')
+def read_mat_files(root_directory, keys):
+    """
+    Process pool worker: summarizes a chunk of result files, each with the geometry
+    of its soundings and the mean and 95% interval of each random-field parameter.
+    The samples of the files are transformed and reduced together with
+    batch_summarize_samples. A file that cannot be read or summarized fails on its
+    own; the rest of the chunk is still summarized.
+
+    :param keys: The (cluster, .mat file) pairs to summarize.
+    :return: A list of (key, result, error) in the order of keys, where exactly one of
+             result and error is None.
+    """
+    outcomes = {}
+    read = []  # (key, mat_data) of the files that could be read
+    for key in keys:
+        try:
+            read.append((key, _read_summary_data(root_directory, *key)))
+        except Exception as e:
+            outcomes[key] = (key, None, f"{type(e).__name__}: {e}")
+    try:
+        stats_list = batch_summarize_samples([mat_data['x'] for _, mat_data in read])
+    except Exception:  # e.g. a sample matrix of the wrong shape; find it file by file
+        stats_list = [None] * len(read)
+    for (key, mat_data), stats in zip(read, stats_list):
+        try:
+            outcomes[key] = (key, summary_row(*key, mat_data, stats or summarize_samples(mat_data['x'])), None)
+        except Exception as e:
+            outcomes[key] = (key, None, f"{type(e).__name__}: {e}")
+    return [outcomes[key] for key in keys]
 
+
+def summary_row(cluster_folder, mat_file, mat_data, stats):
+    """
+    Builds the summary of one result file from its variables and the statistics of
+    its samples (see posteriorstats.summarize_samples).
+
+    :return: A dictionary with the Cluster, mat_file_name and SUMMARY_FIELDS columns.
+    """
+    temp_h, z = mat_data['temp_h'], mat_data['z']
     no_of_soundings = temp_h.size
-    length = z[-1] - z[0] if len(z) > 0 else 'N/A'
+    length = float(z.ravel()[-1] - z.ravel()[0]) if z.size > 0 else 'N/A'  # z is stored as an (N, 1) column
     min_dist = np.sort(temp_h.flatten())[:3] if temp_h.size >= 3 else ['N/A'] * 3  # Flatten in case temp_h is not 1-D
     max_dist = np.max(z) if len(z) > 0 else 'N/A'
     
-    # Calculations for sig, sof_v, sof_h, nu_v, nu_h, sig_t, sof_v_t, sof_h_t
-    sig = np.sqrt(1 / np.exp(x[:, 0]))
-    sof_v = np.exp(x[:, 1])
-    sof_h = np.exp(x[:, 2])
-    nu_v = np.exp(x[:, 3])
-    nu_h = np.exp(x[:, 4])
-    sig_t = np.sqrt(1 / np.exp(x[:, 5]))
-    sof_v_t = np.exp(x[:, 6])
-    sof_h_t = np.exp(x[:, 7])
-    
-    # Calculating means and percentiles
-    def calculate_stats(arr):
-        return np.mean(arr), np.percentile(arr, 2.5), np.percentile(arr, 97.5)
-
-    sig_mean, sig_2_5, sig_97_5 = calculate_stats(sig)
-    sof_v_mean, sof_v_2_5, sof_v_97_5 = calculate_stats(sof_v)
-    sof_h_mean, sof_h_2_5, sof_h_97_5 = calculate_stats(sof_h)
-    nu_v_mean, nu_v_2_5, nu_v_97_5 = calculate_stats(nu_v)
-    nu_h_mean, nu_h_2_5, nu_h_97_5 = calculate_stats(nu_h)
-    sig_t_mean, sig_t_2_5, sig_t_97_5 = calculate_stats(sig_t)
-    sof_v_t_mean, sof_v_t_2_5, sof_v_t_97_5 = calculate_stats(sof_v_t)
-    sof_h_t_mean, sof_h_t_2_5, sof_h_t_97_5 = calculate_stats(sof_h_t)
+    sig_mean, sig_2_5, sig_97_5 = (stats[key]['sig'] for key in ('mean', 'p2.5', 'p97.5'))
+    sof_v_mean, sof_v_2_5, sof_v_97_5 = (stats[key]['sofv'] for key in ('mean', 'p2.5', 'p97.5'))
+    sof_h_mean, sof_h_2_5, sof_h_97_5 = (stats[key]['sofh'] for key in ('mean', 'p2.5', 'p97.5'))
+    nu_v_mean, nu_v_2_5, nu_v_97_5 = (stats[key]['nuv'] for key in ('mean', 'p2.5', 'p97.5'))
+    nu_h_mean, nu_h_2_5, nu_h_97_5 = (stats[key]['nuh'] for key in ('mean', 'p2.5', 'p97.5'))
+    sig_t_mean, sig_t_2_5, sig_t_97_5 = (stats[key]['sigt'] for key in ('mean', 'p2.5', 'p97.5'))
+    sof_v_t_mean, sof_v_t_2_5, sof_v_t_97_5 = (stats[key]['sofvt'] for key in ('mean', 'p2.5', 'p97.5'))
+    sof_h_t_mean, sof_h_t_2_5, sof_h_t_97_5 = (stats[key]['sofht'] for key in ('mean', 'p2.5', 'p97.5'))
     
 
     result = {
         "Cluster": cluster_folder,
         "mat_file_name": mat_file,
-        "X_c": X_c,
-        "Y_c": Y_c,
-        "lon_c": lon_c,
-        "lat_c": lat_c,
-        "road": road,
-        "suburb": suburb,
-        "city": city,
-        "county": county,
-        "state": state,
-        "postcode": postcode,
-        "site name": site_name,
         "no_of_soundings": no_of_soundings,
         "length": length,
         "min_dist_1": min_dist[0],
@@ -88,36 +128,304 @@ def read_mat_file(root_directory, cluster_folder, mat_file, writer, X_c, Y_c, lo
         "sof_h_t_2.5": sof_h_t_2_5,
         "sof_h_t_97.5": sof_h_t_97_5,
     }
-    writer.writerow(result)
+    return result
 
-def process_file(file_name, root_directory, cluster_folder, writer, X_c, Y_c, lon_c, lat_c, road, suburb, city, county, state, postcode, site_name):
-    read_mat_file(root_directory, cluster_folder, file_name, writer, X_c, Y_c, lon_c, lat_c, road, suburb, city, county, state, postcode, site_name)
 
+@traced('list work items', 'io')
+def unique_work_items(rows, root_directory):
+    """
+    Reduces the rows of the input CSV to the work to do. The input has one row per
+    result file with its location, so every cluster's results_TMCMC folder is listed
+    once and every .mat file becomes one work item.
 
-if __name__ == "__main__":
-    root_directory = r"../"  # Adjust as necessary
-    input_csv_file_path = 'updated_results.csv'  # Ensure this is your input CSV
-
-    with open('results_final.csv', 'w', newline='', encoding='utf-8') as output_csvfile:
-        fieldnames = ['Cluster', 'mat_file_name', 'X_c', 'Y_c', 'lon_c', 'lat_c', 'road', 'suburb', 'city', 'county', 'state', 'postcode', 'site name',
-                      'no_of_soundings', 'length', 'min_dist_1', 'min_dist_2', 'min_dist_3', 'max_dist',
-                      'sig_mean', 'sig_2.5', 'sig_97.5', 'sof_v_mean', 'sof_v_2.5', 'sof_v_97.5',
-                      'sof_h_mean', 'sof_h_2.5', 'sof_h_97.5', 'nu_v_mean', 'nu_v_2.5', 'nu_v_97.5',
-                      'nu_h_mean', 'nu_h_2.5', 'nu_h_97.5', 'sig_t_mean', 'sig_t_2.5', 'sig_t_97.5',
-                      'sof_v_t_mean', 'sof_v_t_2.5', 'sof_v_t_97.5', 'sof_h_t_mean', 'sof_h_t_2.5', 'sof_h_t_97.5']
-        writer = csv.DictWriter(output_csvfile, fieldnames=fieldnames)
+    A file listed with different locations keeps the first one and is reported. A
+    file missing from the CSV takes the first location of its cluster, which is
+    reported if the files of the cluster have different locations.
+
+    :param rows: The rows of the input CSV as dictionaries.
+    :param root_directory: The folder holding the cluster folders.
+    :return: A tuple (geocoding, work_items) of the location columns keyed by
+             (cluster, .mat file) and, for files missing from the CSV, by cluster
+             (see geocoding_of), and the sorted list of unique (cluster, .mat file) pairs.
+    """
+    locations = {}  # key -> distinct locations in order of appearance
+    for row in rows:
+        location = {field: row[field] for field in GEOCODING_FIELDS}
+        for key in ((row['Cluster'], row['mat_file_name']), row['Cluster']):
+            key_locations = locations.setdefault(key, [])
+            if location not in key_locations:
+                key_locations.append(location)
+    geocoding = {key: key_locations[0] for key, key_locations in locations.items()}
+
+    work_items = []
+    for cluster_folder in (key for key in geocoding if not isinstance(key, tuple)):
+        cluster_path = os.path.join(root_directory, cluster_folder, 'results_TMCMC')
+        if os.path.isdir(cluster_path):
+            work_items.extend((cluster_folder, mat_file) for mat_file in sorted(os.listdir(cluster_path))
+                              if mat_file.endswith('.mat'))
+
+    # Report each conflicting location used by a work item once
+    used_keys = dict.fromkeys(key if key in geocoding else key[0] for key in work_items)
+    for key in used_keys:
+        if len(locations[key]) > 1:
+            name = f"{key[0]}/{key[1]}" if isinstance(key, tuple) else f"{key}, used for its files missing from the CSV,"
+            print(f"Warning: {name} has {len(locations[key])} different locations in the input CSV; using the first")
+    return geocoding, work_items
+
+
+def geocoding_of(geocoding, key):
+    # The location of a result file, or of its cluster for a file the input CSV does not list
+    return geocoding.get(key) or geocoding[key[0]]
+
+
+def _to_json_value(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.item() if value.size == 1 else value.tolist()
+    return value
+
+
+class ExtractionManifest:
+    """
+    The checkpoint of a batch extraction. Each summarized result file is appended
+    as one JSON line and flushed at once, so an interrupted run keeps all finished
+    work. Entries are only valid while the file's size and modification time are
+    unchanged, so re-runs summarize new and changed files only.
+    """
+
+    def __init__(self, path):
+        """
+        Initializes the ExtractionManifest instance and reads the existing manifest if any.
+
+        :param path: The path of the manifest file.
+        """
+        self.path = path
+        self.entries = {}
+        self._file = None
+        if not os.path.exists(path):
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # A line cut short by an interrupted run
+                self.entries[tuple(entry['key'])] = entry
+
+    def get(self, key, stat):
+        """
+        Returns the stored result of a work item, or None if it is missing or stale.
+
+        :param key: The (cluster, .mat file) work item.
+        :param stat: The os.stat result of the .mat file.
+        """
+        entry = self.entries.get(key)
+        if entry is None or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+            return None
+        return entry['result']
+
+    def put(self, key, stat, result):
+        """
+        Records the result of a work item and appends it to the manifest file.
+
+        :param key: The (cluster, .mat file) work item.
+        :param stat: The os.stat result of the .mat file, taken before it was read.
+        :param result: The dictionary returned by summary_row.
+        """
+        entry = {
+            'key': list(key),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'result': {column: _to_json_value(value) for column, value in result.items()},
+        }
+        line = json.dumps(entry)  # Serialized first, so an entry that cannot be stored is not kept either
+        self.entries[key] = entry
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(line + '\n')
+        self._file.flush()
+
+    def compact(self, keys):
+        """
+        Rewrites the manifest with one entry per current work item, dropping
+        superseded entries and files that no longer exist.
+
+        :param keys: The work items of the run.
+        """
+        self.close()
+        self.entries = {key: self.entries[key] for key in keys if key in self.entries}
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry) + '\n')
+        os.replace(temp_path, self.path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def write_error_report(errors_path, errors):
+    """
+    Writes the files that could not be summarized, or removes the report of a
+    previous run if every file succeeded.
+
+    :param errors: A list of (cluster, .mat file, error message) tuples.
+    """
+    if not errors:
+        if os.path.exists(errors_path):
+            os.remove(errors_path)
+        return
+    with open(errors_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Cluster', 'mat_file_name', 'error'])
+        writer.writerows(errors)
+
+
+@traced('extract results', 'task')
+def extract_results(root_directory, input_csv_file_path, output_csv_file_path, max_workers=None,
+                    manifest_path=None, errors_path=None, force=False, columns_path=None):
+    """
+    Summarizes every result file of the clusters listed in the input CSV on a
+    process pool. Each file is read once; rows are joined with the location of
+    their cluster and written to the output CSV as soon as they finish.
+
+    Files recorded in the manifest and unchanged since are not read again. A file
+    that fails is reported and skipped, so one corrupt file does not stop the run;
+    if it crashes a worker process, the files still queued are reported too and
+    are retried on the next run.
+
+    :param max_workers: Number of worker processes. Default is None, which uses all CPUs.
+    :param manifest_path: The checkpoint file. Default is the output path + MANIFEST_SUFFIX.
+    :param errors_path: The error report. Default is the output path + ERRORS_SUFFIX.
+    :param force: Summarize every file again, ignoring the manifest. Default is False.
+    :param columns_path: The typed, memory-mappable copy of the output written with
+                         columnar.write_columns. Default is the output path with
+                         COLUMNS_SUFFIX in place of .csv; pass False to skip it.
+    :return: A tuple (reused, summarized, errors) with the number of unchanged and newly
+             summarized files, and the list of (cluster, .mat file, error message) failures.
+    """
+    with span('read manifest', 'io'):
+        manifest = ExtractionManifest(manifest_path or output_csv_file_path + MANIFEST_SUFFIX)
+    if force:
+        manifest.entries = {}
+    with open(input_csv_file_path, mode='r', encoding='utf-8') as input_csvfile:
+        geocoding, work_items = unique_work_items(csv.DictReader(input_csvfile), root_directory)
+
+    errors = []
+    summarized = 0
+    rows = []
+    with open(output_csv_file_path, 'w', newline='', encoding='utf-8') as output_csvfile:
+        writer = csv.DictWriter(output_csvfile, fieldnames=FIELDNAMES)
         writer.writeheader()
 
-        with open(input_csv_file_path, mode='r', encoding='utf-8') as input_csvfile:
-            csvreader = csv.DictReader(input_csvfile)
-            for row in csvreader:
-                cluster_folder = row['Cluster']
-                mat_file_name = row['mat_file_name']
-                cluster_path = os.path.join(root_directory, cluster_folder, 'results_TMCMC')
-                if os.path.exists(cluster_path) and os.path.isdir(cluster_path):
-                    for mat_file in os.listdir(cluster_path):
-                        if mat_file.endswith('.mat'):
-                                process_file(mat_file, root_directory, cluster_folder, writer,
-                                    row['X_c'], row['Y_c'], row['lon_c'], row['lat_c'], 
-                                    row['road'], row['suburb'], row['city'], row['county'], 
-                                    row['state'], row['postcode'], row['site name'])
\ No newline at end of file
+        pending = []
+        for key in work_items:
+            mat_file_path = os.path.join(root_directory, key[0], 'results_TMCMC', key[1])
+            try:
+                stat = os.stat(mat_file_path)
+            except OSError as e:
+                errors.append((*key, str(e)))
+                continue
+            result = manifest.get(key, stat)
+            if result is None:
+                pending.append((key, stat))
+            else:
+                rows.append({**result, **geocoding_of(geocoding, key)})
+                writer.writerow(rows[-1])
+        output_csvfile.flush()
+        reused = len(work_items) - len(pending) - len(errors)
+        print(f"{reused} result files unchanged since the last run, {len(pending)} to summarize")
+
+        trace_workers = tracing.is_enabled()  # Workers then send their spans back with each result
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+        try:
+            # Files are sent in chunks, whose samples each worker summarizes in one batch
+            chunks = [pending[start:start + CHUNK_SIZE] for start in range(0, len(pending), CHUNK_SIZE)]
+            futures = {}
+            for chunk in chunks:
+                keys = [key for key, _ in chunk]
+                future = (executor.submit(tracing.run_traced, read_mat_files, root_directory, keys) if trace_workers
+                          else executor.submit(read_mat_files, root_directory, keys))
+                futures[future] = chunk
+            done = 0
+            for future in as_completed(futures):
+                chunk = futures[future]
+                stats = dict(chunk)
+                try:
+                    outcomes = future.result()
+                    if trace_workers:
+                        outcomes, drained = outcomes
+                        tracing.merge(drained)
+                except Exception as e:  # The worker crashed; every file of the chunk is reported
+                    outcomes = [(key, None, f"{type(e).__name__}: {e}") for key, _ in chunk]
+                for key, result, error in outcomes:
+                    done += 1
+                    try:
+                        if error is not None:
+                            raise RuntimeError(error)
+                        # Recording the result can fail too, e.g. on a value JSON cannot store
+                        manifest.put(key, stats[key], result)
+                        row = {**result, **geocoding_of(geocoding, key)}
+                        writer.writerow(row)
+                    except Exception as e:
+                        message = error or f"{type(e).__name__}: {e}"
+                        errors.append((*key, message))
+                        print(f"{done}/{len(pending)} {key[0]}/{key[1]} failed: {message}")
+                        continue
+                    rows.append(row)
+                    output_csvfile.flush()
+                    summarized += 1
+                    print(f"{done}/{len(pending)} {key[0]}/{key[1]}")
+        except KeyboardInterrupt:
+            print("Interrupted; finished files are kept in the manifest and skipped on the next run.")
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        finally:
+            executor.shutdown()
+            manifest.close()
+
+    manifest.compact(work_items)
+    write_error_report(errors_path or output_csv_file_path + ERRORS_SUFFIX, errors)
+    if columns_path is not False:
+        with span('write columns', 'io', rows=len(rows)):
+            rows.sort(key=lambda row: (row['Cluster'], row['mat_file_name']))
+            columns = columns_from_rows(rows, FIELDNAMES, float_fields=FLOAT_FIELDS, int_fields=INT_FIELDS)
+            write_columns(columns_path or os.path.splitext(output_csv_file_path)[0] + COLUMNS_SUFFIX, columns)
+    return reused, summarized, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Summarize the TMCMC result files of the clusters listed in a CSV. "
+                    "Re-runs only summarize result files that are new or changed.")
+    parser.add_argument('--root', default='../', help="Folder holding the cluster folders (default: ../)")
+    parser.add_argument('--input', default='updated_results.csv', help="CSV listing the clusters and their location (default: updated_results.csv)")
+    parser.add_argument('--output', default='results_final.csv', help="Output CSV (default: results_final.csv)")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="Number of worker processes (default: all CPUs)")
+    parser.add_argument('--manifest', help=f"Checkpoint file (default: <output>{MANIFEST_SUFFIX})")
+    parser.add_argument('--errors', help=f"Report of the files that failed (default: <output>{ERRORS_SUFFIX})")
+    parser.add_argument('--columns', help=f"Typed columnar copy of the output (default: <output without .csv>{COLUMNS_SUFFIX})")
+    parser.add_argument('--no-columns', action='store_true', help="Do not write the columnar copy")
+    parser.add_argument('--force', action='store_true', help="Ignore the checkpoint and summarize every file again")
+    parser.add_argument('--trace', help="Write a Chrome/Perfetto trace of the run to this .json file and print the time per stage")
+    args = parser.parse_args(argv)
+    if args.trace:
+        tracing.enable()
+
+    reused, summarized, errors = extract_results(args.root, args.input, args.output, max_workers=args.jobs,
+                                                 manifest_path=args.manifest, errors_path=args.errors, force=args.force,
+                                                 columns_path=False if args.no_columns else args.columns)
+    print(f"Done: {summarized} summarized, {reused} unchanged, {len(errors)} failed")
+    if args.trace:
+        print(tracing.format_summary())
+        print(f"Wrote {tracing.write_trace(args.trace)} trace events to {args.trace}")
+    if errors:
+        print(f"See {args.errors or args.output + ERRORS_SUFFIX} for the failures.")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
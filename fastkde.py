@@ -0,0 +1,143 @@
+import numpy as np
+from scipy.signal import fftconvolve
+from contourpy import contour_generator
+
+
+def linear_binning(x, y, x_range, y_range, gridsize):
+    """
+    Distributes each point over the four surrounding grid nodes with bilinear weights.
+
+    :param x, y: 1D arrays of point coordinates.
+    :param x_range, y_range: (min, max) of the grid along each axis.
+    :param gridsize: (nx, ny) number of grid nodes along each axis.
+    :return: An (nx, ny) array of binned weights summing to the number of points.
+    """
+    nx, ny = gridsize
+    fx = (x - x_range[0]) / (x_range[1] - x_range[0]) * (nx - 1)
+    fy = (y - y_range[0]) / (y_range[1] - y_range[0]) * (ny - 1)
+    ix = np.clip(np.floor(fx).astype(int), 0, nx - 2)
+    iy = np.clip(np.floor(fy).astype(int), 0, ny - 2)
+    wx = fx - ix
+    wy = fy - iy
+
+    counts = np.zeros(nx * ny)
+    for dx, dy, weights in ((0, 0, (1 - wx) * (1 - wy)), (1, 0, wx * (1 - wy)),
+                            (0, 1, (1 - wx) * wy), (1, 1, wx * wy)):
+        counts += np.bincount((ix + dx) * ny + (iy + dy), weights=weights, minlength=nx * ny)
+    return counts.reshape(nx, ny)
+
+
+def binned_kde(x, y, gridsize=(128, 128), cut=3.0):
+    """
+    Evaluates a 2D Gaussian kernel density estimate on a regular grid by linear
+    binning followed by an FFT convolution with the kernel. The cost depends on the
+    grid size rather than on the number of samples times the number of grid nodes.
+
+    Bandwidths follow Scott's rule per axis, like scipy.stats.gaussian_kde.
+
+    :param x, y: 1D arrays of samples.
+    :param gridsize: (nx, ny) number of grid nodes. Default is (128, 128).
+    :param cut: The grid extends this many bandwidths beyond the data. Default is 3.
+    :return: A tuple (x_grid, y_grid, density) with density of shape (nx, ny),
+             or None if the samples are degenerate.
+    """
+    n = len(x)
+    if n < 3:
+        return None
+    bandwidth = np.array([np.std(x), np.std(y)]) * n ** (-1 / 6)
+    if not np.all(bandwidth > 0):
+        return None
+
+    x_range = (x.min() - cut * bandwidth[0], x.max() + cut * bandwidth[0])
+    y_range = (y.min() - cut * bandwidth[1], y.max() + cut * bandwidth[1])
+    x_grid = np.linspace(*x_range, gridsize[0])
+    y_grid = np.linspace(*y_range, gridsize[1])
+    spacing = np.array([x_grid[1] - x_grid[0], y_grid[1] - y_grid[0]])
+
+    counts = linear_binning(x, y, x_range, y_range, gridsize)
+
+    # Separable Gaussian kernel in grid units, truncated at 4 standard deviations
+    kernels = []
+    for sigma, size in zip(bandwidth / spacing, gridsize):
+        half_width = int(min(np.ceil(4 * sigma), size - 1))
+        offsets = np.arange(-half_width, half_width + 1)
+        kernels.append(np.exp(-0.5 * (offsets / sigma) ** 2))
+    kernel = np.outer(kernels[0], kernels[1])
+    kernel /= kernel.sum()
+
+    density = fftconvolve(counts, kernel, mode='same')
+    density = np.clip(density, 0, None) / (n * spacing[0] * spacing[1])
+    return x_grid, y_grid, density
+
+
+def hpd_level(density, mass=0.95):
+    """
+    Finds the density level enclosing the given probability mass (highest posterior
+    density region) by sorting the gridded density once.
+
+    :param density: The gridded density.
+    :param mass: The enclosed probability mass. Default is 0.95.
+    :return: The density value of the contour.
+    """
+    values = np.sort(density.ravel())[::-1]
+    cumulative = np.cumsum(values)
+    index = np.searchsorted(cumulative, mass * cumulative[-1])
+    return values[min(index, len(values) - 1)]
+
+
+def hpd_contour_paths(x, y, mass=0.95, gridsize=(128, 128), log_space=True):
+    """
+    Computes the vertices of the highest posterior density contour of 2D samples.
+
+    :param x, y: 1D arrays of samples.
+    :param mass: The enclosed probability mass. Default is 0.95.
+    :param gridsize: (nx, ny) number of grid nodes. Default is (128, 128).
+    :param log_space: Estimate the density of log(x), log(y), as for log-log plots. Default is True.
+    :return: A list of (M, 2) vertex arrays in the original coordinates; empty for degenerate samples.
+    """
+    x = np.asarray(x, dtype=float).ravel()
+    y = np.asarray(y, dtype=float).ravel()
+    if log_space:
+        valid = (x > 0) & (y > 0)
+        x, y = np.log(x[valid]), np.log(y[valid])
+    valid = np.isfinite(x) & np.isfinite(y)
+    x, y = x[valid], y[valid]
+
+    kde = binned_kde(x, y, gridsize=gridsize)
+    if kde is None:
+        return []
+    x_grid, y_grid, density = kde
+    lines = contour_generator(x=x_grid, y=y_grid, z=density.T).lines(hpd_level(density, mass))
+    return [np.exp(line) if log_space else line for line in lines]
+
+
+def log_histogram2d(x, y, x_range=None, y_range=None, bins=(64, 64)):
+    """
+    Counts 2D samples on a grid of log-spaced bins, e.g. for density views of
+    log-log plots. Drawing the counts costs the same for any number of samples.
+
+    :param x, y: 1D arrays of positive samples.
+    :param x_range, y_range: (low, high) bounds of the grid along each axis, in either
+                             order. Default is None, which uses the range of the samples.
+    :param bins: (nx, ny) number of bins. Default is (64, 64).
+    :return: A tuple (x_edges, y_edges, counts) with the edges in the original
+             coordinates and counts of shape (nx, ny), or None if no sample is positive.
+    """
+    x = np.asarray(x, dtype=float).ravel()
+    y = np.asarray(y, dtype=float).ravel()
+    valid = (x > 0) & (y > 0) & np.isfinite(x) & np.isfinite(y)
+    if not valid.any():
+        return None
+    log_x, log_y = np.log(x[valid]), np.log(y[valid])
+
+    log_range = []
+    for bounds, values in ((x_range, log_x), (y_range, log_y)):
+        if bounds is None or not np.all(np.asarray(bounds, dtype=float) > 0):
+            bounds = np.exp([values.min(), values.max()])
+        low, high = np.sort(np.log(np.asarray(bounds, dtype=float)))
+        if low == high:
+            low, high = low - 0.5, high + 0.5
+        log_range.append((low, high))
+
+    counts, x_edges, y_edges = np.histogram2d(log_x, log_y, bins=bins, range=log_range)
+    return np.exp(x_edges), np.exp(y_edges), counts
@@ -1,6 +1,14 @@
 import os
+import json
 import shutil
 import glob
+import fnmatch
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from projectscanner import scandir_walk
+
+SYNC_MANIFEST_NAME = '.sync_manifest.json'
+
 
 def find_folders_with_subfolders(base_dir, parent_folder_hint, subfolder_name):
     """
@@ -16,45 +24,177 @@ def find_folders_with_subfolders(base_dir, parent_folder_hint, subfolder_name):
 
     folders_with_subfolder = []
 
-    for root, dirs, files in os.walk(base_dir):
+    for root, dirs, files in scandir_walk(base_dir):
         # Check if parent folder name contains the specific hint.
-        if parent_folder_hint in os.path.basename(root) and subfolder_name in dirs:
-            folders_with_subfolder.append(root) 
-        
+        if parent_folder_hint in os.path.basename(root) and any(d.name == subfolder_name for d in dirs):
+            folders_with_subfolder.append(root)
+            dirs.clear()  # The contents of a matching folder are not searched again
+
     return folders_with_subfolder
 
 
-def copy_folders_with_subfolders(src_directory, dest_directory, folder_hint='', subfolder_name=''):
+def _file_hash(path, chunk_size=1024 ** 2):
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_sync_manifest(directory):
+    path = os.path.join(directory, SYNC_MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable sync manifest '{path}': {e}")
+        return {}
+
+
+def _write_sync_manifest(directory, manifest):
+    path = os.path.join(directory, SYNC_MANIFEST_NAME)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(temp_path, path)
+
+
+def _copy_file(src_path, dest_path, link_path=None):
+    # Copy (or hardlink) to a temporary name first so an interrupted copy never
+    # leaves a truncated file that looks up to date
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    temp_path = dest_path + '.part'
+    if link_path is not None:
+        try:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            os.link(link_path, temp_path)
+            os.replace(temp_path, dest_path)
+            return 'linked'
+        except OSError:
+            pass  # Different volume or no hardlink support; copy instead
+    shutil.copy2(src_path, temp_path)
+    os.replace(temp_path, dest_path)
+    return 'copied'
+
+
+def copy_folders_with_subfolders(src_directory, dest_directory, folder_hint='', subfolder_name='',
+                                 max_workers=8, use_hash=False, link_dest=None):
     """
-    Copies all folders from src_directory that contain a specified subfolder to dest_directory.
+    Synchronizes all folders from src_directory that contain a specified subfolder to
+    dest_directory. Only new or changed files are copied, so results added to a cluster
+    that was copied before are picked up on the next run.
+
+    A manifest of the size and modification time of every copied file is kept in
+    dest_directory (SYNC_MANIFEST_NAME). Files are copied on a thread pool.
 
     :param src_directory: The base directory to search within.
     :param dest_directory: The destination directory where folders are copied.
     :param folder_hint: A substring to identify relavant folders. Use an empty string to match all folders.
     :param subfolder_name: The name of the subfolder to seach for within the parent folders.
+    :param max_workers: Number of files copied in parallel. Default is 8.
+    :param use_hash: Also store a content hash and skip files whose modification time
+                     changed but whose content did not. Default is False.
+    :param link_dest: An optional earlier copy (with its own manifest). Files unchanged
+                      since that copy are hardlinked from it instead of copied.
+    :return: A dictionary with the number of 'copied', 'linked' and 'unchanged' files
+             and the list of 'failed' (path, error) pairs.
     """
-    for root, dirs, _ in os.walk(src_directory):
+    manifest = _read_sync_manifest(dest_directory)
+    link_manifest = _read_sync_manifest(link_dest) if link_dest else {}
+    summary = {'copied': 0, 'linked': 0, 'unchanged': 0, 'failed': []}
+
+    # Collect the files of matching folders; a matching folder is synced as a whole,
+    # so the walk does not descend into it again
+    jobs = []  # (key, src_path, dest_path, link_path, entry)
+    for root, dirs, _ in scandir_walk(src_directory):
         folder_name = os.path.basename(root)
         # Check if the folder matches the hint (if provided) and contains the specific subfolder.
-        if (folder_hint in folder_name or not folder_hint) and subfolder_name in dirs:
-            dest_path = os.path.join(dest_directory, os.path.relpath(root, src_directory))
+        if not ((folder_hint in folder_name or not folder_hint) and any(d.name == subfolder_name for d in dirs)):
+            continue
+        dirs.clear()
+        for path, _, files in scandir_walk(root):
+            for file_entry in files:
+                key = os.path.relpath(file_entry.path, src_directory).replace(os.sep, '/')
+                dest_path = os.path.join(dest_directory, key)
+                old = manifest.get(key)
+                try:  # The file may have been deleted or locked since the directory was listed
+                    stat = file_entry.stat()
+                    entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+                    if old is not None and os.path.exists(dest_path) and use_hash and 'hash' in old \
+                            and old['size'] == entry['size'] and old['mtime_ns'] != entry['mtime_ns']:
+                        entry['hash'] = _file_hash(file_entry.path)
+                except OSError as e:
+                    print(f"Error reading '{file_entry.path}': {e}")
+                    summary['failed'].append((file_entry.path, str(e)))
+                    continue
+                if old is not None and os.path.exists(dest_path):
+                    if old['size'] == entry['size'] and old['mtime_ns'] == entry['mtime_ns']:
+                        summary['unchanged'] += 1
+                        continue
+                    if entry.get('hash') is not None and entry['hash'] == old['hash']:
+                        manifest[key] = entry  # Touched but identical
+                        summary['unchanged'] += 1
+                        continue
+                link_path = None
+                linked = link_manifest.get(key)
+                if linked is not None and linked['size'] == entry['size'] and linked['mtime_ns'] == entry['mtime_ns']:
+                    link_path = os.path.join(link_dest, key)
+                    if not os.path.exists(link_path):
+                        link_path = None
+                jobs.append((key, file_entry.path, dest_path, link_path, entry))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_copy_file, src_path, dest_path, link_path): (key, src_path, entry)
+                   for key, src_path, dest_path, link_path, entry in jobs}
+        for future in as_completed(futures):
+            key, src_path, entry = futures[future]
             try:
-                # Ensure the destination path does not already exist to prevent overwriting.
-                if not os.path.exists(dest_path):
-                    shutil.copytree(root, dest_path)
-                    print(f"Copied '{root}' to '{dest_path}'")
-                else:
-                    print(f"Destination '{dest_path}' already exists. Skipping.")
+                summary[future.result()] += 1
             except Exception as e:
-                print(f"Error copying '{root}' to '{dest_path}': {e}")
+                print(f"Error copying '{src_path}': {e}")
+                summary['failed'].append((src_path, str(e)))
+                continue
+            if use_hash and 'hash' not in entry:
+                try:
+                    entry['hash'] = _file_hash(src_path)
+                except OSError as e:  # Copied, but without a hash; the next run compares by time again
+                    print(f"Error hashing '{src_path}': {e}")
+            manifest[key] = entry
 
+    os.makedirs(dest_directory, exist_ok=True)
+    _write_sync_manifest(dest_directory, manifest)
+    print(f"Copied {summary['copied']}, linked {summary['linked']}, unchanged {summary['unchanged']}, "
+          f"failed {len(summary['failed'])} files from '{src_directory}' to '{dest_directory}'")
+    return summary
 
-def delete_files_by_pattern(start_dir, target_dir_name, file_pattern):
+
+def delete_files_by_pattern(start_dir, target_dir_name, file_pattern, dry_run=False):
     """
     Deletes files maching a specified pattern under any directories that match the 
     target directory name, starting from the specified start directory.
 
     :param start_dir: The base directory to start the search from.
     :param target_dir_name: The name of the target directory to look for. 
-    :param file_pattern: 
-    """
\ No newline at end of file
+    :param file_pattern: A shell-style pattern matched against file names, e.g. '*.fig'.
+    :param dry_run: Only list the files that would be deleted. Default is False.
+    :return: The list of deleted (or, with dry_run, matching) file paths.
+    """
+    deleted = []
+    for root, _, files in scandir_walk(start_dir):
+        if os.path.basename(root) != target_dir_name:
+            continue
+        for file_entry in files:
+            if not fnmatch.fnmatch(file_entry.name, file_pattern):
+                continue
+            if not dry_run:
+                try:
+                    os.remove(file_entry.path)
+                except OSError as e:
+                    print(f"Error deleting '{file_entry.path}': {e}")
+                    continue
+            deleted.append(file_entry.path)
+    print(f"{'Found' if dry_run else 'Deleted'} {len(deleted)} files matching '{file_pattern}' in '{target_dir_name}' folders")
+    return deleted
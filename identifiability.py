@@ -0,0 +1,64 @@
+import numpy as np
+from posteriorstats import PARAM_NAMES
+
+IDENTIFIABLE = "Identifiable"
+UNIDENTIFIABLE = "Unidentifiable"
+# Thresholds on the width of the posterior 95% interval relative to the prior range (log scale)
+IDENTIFIABLE_BELOW = 0.5
+UNIDENTIFIABLE_ABOVE = 0.8
+
+
+def range_ratios(summaries):
+    """
+    Scores every parameter of every result file in one vectorized pass.
+
+    The score is the width of the posterior 95% interval divided by the width of the
+    prior range x_low..x_up, both on a log scale: values near 0 mean the data pinned
+    the parameter down, values near 1 mean the posterior is as wide as the prior.
+
+    :param summaries: A list of summaries as stored in the summary sidecar.
+    :return: An (F, 8) array of ratios in PARAM_NAMES order.
+    """
+    p_low = np.array([[summary['p2.5'][param] for param in PARAM_NAMES] for summary in summaries], dtype=float)
+    p_high = np.array([[summary['p97.5'][param] for param in PARAM_NAMES] for summary in summaries], dtype=float)
+    prior_low = np.array([summary['xlim_low'] for summary in summaries], dtype=float)
+    prior_up = np.array([summary['xlim_up'] for summary in summaries], dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        posterior_width = np.abs(np.log(p_high) - np.log(p_low))
+        prior_width = np.abs(np.log(prior_up) - np.log(prior_low))
+        return posterior_width / prior_width
+
+
+def classify(ratios, identifiable_below=IDENTIFIABLE_BELOW, unidentifiable_above=UNIDENTIFIABLE_ABOVE):
+    """
+    Labels each ratio as Identifiable, Unidentifiable or borderline (None).
+
+    :param ratios: An array of ratios as returned by range_ratios.
+    :param identifiable_below: Ratios below this are Identifiable. Default is IDENTIFIABLE_BELOW.
+    :param unidentifiable_above: Ratios above this are Unidentifiable. Default is UNIDENTIFIABLE_ABOVE.
+    :return: An object array of the same shape holding the labels.
+    """
+    labels = np.full(np.shape(ratios), None, dtype=object)
+    labels[ratios < identifiable_below] = IDENTIFIABLE
+    labels[ratios > unidentifiable_above] = UNIDENTIFIABLE
+    return labels
+
+
+def suggested_values(summary, labels):
+    """
+    Converts the labels of one file to the values the Inspector stores for a parameter:
+    the posterior mean if Identifiable, or the 95% interval as text if Unidentifiable.
+    Borderline parameters are left out so they remain "to check".
+
+    :param summary: The summary of the result file.
+    :param labels: The 8 labels of the file in PARAM_NAMES order.
+    :return: A dictionary mapping parameter names to suggested values.
+    """
+    values = {}
+    for param, label in zip(PARAM_NAMES, labels):
+        if label == IDENTIFIABLE:
+            values[param] = summary['mean'][param]
+        elif label == UNIDENTIFIABLE:
+            values[param] = f"{summary['p2.5'][param]:.2f} < {param} < {summary['p97.5'][param]:.2f}"
+    return values
@@ -0,0 +1,78 @@
+import numpy as np
+from scipy.io import loadmat
+
+try:
+    import h5py
+except ImportError:  # h5py is only needed for MATLAB v7.3 files
+    h5py = None
+
+# Variables of a TMCMC result file that the tools actually use
+RESULT_VARIABLES = ('x', 'x_low', 'x_up', 'X', 'Y', 'z', 'temp_z', 'temp_h')
+# Variables holding one posterior sample per row, which sample_slice applies to
+SAMPLE_VARIABLES = ('x',)
+
+HDF5_SIGNATURE = b'\x89HDF\r\n\x1a\n'
+
+
+def is_hdf5_mat_file(mat_path):
+    """
+    Checks whether a .mat file uses the MATLAB v7.3 (HDF5) format. Such files carry
+    a 512-byte MATLAB header followed by the HDF5 signature.
+
+    :param mat_path: The path of the .mat file.
+    :return: True for v7.3 files, False for v4/v5/v7 files.
+    """
+    with open(mat_path, 'rb') as f:
+        header = f.read(512 + len(HDF5_SIGNATURE))
+    return header[512:] == HDF5_SIGNATURE or header.startswith(HDF5_SIGNATURE)
+
+
+def read_result_file(mat_path, variables=RESULT_VARIABLES, sample_slice=None):
+    """
+    Reads only the requested variables of a result file. Variables that are not
+    present in the file are left out of the returned dictionary.
+
+    For v7.3 files the variables are read straight from the HDF5 datasets, and
+    sample_slice is applied on disk so only the selected rows are read. Older
+    formats cannot be read partially; there the slice is applied after loading.
+
+    :param mat_path: The path of the .mat file.
+    :param variables: Names of the variables to read. Default is RESULT_VARIABLES.
+    :param sample_slice: An optional slice over the posterior samples (the rows of 'x'),
+                         e.g. slice(None, None, 10) to keep every 10th sample.
+    :return: A dictionary mapping variable names to 2D NumPy arrays, shaped as loadmat returns them.
+    """
+    if is_hdf5_mat_file(mat_path):
+        return _read_hdf5_variables(mat_path, variables, sample_slice)
+
+    data = loadmat(mat_path, variable_names=list(variables))
+    result = {name: data[name] for name in variables if name in data}
+    if sample_slice is not None:
+        for name in SAMPLE_VARIABLES:
+            if name in result:
+                result[name] = result[name][sample_slice]
+    return result
+
+
+def _read_hdf5_variables(mat_path, variables, sample_slice):
+    if h5py is None:
+        raise ImportError(f"h5py is required to read MATLAB v7.3 file '{mat_path}'.")
+
+    result = {}
+    with h5py.File(mat_path, 'r') as f:
+        for name in variables:
+            if name not in f:
+                continue
+            dataset = f[name]
+            # MATLAB writes column-major arrays, so the HDF5 dataset is the transpose
+            # and posterior samples run along the last HDF5 axis
+            if name in SAMPLE_VARIABLES and sample_slice is not None and dataset.ndim == 2:
+                start, stop, step = sample_slice.indices(dataset.shape[1])
+                if step > 0:
+                    values = dataset[:, start:stop:step]
+                else:  # h5py only supports increasing selections
+                    values = dataset[()][:, sample_slice]
+            else:
+                values = dataset[()]
+            result[name] = np.atleast_2d(np.asarray(values).T)
+    return result
@@ -0,0 +1,174 @@
+import os
+import logging
+import tempfile
+import numpy as np
+from resultcache import estimate_nbytes
+
+try:
+    import psutil
+except ImportError:  # psutil is only needed to report the memory of the whole process
+    psutil = None
+
+MEMORY_LOG_ENV_VAR = 'CPT_MEMORY_LOG'  # Path of the memory log; defaults to DEFAULT_MEMORY_LOG
+DEFAULT_MEMORY_LOG = os.path.join(tempfile.gettempdir(), 'cpt_tools_memory.log')
+DEFAULT_MEMORY_BUDGET = 4 * 1024 ** 3  # Bytes of accounted structures before warning; a quarter of a 16 GB laptop
+LOG_CHANGE_RATIO = 0.1  # A measurement is logged when the total changed by more than this fraction
+
+logger = logging.getLogger('cpt.memory')
+
+
+def format_bytes(nbytes):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(nbytes) < 1024 or unit == 'GB':
+            return f"{nbytes:.0f} {unit}" if unit == 'B' else f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
+
+
+def artist_nbytes(artist):
+    """
+    Approximates the data held by a matplotlib artist: line vertices, collection
+    paths and offsets, and mesh or image arrays.
+
+    :param artist: A matplotlib Artist.
+    :return: The approximate size in bytes.
+    """
+    nbytes = 0
+    if hasattr(artist, 'get_xydata'):  # Line2D
+        nbytes += np.asarray(artist.get_xydata()).nbytes
+    if hasattr(artist, 'get_coordinates'):  # QuadMesh; get_paths would build one path per cell
+        nbytes += np.asarray(artist.get_coordinates()).nbytes
+    elif hasattr(artist, 'get_paths'):  # Collections, e.g. contour LineCollections
+        nbytes += sum(path.vertices.nbytes for path in artist.get_paths())
+    if hasattr(artist, 'get_offsets'):
+        nbytes += np.asarray(artist.get_offsets()).nbytes
+    if hasattr(artist, 'get_array'):  # Colour-mapped meshes and images
+        array = artist.get_array()
+        if array is not None:
+            nbytes += np.asarray(array).nbytes
+    return nbytes
+
+
+def figure_nbytes(figure):
+    """
+    Approximates the memory held by a rendered figure: the data of its artists
+    plus the RGBA buffer the Agg canvas renders into.
+
+    :param figure: A matplotlib Figure.
+    :return: The approximate size in bytes.
+    """
+    nbytes = sum(artist_nbytes(artist) for ax in figure.axes for artist in ax.get_children())
+    canvas = figure.canvas
+    if canvas is not None:
+        width, height = canvas.get_width_height()
+        ratio = getattr(canvas, 'device_pixel_ratio', 1) or 1
+        nbytes += int(width * height * ratio * ratio * 4)
+    return nbytes
+
+
+class MemoryAccountant:
+    """
+    Reports the bytes held by the major data structures of a tool and warns when
+    they exceed a budget.
+
+    Structures are registered with a function returning either their size in
+    bytes or the object itself, which is then sized with estimate_nbytes.
+    Measurements are written to the 'cpt.memory' logger when the total changed
+    noticeably; exceeding the budget is logged as a warning once, until the
+    total drops back below it.
+    """
+
+    def __init__(self, budget_bytes=DEFAULT_MEMORY_BUDGET, log_path=None):
+        """
+        Initializes the MemoryAccountant instance.
+
+        :param budget_bytes: The budget of the accounted structures in bytes. Default is DEFAULT_MEMORY_BUDGET.
+        :param log_path: Also append the log to this file. Default is None (the 'cpt.memory' logger only).
+        """
+        self.budget_bytes = budget_bytes
+        self.log_path = log_path
+        self.over_budget = False
+        self._measures = {}  # name -> function returning bytes or the structure
+        self._last_logged_total = None
+        if log_path:
+            add_log_file(log_path)
+
+    def register(self, name, measure):
+        """
+        :param name: The structure name shown in reports, e.g. 'integrated_data_ori'.
+        :param measure: A function returning the size in bytes, or the structure to size.
+        """
+        self._measures[name] = measure
+
+    def unregister(self, name):
+        self._measures.pop(name, None)
+
+    def set_budget(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.over_budget = False  # Warn again against the new budget
+
+    def measure(self):
+        """
+        Sizes every registered structure.
+
+        :return: A report dictionary with 'rows' (a list of (name, bytes), largest first),
+                 'total', 'budget' and 'process', the resident memory of the whole
+                 process, or None if psutil is not installed.
+        """
+        rows = []
+        for name, measure in list(self._measures.items()):
+            try:
+                value = measure()
+                nbytes = value if isinstance(value, (int, np.integer)) else estimate_nbytes(value)
+            except Exception as e:  # A structure being replaced meanwhile must not break the report
+                print(f"Cannot measure {name}: {e}")
+                nbytes = 0
+            rows.append((name, int(nbytes)))
+        rows.sort(key=lambda row: row[1], reverse=True)
+        process = psutil.Process().memory_info().rss if psutil is not None else None
+        return {'rows': rows, 'total': sum(nbytes for _, nbytes in rows), 'budget': self.budget_bytes,
+                'process': process}
+
+    def check(self):
+        """
+        Measures, logs the report if the total changed noticeably and warns on exceeding the budget.
+
+        :return: The report, see measure, with 'over_budget' added.
+        """
+        report = self.measure()
+        total = report['total']
+        last = self._last_logged_total
+        if last is None or abs(total - last) > LOG_CHANGE_RATIO * max(last, 1):
+            logger.info(format_report(report))
+            self._last_logged_total = total
+        over_budget = self.budget_bytes is not None and total > self.budget_bytes
+        if over_budget and not self.over_budget:
+            largest = ', '.join(f"{name} {format_bytes(nbytes)}" for name, nbytes in report['rows'][:3])
+            logger.warning(f"Loaded data uses {format_bytes(total)}, over the budget of "
+                           f"{format_bytes(self.budget_bytes)}. Largest: {largest}")
+        self.over_budget = over_budget
+        report['over_budget'] = over_budget
+        return report
+
+
+def format_report(report):
+    # One line per structure, for the log
+    lines = [f"Accounted {format_bytes(report['total'])} of a {format_bytes(report['budget'])} budget"
+             + (f", process {format_bytes(report['process'])}" if report['process'] is not None else "")]
+    lines += [f"  {name}: {format_bytes(nbytes)}" for name, nbytes in report['rows']]
+    return '\n'.join(lines)
+
+
+def add_log_file(log_path):
+    # Appends the memory log to a file; adding the same file twice is a no-op
+    path = os.path.abspath(log_path)
+    for handler in logger.handlers:
+        if isinstance(handler, logging.FileHandler) and handler.baseFilename == path:
+            return
+    try:
+        handler = logging.FileHandler(path, encoding='utf-8')
+    except OSError as e:
+        print(f"Cannot open the memory log {path}: {e}")
+        return
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
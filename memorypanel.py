@@ -0,0 +1,106 @@
+from PyQt5.QtWidgets import (QDockWidget, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QTableWidget,
+                             QTableWidgetItem, QHeaderView, QDoubleSpinBox)
+from PyQt5.QtCore import Qt, QTimer
+from memoryaccounting import format_bytes
+
+REFRESH_INTERVAL_MS = 2000  # Refresh period while the panel is visible
+CHECK_INTERVAL_MS = 30000  # Budget check period while the panel is hidden
+
+
+class MemoryPanel(QDockWidget):
+    """
+    A dockable panel listing the bytes held by each structure registered with a
+    MemoryAccountant. It refreshes while visible and checks the budget less often
+    while hidden; both go through MemoryAccountant.check, so they also log and
+    warn about the budget.
+    """
+
+    def __init__(self, accountant, parent=None):
+        """
+        Initializes the MemoryPanel instance.
+
+        :param accountant: The MemoryAccountant to report.
+        :param parent: The main window. Budget warnings are also shown in its status bar.
+        """
+        super().__init__("Memory Usage", parent)
+        self.setObjectName("MemoryPanel")
+        self.accountant = accountant
+        self.main_window = parent
+
+        self.totalLabel = QLabel("", self)
+        self.table = QTableWidget(0, 2, self)
+        self.table.setHorizontalHeaderLabels(['Structure', 'Size'])
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+
+        self.budgetSpinBox = QDoubleSpinBox(self)
+        self.budgetSpinBox.setRange(0.1, 1024)
+        self.budgetSpinBox.setDecimals(1)
+        self.budgetSpinBox.setSuffix(" GB")
+        self.budgetSpinBox.setValue(accountant.budget_bytes / 1024 ** 3)
+        self.budgetSpinBox.valueChanged.connect(self.on_budget_changed)
+        refresh_button = QPushButton("Refresh", self)
+        refresh_button.clicked.connect(self.refresh)
+        controls = QHBoxLayout()
+        controls.addWidget(QLabel("Budget", self))
+        controls.addWidget(self.budgetSpinBox)
+        controls.addWidget(refresh_button)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.totalLabel)
+        layout.addWidget(self.table)
+        layout.addLayout(controls)
+        if accountant.log_path:
+            log_label = QLabel(f"Log: {accountant.log_path}", self)
+            log_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+            layout.addWidget(log_label)
+        widget = QWidget(self)
+        widget.setLayout(layout)
+        self.setWidget(widget)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.check)
+        self.timer.start(CHECK_INTERVAL_MS)
+        self.visibilityChanged.connect(self.on_visibility_changed)
+
+    def on_visibility_changed(self, visible):
+        # Measuring walks every structure, so it only runs often while the panel is shown
+        if visible:
+            self.refresh()
+        self.timer.start(REFRESH_INTERVAL_MS if visible else CHECK_INTERVAL_MS)
+
+    def check(self):
+        # Called periodically and after loading data
+        if self.isVisible():
+            return self.refresh()
+        report = self.accountant.check()
+        self.show_budget_warning(report)
+        return report
+
+    def on_budget_changed(self, value):
+        self.accountant.set_budget(int(value * 1024 ** 3))
+        self.refresh()
+
+    def refresh(self):
+        report = self.accountant.check()
+        self.table.setRowCount(len(report['rows']))
+        for i, (name, nbytes) in enumerate(report['rows']):
+            self.table.setItem(i, 0, QTableWidgetItem(name))
+            size_item = QTableWidgetItem(format_bytes(nbytes))
+            size_item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+            self.table.setItem(i, 1, size_item)
+
+        text = f"Accounted: {format_bytes(report['total'])} of {format_bytes(report['budget'])}"
+        if report['process'] is not None:
+            text += f" (whole process: {format_bytes(report['process'])})"
+        self.totalLabel.setText(text)
+        self.totalLabel.setStyleSheet("color: red;" if report['over_budget'] else "")
+        self.show_budget_warning(report)
+        return report
+
+    def show_budget_warning(self, report):
+        if report['over_budget'] and self.main_window is not None:
+            self.main_window.statusBar().showMessage(
+                f"Memory budget exceeded: {format_bytes(report['total'])} of {format_bytes(report['budget'])}. "
+                f"See Help > Memory usage.", CHECK_INTERVAL_MS)
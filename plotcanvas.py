@@ -2,7 +2,9 @@ from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
 from PyQt5.QtWidgets import QSizePolicy, QVBoxLayout, QWidget, QAction
 from matplotlib.figure import Figure
+from matplotlib.collections import LineCollection
 import numpy as np
+from tracing import traced, span
 
 class CustomNavigationToolbar(NavigationToolbar):
     def __init__(self, canvas, parent, coordinates=True):
@@ -73,6 +75,12 @@ class PlotCanvas(FigureCanvas):
         self.initHover()
 
 
+    def draw(self):
+        # Every render of the figure, including draw_idle and the toolbar's redraws, is one span
+        with span('canvas draw', 'render'):
+            super().draw()
+
+
     def store_initial_limits(self):
         """
         Store the initial limits for all axes to enable resetting to this state.
@@ -99,15 +107,18 @@ class PlotCanvas(FigureCanvas):
             for ax in self.axes
         }
 
-    def plot(self, datax, datay, subplot_index=0, **kwargs):
+    @traced('add line', 'render')
+    def plot(self, datax, datay, subplot_index=0, redraw=True, **kwargs):
         """
         Plot data on a specified subplot.
+        Pass redraw=False when plotting several lines and draw once at the end.
         """
         # Default to the first subplot if index is out of range
         ax = self.axes[subplot_index % len(self.axes)]
 
         line, = ax.plot(datax, datay, **kwargs)
-        ax.figure.canvas.draw()
+        if redraw:
+            ax.figure.canvas.draw()
         # self.store_initial_limits()
         # Store line for hover functionality
         if hasattr(line, 'set_picker'):
@@ -116,15 +127,18 @@ class PlotCanvas(FigureCanvas):
         return line
     
 
-    def loglog(self, datax, datay, subplot_index=0, **kwargs):
+    @traced('add line', 'render')
+    def loglog(self, datax, datay, subplot_index=0, redraw=True, **kwargs):
         """
         Plot data on a specified subplot.
+        Pass redraw=False when plotting several lines and draw once at the end.
         """
         # Default to the first subplot if index is out of range
         ax = self.axes[subplot_index % len(self.axes)]
 
         line, = ax.loglog(datax, datay, **kwargs)
-        ax.figure.canvas.draw()
+        if redraw:
+            ax.figure.canvas.draw()
         # self.store_initial_limits()
         # Store line for hover functionality
         if hasattr(line, 'set_picker'):
@@ -133,6 +147,40 @@ class PlotCanvas(FigureCanvas):
         return line
     
 
+    @traced('add contours', 'render')
+    def add_paths(self, paths, subplot_index=0, **kwargs):
+        """
+        Draws precomputed line paths (e.g. contour vertices) on a specified subplot
+        as a single collection, without triggering a redraw.
+
+        Parameters:
+        - paths: A list of (N, 2) arrays of vertices in data coordinates.
+        - subplot_index: Index of the subplot to draw on. Defaults to 0.
+        - **kwargs: Keyword arguments passed to LineCollection, e.g. colors and linewidths.
+        """
+        ax = self.axes[subplot_index % len(self.axes)]
+        collection = LineCollection(paths, **kwargs)
+        ax.add_collection(collection, autolim=False)
+        return collection
+
+
+    @traced('add density', 'render')
+    def add_density(self, x_edges, y_edges, counts, subplot_index=0, **kwargs):
+        """
+        Draws binned sample counts (e.g. a 2D histogram) on a specified subplot as
+        a mesh, without triggering a redraw. Empty bins are left transparent.
+
+        Parameters:
+        - x_edges, y_edges: Bin edges along each axis, in data coordinates.
+        - counts: An (nx, ny) array of counts per bin.
+        - subplot_index: Index of the subplot to draw on. Defaults to 0.
+        - **kwargs: Keyword arguments passed to pcolormesh, e.g. cmap and alpha.
+        """
+        ax = self.axes[subplot_index % len(self.axes)]
+        counts = np.ma.masked_equal(np.asarray(counts).T, 0)
+        return ax.pcolormesh(x_edges, y_edges, counts, **kwargs)
+
+
     def highlight_y_region(self, ymin, ymax, subplot_index=0, color='yellow', alpha=0.3):
         """
         Highlights a horizontal region across the entire x-range of a subplot.
@@ -168,6 +216,7 @@ class PlotCanvas(FigureCanvas):
         ax.axhline(y=y, **kwargs)
     
 
+    @traced('clear plot', 'render')
     def clear_plot(self):
         """
         Clears the plot and optionally resets the axes to their initial state.
@@ -0,0 +1,80 @@
+import numpy as np
+
+# Random-field parameters in the column order of the TMCMC sample matrix x
+PARAM_NAMES = ['sig', 'sofv', 'sofh', 'nuv', 'nuh', 'sigt', 'sofvt', 'sofht']
+# sig and sigt are sampled as log-precisions, sqrt(1/exp(x)) = exp(-x/2); the others as log-values
+LOG_SCALE = np.array([-0.5, 1.0, 1.0, 1.0, 1.0, -0.5, 1.0, 1.0])
+DEFAULT_QUANTILES = (2.5, 97.5)
+
+
+def transform_samples(x):
+    """
+    Transforms raw TMCMC samples to physical parameter values in a single pass.
+
+    :param x: The (N, 8) sample matrix, or a (F, N, 8) stack of sample matrices.
+    :return: An array of the same shape with sig/sigt as sqrt(1/exp(x)) and the others as exp(x).
+    """
+    return np.exp(np.asarray(x, dtype=float) * LOG_SCALE)
+
+
+def transform_bounds(x_low, x_up):
+    """
+    Transforms the prior bounds x_low/x_up with the same mapping as the samples.
+    As in the plots, sig/sigt keep their position even though the mapping reverses their order.
+
+    :return: A tuple (xlim_low, xlim_up) of 1D arrays of length 8.
+    """
+    return (transform_samples(np.ravel(x_low)), transform_samples(np.ravel(x_up)))
+
+
+def posterior_stats(samples, quantiles=DEFAULT_QUANTILES):
+    """
+    Computes the means and quantiles of every parameter with one percentile call.
+
+    :param samples: Transformed samples of shape (..., N, 8); the sample axis is the second to last.
+    :param quantiles: Percentiles to compute. Default is (2.5, 97.5).
+    :return: A tuple (means, percentiles) with shapes (..., 8) and (len(quantiles), ..., 8).
+    """
+    samples = np.asarray(samples, dtype=float)
+    if np.isnan(samples).any():
+        return np.nanmean(samples, axis=-2), np.nanpercentile(samples, quantiles, axis=-2)
+    return samples.mean(axis=-2), np.percentile(samples, quantiles, axis=-2)
+
+
+def summarize_samples(x, quantiles=DEFAULT_QUANTILES):
+    """
+    Transforms raw samples and returns per-parameter statistics keyed by name.
+
+    :param x: The raw (N, 8) sample matrix.
+    :return: A dictionary {'mean': {param: value}, 'p<q>': {param: value}, ...}.
+    """
+    means, percentiles = posterior_stats(transform_samples(x), quantiles)
+    return stats_to_dict(means, percentiles, quantiles)
+
+
+def stats_to_dict(means, percentiles, quantiles=DEFAULT_QUANTILES):
+    # Quantile keys follow the sidecar naming, e.g. 'p2.5' and 'p97.5'
+    result = {'mean': dict(zip(PARAM_NAMES, map(float, means)))}
+    for q, values in zip(quantiles, percentiles):
+        result[f'p{q:g}'] = dict(zip(PARAM_NAMES, map(float, values)))
+    return result
+
+def batch_summarize_samples(x_list, quantiles=DEFAULT_QUANTILES):
+    """
+    Summarizes the samples of many result files. Files with the same number of
+    samples are stacked and reduced together, so a batch of TMCMC runs with equal
+    sample counts costs one transform and one percentile call.
+
+    :param x_list: A list of raw (N_i, 8) sample matrices.
+    :return: A list of dictionaries as returned by summarize_samples, in input order.
+    """
+    results = [None] * len(x_list)
+    groups = {}
+    for i, x in enumerate(x_list):
+        groups.setdefault(np.shape(x), []).append(i)
+    for indices in groups.values():
+        stack = transform_samples(np.stack([x_list[i] for i in indices]))
+        means, percentiles = posterior_stats(stack, quantiles)
+        for j, i in enumerate(indices):
+            results[i] = stats_to_dict(means[j], percentiles[:, j], quantiles)
+    return results
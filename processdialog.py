@@ -1,19 +1,48 @@
-from PyQt5.QtWidgets import QMainWindow, QComboBox, QApplication, QDialog, QProgressBar, QVBoxLayout
-from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QMainWindow, QComboBox, QApplication, QDialog, QProgressBar, QVBoxLayout, QLabel, QPushButton
+from PyQt5.QtCore import Qt, pyqtSignal
 import os
 
 class ProgressDialog(QDialog):
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("Loading Files")
-        self.setModal(True)
+    canceled = pyqtSignal()
+
+    def __init__(self, title="Loading Files", modal=True, cancelable=False, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(title)
+        self.setModal(modal)
         self.progressBar = QProgressBar(self)
+        self.messageLabel = QLabel("", self)
         layout = QVBoxLayout()
+        layout.addWidget(self.messageLabel)
         layout.addWidget(self.progressBar)
+        self.cancelable = cancelable
+        if cancelable:
+            self.cancelButton = QPushButton("Cancel", self)
+            self.cancelButton.clicked.connect(self.reject)
+            layout.addWidget(self.cancelButton)
         self.setLayout(layout)
         self.progressBar.setMaximum(100)  # Assume 100% as the completion value
-        
+
+    def set_busy(self):
+        # Shows an animated bar until the first progress update
+        self.progressBar.setRange(0, 0)
+
     def update_progress(self, value):
+        if self.progressBar.maximum() == 0:
+            self.progressBar.setRange(0, 100)
         self.progressBar.setValue(value)
         if value >= 100:
-            self.accept()  # Close the dialog when progress reaches 100%
\ No newline at end of file
+            self.accept()  # Close the dialog when progress reaches 100%
+
+    def update_count(self, done, total):
+        # Convenience slot for signals reporting (items done, items total)
+        self.messageLabel.setText(f"{done} / {total}")
+        self.update_progress(int(100 * done / total) if total else 100)
+
+    def set_message(self, text):
+        self.messageLabel.setText(text)
+
+    def reject(self):
+        # Closing the dialog (Cancel button, Esc or the window close button) cancels the task
+        if self.cancelable:
+            self.canceled.emit()
+        super().reject()
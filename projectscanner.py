@@ -0,0 +1,137 @@
+import os
+
+# Project layout: <project>/.../Cluster X/{Extracted, results_TMCMC}
+CLUSTER_PREFIX = 'Cluster '
+EXTRACTED_FOLDER_NAME = 'Extracted'
+RESULTS_FOLDER_NAME = 'results_TMCMC'
+CLEAN_EXPORT_FILE_NAME = 'clean_data_from_python.mat'  # Written by the CPT Data Editor into the cluster folder
+
+
+def scandir_walk(top):
+    """
+    Walks a directory tree like os.walk (top-down) but yields os.DirEntry objects,
+    whose type and, on Windows, size and modification time come with the directory
+    listing instead of one stat call per file. Removing entries from the yielded
+    dirs list prunes them from the walk.
+
+    :param top: The directory to walk.
+    :return: A generator of (path, dirs, files) with dirs and files as lists of os.DirEntry.
+    """
+    stack = [top]
+    while stack:
+        path = stack.pop()
+        dirs, files = [], []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs.append(entry)
+                    else:
+                        files.append(entry)
+        except OSError as e:
+            print(f"Cannot list '{path}': {e}")
+            continue
+        yield path, dirs, files
+        stack.extend(entry.path for entry in reversed(dirs))
+
+
+def is_cluster_folder(name):
+    return name.startswith(CLUSTER_PREFIX)
+
+
+def iter_cluster_folders(project_folder):
+    """
+    Yields the cluster folders of a project in walk order. The walk does not
+    descend into cluster folders, nor into hidden folders or stray Extracted and
+    results_TMCMC folders outside a cluster.
+
+    :param project_folder: The project ("Clusters") folder, or a single cluster folder.
+    :return: A generator of cluster folder paths.
+    """
+    if is_cluster_folder(os.path.basename(os.path.normpath(project_folder))):
+        yield project_folder
+        return
+    for _, dirs, _ in scandir_walk(project_folder):
+        descend = []
+        for entry in dirs:
+            if is_cluster_folder(entry.name):
+                yield entry.path
+            elif not entry.name.startswith('.') and entry.name not in (EXTRACTED_FOLDER_NAME, RESULTS_FOLDER_NAME):
+                descend.append(entry)
+        dirs[:] = descend
+
+
+def iter_cluster_files(project_folder, folder_name, extension):
+    """
+    Yields the files with the given extension directly inside the folder_name
+    subfolder of every cluster, while the scan continues.
+
+    :param project_folder: The project ("Clusters") folder.
+    :param folder_name: The cluster subfolder, e.g. RESULTS_FOLDER_NAME.
+    :param extension: The file extension, e.g. '.mat'.
+    :return: A generator of os.DirEntry objects.
+    """
+    for cluster_folder in iter_cluster_folders(project_folder):
+        try:
+            with os.scandir(os.path.join(cluster_folder, folder_name)) as entries:
+                files = sorted((entry for entry in entries
+                                if entry.name.endswith(extension) and entry.is_file()), key=lambda entry: entry.name)
+        except FileNotFoundError:
+            continue  # Cluster not analyzed (or extracted) yet
+        except OSError as e:
+            print(f"Cannot list '{os.path.join(cluster_folder, folder_name)}': {e}")
+            continue
+        yield from files
+
+
+def iter_result_files(project_folder, extension='.mat'):
+    """
+    Yields the paths of the TMCMC result files (<Cluster>/results_TMCMC/*.mat) of a project.
+    """
+    for entry in iter_cluster_files(project_folder, RESULTS_FOLDER_NAME, extension):
+        yield entry.path
+
+
+def iter_extracted_files(project_folder, extension='.csv'):
+    """
+    Yields the paths of the extracted CPT files (<Cluster>/Extracted/*.csv) of a project.
+    """
+    for entry in iter_cluster_files(project_folder, EXTRACTED_FOLDER_NAME, extension):
+        yield entry.path
+
+
+def snapshot_cluster(cluster_folder):
+    """
+    Records the size and modification time of the files of one cluster that the
+    tools react to: its result files and its cleaned export.
+
+    :param cluster_folder: The cluster folder.
+    :return: A dictionary {path: (size, mtime_ns)}.
+    """
+    files = {}
+    for entry in iter_cluster_files(cluster_folder, RESULTS_FOLDER_NAME, '.mat'):
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue  # Deleted since it was listed
+        files[entry.path] = (stat.st_size, stat.st_mtime_ns)
+    export_path = os.path.join(cluster_folder, CLEAN_EXPORT_FILE_NAME)
+    try:
+        stat = os.stat(export_path)
+        files[export_path] = (stat.st_size, stat.st_mtime_ns)
+    except OSError:
+        pass
+    return files
+
+
+def snapshot_project(project_folder, cluster_folders=None):
+    """
+    Takes snapshot_cluster of every cluster of a project.
+
+    :param project_folder: The project ("Clusters") folder.
+    :param cluster_folders: Only snapshot these clusters. Default is None, which scans the project.
+    :return: A dictionary {cluster_folder: {path: (size, mtime_ns)}}.
+    """
+    if cluster_folders is None:
+        cluster_folders = iter_cluster_folders(project_folder)
+    return {cluster_folder: snapshot_cluster(cluster_folder) for cluster_folder in cluster_folders}
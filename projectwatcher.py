@@ -0,0 +1,191 @@
+import os
+from PyQt5.QtCore import QObject, QThread, QTimer, QFileSystemWatcher, pyqtSignal
+from projectscanner import snapshot_project, RESULTS_FOLDER_NAME, CLEAN_EXPORT_FILE_NAME
+
+
+class SnapshotThread(QThread):
+    """
+    Takes a snapshot of the watched files of a project, or of some of its
+    clusters, off the GUI thread. The result is left in the snapshot attribute.
+    """
+
+    def __init__(self, project_folder, cluster_folders=None, parent=None):
+        """
+        Initializes the SnapshotThread instance.
+
+        :param project_folder: The project ("Clusters") folder.
+        :param cluster_folders: Only snapshot these clusters. Default is None, which scans the project.
+        :param parent: The parent QObject. Default is None.
+        """
+        super().__init__(parent)
+        self.project_folder = project_folder
+        self.cluster_folders = cluster_folders
+        self.snapshot = {}
+
+    def run(self):
+        self.snapshot = snapshot_project(self.project_folder, self.cluster_folders)
+
+
+class ProjectWatcher(QObject):
+    """
+    Reports result files and cleaned exports that are added to or changed in a
+    project while it is open.
+
+    Folder change notifications come from QFileSystemWatcher, which uses inotify
+    on Linux and the native notification APIs on Windows and macOS. If a folder
+    cannot be watched, or use_native is False, the project is polled every
+    poll_interval instead; with native notifications it is still polled at a
+    slower rate to catch missed events.
+
+    Snapshots are taken on a background thread. A file is only reported once its
+    size and modification time are the same in two snapshots taken settle_interval
+    apart, so files MATLAB is still writing are not picked up half written.
+    """
+    result_files_changed = pyqtSignal(list)  # [mat_path, ...] new or changed result files
+    clean_exports_changed = pyqtSignal(list)  # [path, ...] new or changed clean_data_from_python.mat files
+
+    def __init__(self, project_folder, poll_interval=5000, settle_interval=2000, use_native=True, parent=None):
+        """
+        Initializes the ProjectWatcher instance. Call start() to begin watching.
+
+        :param project_folder: The project ("Clusters") folder.
+        :param poll_interval: Milliseconds between two polls of the whole project. Default is 5000.
+        :param settle_interval: Milliseconds a changed file must stay unchanged before it is reported. Default is 2000.
+        :param use_native: Use native change notifications where available. Default is True.
+        :param parent: The parent QObject. Default is None.
+        """
+        super().__init__(parent)
+        self.project_folder = project_folder
+        self.poll_interval = poll_interval
+        self.settle_interval = settle_interval
+        self.use_native = use_native
+
+        self._observed = {}  # path -> (size, mtime_ns) in the latest snapshot
+        self._reported = {}  # path -> (size, mtime_ns) when last reported, or at start
+        self._baseline_pending = True
+        self._dirty_clusters = set()
+        self._full_rescan = False
+        self._rerun = False
+        self._thread = None
+        self._watch_map = {}  # watched folder -> cluster folder, or None for folders above the clusters
+        self._unwatchable = set()  # Folders the native watcher refused; covered by polling
+
+        self._fs_watcher = None
+        if use_native:
+            self._fs_watcher = QFileSystemWatcher(self)
+            self._fs_watcher.directoryChanged.connect(self._on_directory_changed)
+        self._settle_timer = QTimer(self)
+        self._settle_timer.setSingleShot(True)
+        self._settle_timer.timeout.connect(self._request_snapshot)
+        self._poll_timer = QTimer(self)
+        self._poll_timer.timeout.connect(self._poll)
+
+    def start(self):
+        # The first snapshot is the baseline; only later changes are reported
+        self._baseline_pending = True
+        self._request_snapshot()
+
+    def stop(self):
+        self._settle_timer.stop()
+        self._poll_timer.stop()
+        if self._fs_watcher is not None and self._watch_map:
+            self._fs_watcher.removePaths(list(self._watch_map))
+        self._watch_map = {}
+        if self._thread is not None:
+            thread, self._thread = self._thread, None  # Its result is dropped
+            thread.wait()
+
+    def _poll(self):
+        self._full_rescan = True
+        self._request_snapshot()
+
+    def _on_directory_changed(self, path):
+        cluster_folder = self._watch_map.get(path)
+        if cluster_folder is None:
+            self._full_rescan = True  # A cluster may have been added
+        else:
+            self._dirty_clusters.add(cluster_folder)
+        self._settle_timer.start(self.settle_interval)
+
+    def _request_snapshot(self):
+        if self._thread is not None:
+            self._rerun = True  # Taken when the running snapshot finishes
+            return
+        full = self._full_rescan or self._baseline_pending
+        if not full and not self._dirty_clusters:
+            return
+        cluster_folders = None if full else sorted(self._dirty_clusters)
+        self._full_rescan = False
+        self._dirty_clusters = set()
+        thread = SnapshotThread(self.project_folder, cluster_folders, parent=self)
+        thread.finished.connect(lambda thread=thread: self._on_snapshot(thread))
+        self._thread = thread
+        thread.start()
+
+    def _on_snapshot(self, thread):
+        if thread is not self._thread:
+            return
+        self._thread = None
+        if self._baseline_pending:
+            self._baseline_pending = False
+            for files in thread.snapshot.values():
+                self._observed.update(files)
+                self._reported.update(files)
+            self._watch(thread.snapshot)
+            native = self._fs_watcher is not None and not self._unwatchable
+            self._poll_timer.start(self.poll_interval * 6 if native else self.poll_interval)
+        else:
+            self._apply(thread.snapshot)
+        if self._rerun:
+            self._rerun = False
+            self._request_snapshot()
+
+    def _apply(self, snapshot):
+        results, exports = [], []
+        for cluster_folder, files in snapshot.items():
+            unsettled = False
+            for path, stat in files.items():
+                if self._reported.get(path) == stat:
+                    self._observed[path] = stat
+                    continue
+                if self._observed.get(path) == stat:
+                    self._reported[path] = stat
+                    if os.path.basename(path) == CLEAN_EXPORT_FILE_NAME:
+                        exports.append(path)
+                    else:
+                        results.append(path)
+                else:
+                    unsettled = True
+                self._observed[path] = stat
+            if unsettled:
+                self._dirty_clusters.add(cluster_folder)
+        self._watch(snapshot)
+        if self._dirty_clusters:
+            self._settle_timer.start(self.settle_interval)
+        if results:
+            self.result_files_changed.emit(sorted(results))
+        if exports:
+            self.clean_exports_changed.emit(sorted(exports))
+
+    def _watch(self, snapshot):
+        # Watch the project, the folders holding clusters, each cluster and its results folder
+        if self._fs_watcher is None:
+            return
+        wanted = {self.project_folder: None}
+        for cluster_folder in snapshot:
+            wanted.setdefault(os.path.dirname(cluster_folder), None)
+            wanted[cluster_folder] = cluster_folder
+            results_folder = os.path.join(cluster_folder, RESULTS_FOLDER_NAME)
+            if os.path.isdir(results_folder):
+                wanted[results_folder] = cluster_folder
+        new_paths = [path for path in wanted if path not in self._watch_map and path not in self._unwatchable]
+        if not new_paths:
+            return
+        self._watch_map.update((path, wanted[path]) for path in new_paths)
+        failed = self._fs_watcher.addPaths(new_paths)
+        for path in failed:
+            print(f"Cannot watch '{path}'; polling it instead")
+            self._watch_map.pop(path, None)
+            self._unwatchable.add(path)
+        if failed and self._poll_timer.isActive():
+            self._poll_timer.start(self.poll_interval)
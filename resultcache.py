@@ -0,0 +1,192 @@
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+import numpy as np
+
+
+def estimate_nbytes(value):
+    """
+    Approximates the memory held by a cached value. NumPy arrays dominate the
+    size of processed result files, so containers are summed recursively and
+    everything else falls back to sys.getsizeof.
+
+    :param value: The object to measure.
+    :return: The approximate size in bytes.
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(estimate_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_nbytes(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    """
+    A thread-safe least-recently-used cache bounded by a memory budget.
+
+    Values are produced on demand by the loader function. Keys can be prefetched
+    on a background thread. Every load is tracked by a Future, so a get() or
+    prefetch() for a key that is still loading waits for that load instead of
+    starting a second one. A load whose key is discarded meanwhile is not stored.
+    """
+
+    def __init__(self, loader, max_bytes=512 * 1024 ** 2, max_workers=1):
+        """
+        Initializes the ResultCache instance.
+
+        :param loader: A function taking a key and returning the value to cache.
+        :param max_bytes: The memory budget in bytes. Default is 512 MB.
+        :param max_workers: Number of background threads used for prefetching. Default is 1.
+        """
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()  # key -> (value, nbytes), oldest first
+        self._pending = {}  # key -> Future of an in-flight load
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key):
+        """
+        Returns the value for key, loading it if it is not cached yet.
+
+        :param key: The cache key (the .mat file path).
+        :return: The cached or freshly loaded value.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+            future = self._pending.get(key)
+            load = future is None
+            if load:
+                future = self._pending[key] = Future()
+
+        if load:
+            self._load_and_store(key, future)
+        return future.result()
+
+    def peek(self, key):
+        """
+        Returns the cached value for key without loading it or updating its recency.
+
+        :param key: The cache key.
+        :return: The cached value, or None if it is not cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def is_loading(self, key):
+        """
+        Returns True if key is currently being loaded.
+        """
+        with self._lock:
+            return key in self._pending
+
+    def prefetch(self, keys):
+        """
+        Schedules background loading of keys that are neither cached nor in flight.
+
+        :param keys: An iterable of cache keys.
+        """
+        with self._lock:
+            for key in keys:
+                if key in self._entries or key in self._pending:
+                    continue
+                future = self._pending[key] = Future()
+                self._executor.submit(self._load_and_store, key, future)
+
+    def discard(self, key):
+        """
+        Drops the cached value for key, e.g. because the file changed on disk. A load
+        of key in flight still completes for its callers, but its value is not stored
+        and the next get() loads key again.
+
+        :param key: The cache key.
+        """
+        with self._lock:
+            self._pending.pop(key, None)
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.current_bytes -= entry[1]
+
+    def resize(self, key):
+        """
+        Re-measures the cached value for key after the caller added to it, e.g. plot
+        data derived on demand, evicting entries if the cache is now over budget.
+
+        :param key: The cache key. Nothing happens if it is not cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            nbytes = estimate_nbytes(entry[0])
+            self._entries[key] = (entry[0], nbytes)
+            self.current_bytes += nbytes - entry[1]
+            self._evict(keep=key)
+
+    def set_max_bytes(self, max_bytes):
+        """
+        Changes the memory budget, evicting entries if the cache is now over budget.
+
+        :param max_bytes: The new memory budget in bytes.
+        """
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        """
+        Drops all cached entries. Loads in flight are dropped as in discard.
+        """
+        with self._lock:
+            self._pending.clear()
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def _load_and_store(self, key, future):
+        # Loads key and resolves future; the value is only stored if future is still
+        # the pending load of key, i.e. the key was not discarded meanwhile
+        try:
+            value = self.loader(key)
+            nbytes = estimate_nbytes(value)
+        except BaseException as e:
+            with self._lock:
+                if self._pending.get(key) is future:
+                    del self._pending[key]
+            future.set_exception(e)
+            return
+        with self._lock:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+                if key in self._entries:
+                    self.current_bytes -= self._entries.pop(key)[1]
+                self._entries[key] = (value, nbytes)
+                self.current_bytes += nbytes
+                self._evict(keep=key)
+        future.set_result(value)
+
+    def _evict(self, keep=None):
+        # Drop the least recently used entries until the budget is met, never
+        # evicting the entry that was just stored.
+        while self.current_bytes > self.max_bytes and self._entries:
+            oldest = next(iter(self._entries))
+            if oldest == keep:
+                if len(self._entries) == 1:
+                    break
+                self._entries.move_to_end(oldest)
+                continue
+            self.current_bytes -= self._entries.pop(oldest)[1]
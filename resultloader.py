@@ -0,0 +1,152 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from matreader import read_result_file
+from posteriorstats import PARAM_NAMES, transform_samples, transform_bounds, posterior_stats, stats_to_dict
+from resultsummary import summarize_processed_data
+from projectscanner import iter_result_files
+import tracing
+from tracing import traced, span
+
+
+def extract_data(x, x_low_GP, x_up_GP):
+    # Transform all 8 parameters at once; rows of the (8, N) result are contiguous
+    samples = transform_samples(x).T.copy()
+    xlim_low, xlim_up = transform_bounds(x_low_GP, x_up_GP)
+
+    # Package results into a dictionary
+    data_dict = dict(zip(PARAM_NAMES, samples))
+    data_dict.update({
+        'xlim_low': xlim_low,
+        'xlim_up': xlim_up,
+        'stats': stats_to_dict(*posterior_stats(samples.T)),
+    })
+
+    return data_dict
+
+
+@traced('load result file', 'io')
+def load_result_file(mat_path, sample_slice=None):
+    """
+    Loads a TMCMC result file and derives the plotted parameters and geometry metrics.
+    This function has no Qt dependencies so it can run on worker threads and processes.
+
+    :param mat_path: The path of the .mat result file.
+    :param sample_slice: An optional slice over the posterior samples, e.g. for thinning.
+    :return: A dictionary with the transformed samples, prior limits, raw geometry and metrics.
+    """
+    data = read_result_file(mat_path, sample_slice=sample_slice)
+    x, x_low_GP, x_up_GP = data['x'], data['x_low'], data['x_up']
+    X, Y, z, temp_z, temp_h = data['X'], data['Y'], data['z'], data['temp_z'], data['temp_h']
+    processed_data = extract_data(x, x_low_GP, x_up_GP)
+
+    processed_data['X'] = X
+    processed_data['Y'] = Y
+    processed_data['z'] = z
+    processed_data['temp_z'] = temp_z
+    processed_data['temp_h'] = temp_h
+
+    # Calculate additional metrics
+    no_of_soundings = len(X)
+    length = np.max(z) - np.min(z)
+    min_dists = sorted(np.diag(temp_h, -1))[:3]  # Take the first 3 minimum distances
+    max_dist = np.max(np.diag(temp_h, -1))
+
+    # Store in processed_data
+    processed_data.update({
+        "no_of_soundings": no_of_soundings,
+        "length": length,
+        "min_dist_1": min_dists[0] if len(min_dists) > 0 else np.nan,
+        "min_dist_2": min_dists[1] if len(min_dists) > 1 else np.nan,
+        "min_dist_3": min_dists[2] if len(min_dists) > 2 else np.nan,
+        "max_dist": max_dist
+    })
+    return processed_data
+
+
+def summarize_result_file(mat_path):
+    """
+    Process pool worker: loads one result file and returns its compact summary.
+    Errors are returned rather than raised so one corrupt file does not abort a load.
+
+    :param mat_path: The path of the .mat result file.
+    :return: A tuple (mat_path, summary, error) where exactly one of summary and error is None.
+    """
+    try:
+        return mat_path, summarize_processed_data(load_result_file(mat_path)), None
+    except Exception as e:
+        return mat_path, None, f"{type(e).__name__}: {e}"
+
+
+@traced('summarize result files', 'compute')
+def summarize_result_files(task, mat_paths, max_workers=None, batch_interval=0.25):
+    """
+    Summarizes result files on a process pool; run as a tasks.Task.
+
+    Completed summaries are passed to task.emit_partial in small batches, as
+    (items, failures) with items [(mat_path, summary), ...] and failures
+    [(mat_path, error message), ...], so the receiver can add rows while the
+    remaining files are still being parsed. Canceling drops the files that have
+    not started.
+
+    :param task: The running Task.
+    :param mat_paths: The result files to summarize.
+    :param max_workers: Size of the process pool. Default is the number of CPUs.
+    :param batch_interval: Minimum seconds between two batches. Default is 0.25.
+    """
+    mat_paths = list(mat_paths)
+    total = len(mat_paths)
+    done = 0
+    items, failures = [], []
+    last_emit = time.monotonic()
+    trace_workers = tracing.is_enabled()  # Workers then send their spans back with each result
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+    try:
+        futures = [executor.submit(tracing.run_traced, summarize_result_file, mat_path) if trace_workers
+                   else executor.submit(summarize_result_file, mat_path) for mat_path in mat_paths]
+        for future in as_completed(futures):
+            if trace_workers:
+                (mat_path, summary, error), drained = future.result()
+                tracing.merge(drained)
+            else:
+                mat_path, summary, error = future.result()
+            done += 1
+            if error is None:
+                items.append((mat_path, summary))
+            else:
+                failures.append((mat_path, error))
+            if (items or failures) and (done == total or time.monotonic() - last_emit >= batch_interval):
+                task.emit_partial((items, failures))
+                items, failures = [], []
+                last_emit = time.monotonic()
+            task.report_progress(done, total)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        if items or failures:
+            task.emit_partial((items, failures))
+
+
+def scan_result_files(task, project_folder, batch_interval=0.1):
+    """
+    Lists the result files of a project; run as a tasks.Task. Paths are passed
+    to task.emit_partial in small batches while the scan continues.
+
+    :param task: The running Task.
+    :param project_folder: The project ("Clusters") folder.
+    :param batch_interval: Minimum seconds between two batches. Default is 0.1.
+    """
+    batch = []
+    last_emit = time.monotonic()
+    with span('scan result files', 'io') as scan_span:
+        found = 0
+        for mat_path in iter_result_files(project_folder):
+            task.check_canceled()
+            batch.append(mat_path)
+            found += 1
+            if time.monotonic() - last_emit >= batch_interval:
+                task.emit_partial(batch)
+                batch = []
+                last_emit = time.monotonic()
+        scan_span.set(files=found)
+    if batch:
+        task.emit_partial(batch)
@@ -0,0 +1,350 @@
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+
+PARAM_COLUMNS = ["sofv", "nuv", "sofh", "nuh", "sig", "sigt", "sofvt", "sofht"]
+METRIC_COLUMNS = ["no_of_soundings", "length", "min_dist_1", "min_dist_2", "min_dist_3", "max_dist"]
+# Values prefilled by auto-classification, kept apart from the reviewer decisions in PARAM_COLUMNS
+SUGGESTION_COLUMNS = [f"{param} suggested" for param in PARAM_COLUMNS]
+RESULT_COLUMNS = ["Site Name", "Cluster", "File Name"] + PARAM_COLUMNS + METRIC_COLUMNS + SUGGESTION_COLUMNS
+
+DB_FILE_NAME = 'results_summary.db'
+CSV_FILE_NAME = 'results_summary.csv'
+
+
+def _quote(column):
+    return '"{}"'.format(column.replace('"', '""'))
+
+
+def suggestion_column(param):
+    return f"{param} suggested"
+
+
+def _to_sql_value(value):
+    # sqlite3 accepts Python scalars only; empty cells, including empty text, become NULL
+    if value is None or (value == '' if isinstance(value, str) else pd.isna(value)):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class ResultStore:
+    """
+    The results summary table, indexed by (Cluster, File Name).
+
+    A hash index maps each key to its row label so lookups and updates do not scan
+    the table. New rows are buffered and appended with a single concat when the
+    table is next read, so adding rows one file at a time stays linear overall.
+
+    When opened on a database file, the table is persisted in SQLite (WAL mode).
+    Buffered rows are inserted in one transaction per flush and commit_row writes a
+    single row, so concurrent reviewers only ever overwrite the rows they submit.
+    """
+
+    def __init__(self, df=None, db_path=None):
+        """
+        Initializes the ResultStore instance.
+
+        :param df: An existing results table. Default is None, which creates an empty table.
+        :param db_path: An optional SQLite database the table is persisted to.
+        """
+        if df is None:
+            df = pd.DataFrame(columns=RESULT_COLUMNS)
+        df = df.reset_index(drop=True)
+        for column in RESULT_COLUMNS:
+            if column not in df.columns:
+                df[column] = np.nan
+        # Parameter cells hold either a number or a free-text description
+        df[PARAM_COLUMNS + SUGGESTION_COLUMNS] = df[PARAM_COLUMNS + SUGGESTION_COLUMNS].astype(object)
+        self.df = df
+        self._index = {}
+        self._pending_rows = []
+        self._pending_fills = []  # (cluster_name, base_file, column, value) to write on flush
+        self._pending_suggestions = []  # (cluster_name, base_file, param, value) to write on flush
+        for row_index, key in enumerate(zip(df["Cluster"], df["File Name"])):
+            self._index.setdefault(key, row_index)  # The first row wins for duplicated keys
+
+        self.db_path = db_path
+        self._conn = None
+        if db_path is not None:
+            self._conn = sqlite3.connect(db_path, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._create_table()
+
+    @classmethod
+    def from_csv(cls, csv_path):
+        """
+        Reads a results summary CSV, or creates an empty store if the file does not exist.
+
+        :param csv_path: The path of results_summary.csv.
+        """
+        if os.path.exists(csv_path):
+            return cls(pd.read_csv(csv_path))
+        return cls()
+
+    @classmethod
+    def open(cls, project_folder):
+        """
+        Opens the SQLite store of a project. On first use the table is imported
+        from an existing results_summary.csv.
+
+        :param project_folder: The project ("Clusters") folder.
+        """
+        db_path = os.path.join(project_folder, DB_FILE_NAME)
+        if os.path.exists(db_path):
+            conn = sqlite3.connect(db_path, timeout=30)
+            try:
+                df = pd.read_sql_query("SELECT * FROM results ORDER BY rowid", conn)
+            finally:
+                conn.close()
+            return cls(df, db_path=db_path)
+
+        csv_path = os.path.join(project_folder, CSV_FILE_NAME)
+        store = cls(pd.read_csv(csv_path) if os.path.exists(csv_path) else None, db_path=db_path)
+        store._insert_rows(store.df.to_dict('records'))
+        return store
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def add_row(self, cluster_name, base_file, **values):
+        """
+        Buffers a new row unless one already exists for the key.
+
+        :param cluster_name: The cluster folder name.
+        :param base_file: The .mat file name.
+        :param values: Values of the other columns; missing columns are left empty.
+        :return: True if a row was added, False if the key already existed.
+        """
+        key = (cluster_name, base_file)
+        if key in self._index:
+            return False
+        self._index[key] = len(self.df) + len(self._pending_rows)
+        self._pending_rows.append({"Cluster": cluster_name, "File Name": base_file, **values})
+        return True
+
+    def flush(self):
+        # Append all buffered rows with one concat, and persist them in one transaction
+        if self._pending_rows:
+            new_rows = pd.DataFrame(self._pending_rows, columns=self.df.columns)
+            new_rows[PARAM_COLUMNS + SUGGESTION_COLUMNS] = new_rows[PARAM_COLUMNS + SUGGESTION_COLUMNS].astype(object)
+            self.df = pd.concat([self.df, new_rows], ignore_index=True) if len(self.df) else new_rows
+            self._insert_rows(self._pending_rows)
+            self._pending_rows = []
+        if self._pending_fills:
+            self._fill_rows(self._pending_fills)
+            self._pending_fills = []
+        if self._pending_suggestions:
+            self._suggest_rows(self._pending_suggestions)
+            self._pending_suggestions = []
+
+    def get_row(self, cluster_name, base_file):
+        """
+        Returns the row of a result file as a Series, or None if it is not in the table.
+        """
+        row_index = self._locate(cluster_name, base_file)
+        if row_index is None:
+            return None
+        return self.df.loc[row_index]
+
+    def get(self, cluster_name, base_file, column):
+        row_index = self._locate(cluster_name, base_file)
+        if row_index is None:
+            return None
+        return self.df.at[row_index, column]
+
+    def set(self, cluster_name, base_file, column, value):
+        """
+        Sets one cell of the row of a result file in memory. Use commit_row to persist it.
+
+        :return: True if the row exists, False otherwise.
+        """
+        row_index = self._locate(cluster_name, base_file)
+        if row_index is None:
+            return False
+        self.df.at[row_index, column] = value
+        return True
+
+    def fill_missing(self, cluster_name, base_file, values):
+        """
+        Sets the given columns of a row only where they are currently empty.
+
+        :param values: A dictionary mapping column names to values.
+        """
+        row_index = self._locate(cluster_name, base_file)
+        if row_index is None:
+            return
+        for column, value in values.items():
+            if pd.isna(self.df.at[row_index, column]):
+                self.df.at[row_index, column] = value
+                self._pending_fills.append((cluster_name, base_file, column, value))
+
+    def suggest(self, cluster_name, base_file, values):
+        """
+        Replaces the suggestions of a row in its SUGGESTION_COLUMNS, for the parameters
+        a reviewer has not decided yet; the other undecided parameters lose any earlier
+        suggestion. The decisions are left empty, so suggestions are never mistaken for them.
+
+        :param values: A dictionary mapping parameter names to suggested values.
+        """
+        row_index = self._locate(cluster_name, base_file)
+        if row_index is None:
+            return
+        for param in PARAM_COLUMNS:
+            if pd.isna(self.df.at[row_index, param]):
+                value = values.get(param, np.nan)
+                self.df.at[row_index, suggestion_column(param)] = value
+                self._pending_suggestions.append((cluster_name, base_file, param, value))
+
+    def clear_suggestions(self, cluster_name, base_file):
+        """
+        Empties the suggestions of a row in memory, e.g. because its result file changed.
+        Use commit_row with SUGGESTION_COLUMNS to persist it.
+        """
+        row_index = self._locate(cluster_name, base_file)
+        if row_index is None:
+            return
+        for column in SUGGESTION_COLUMNS:
+            self.df.at[row_index, column] = np.nan
+
+    def commit_row(self, cluster_name, base_file, columns=PARAM_COLUMNS):
+        """
+        Persists the given columns of one row in a single transaction.
+
+        :param columns: The columns to write. Default is the eight parameter columns.
+        :return: True if the row exists, False otherwise.
+        """
+        row_index = self._locate(cluster_name, base_file)
+        if row_index is None:
+            return False
+        if self._conn is None:
+            return True
+        self.flush()
+        assignments = ", ".join(f"{_quote(column)} = ?" for column in columns)
+        values = [_to_sql_value(self.df.at[row_index, column]) for column in columns]
+        with self._conn:
+            self._conn.execute(
+                f'UPDATE results SET {assignments} WHERE "Cluster" = ? AND "File Name" = ?',
+                values + [cluster_name, base_file])
+        return True
+
+    def refresh_row(self, cluster_name, base_file):
+        """
+        Re-reads one row from the database, picking up another reviewer's submissions.
+        """
+        row_index = self._locate(cluster_name, base_file)
+        if row_index is None or self._conn is None:
+            return
+        self.flush()
+        cursor = self._conn.execute(
+            'SELECT * FROM results WHERE "Cluster" = ? AND "File Name" = ?', (cluster_name, base_file))
+        row = cursor.fetchone()
+        if row is None:
+            return
+        for description, value in zip(cursor.description, row):
+            self.df.at[row_index, description[0]] = np.nan if value is None else value
+
+    def to_dataframe(self):
+        self.flush()
+        return self.df
+
+    def to_csv(self, csv_path):
+        """
+        Exports the table to CSV. With a database, the export is read from it so
+        submissions of other reviewers are included.
+        """
+        self.flush()
+        self.write_csv(csv_path)
+
+    def write_csv(self, csv_path, df=None):
+        """
+        Exports the table as of the last flush. With a database, the rows are read
+        through a connection of its own, so this can run on a worker thread while
+        the store keeps being used.
+
+        :param csv_path: The CSV file to write.
+        :param df: The table to write instead. Without a database, pass a copy of df
+                   taken on the thread that changes the store to export from a worker thread.
+        """
+        if df is None and self.db_path is None:
+            df = self.df
+        elif df is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            try:
+                df = pd.read_sql_query("SELECT * FROM results ORDER BY rowid", conn)
+            finally:
+                conn.close()
+        temp_path = csv_path + '.tmp'
+        df.to_csv(temp_path, index=False)
+        os.replace(temp_path, csv_path)
+
+    def close(self):
+        if self._conn is not None:
+            self.flush()
+            self._conn.close()
+            self._conn = None
+
+    def _locate(self, cluster_name, base_file):
+        # Only rows still in the buffer need a flush before they can be addressed
+        row_index = self._index.get((cluster_name, base_file))
+        if row_index is not None and row_index >= len(self.df):
+            self.flush()
+        return row_index
+
+    def _create_table(self):
+        # Parameter columns have no declared type so numbers and text keep their own type
+        column_defs = []
+        for column in RESULT_COLUMNS:
+            if column in PARAM_COLUMNS or column in SUGGESTION_COLUMNS:
+                column_defs.append(_quote(column))
+            elif column in METRIC_COLUMNS:
+                column_defs.append(f"{_quote(column)} REAL")
+            else:
+                column_defs.append(f"{_quote(column)} TEXT")
+        with self._conn:
+            self._conn.execute(
+                f'CREATE TABLE IF NOT EXISTS results ({", ".join(column_defs)}, '
+                f'PRIMARY KEY ("Cluster", "File Name"))')
+            # Databases written before a column was added, e.g. the suggestion columns
+            existing = {row[1] for row in self._conn.execute("PRAGMA table_info(results)")}
+            for column, column_def in zip(RESULT_COLUMNS, column_defs):
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE results ADD COLUMN {column_def}")
+
+    def _insert_rows(self, rows):
+        if self._conn is None or not rows:
+            return
+        columns = ", ".join(_quote(column) for column in RESULT_COLUMNS)
+        placeholders = ", ".join("?" for _ in RESULT_COLUMNS)
+        # Rows another reviewer inserted in the meantime are kept as they are
+        with self._conn:
+            self._conn.executemany(
+                f"INSERT OR IGNORE INTO results ({columns}) VALUES ({placeholders})",
+                [[_to_sql_value(row.get(column)) for column in RESULT_COLUMNS] for row in rows])
+
+    def _fill_rows(self, fills):
+        if self._conn is None:
+            return
+        with self._conn:
+            for cluster_name, base_file, column, value in fills:
+                self._conn.execute(
+                    f'UPDATE results SET {_quote(column)} = ? '
+                    f'WHERE "Cluster" = ? AND "File Name" = ? AND {_quote(column)} IS NULL',
+                    (_to_sql_value(value), cluster_name, base_file))
+
+    def _suggest_rows(self, suggestions):
+        if self._conn is None:
+            return
+        # A decision another reviewer submitted in the meantime keeps its row free of suggestions
+        with self._conn:
+            for cluster_name, base_file, param, value in suggestions:
+                self._conn.execute(
+                    f'UPDATE results SET {_quote(suggestion_column(param))} = ? '
+                    f'WHERE "Cluster" = ? AND "File Name" = ? AND {_quote(param)} IS NULL',
+                    (_to_sql_value(value), cluster_name, base_file))
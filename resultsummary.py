@@ -0,0 +1,112 @@
+import os
+import json
+import numpy as np
+
+GEOMETRY_METRICS = ['no_of_soundings', 'length', 'min_dist_1', 'min_dist_2', 'min_dist_3', 'max_dist']
+SIDECAR_FILE_NAME = 'results_summary_sidecar.json'
+
+
+def summarize_processed_data(processed_data):
+    """
+    Reduces the processed samples of one result file to a compact summary.
+
+    :param processed_data: The dictionary returned by resultloader.load_result_file.
+    :return: A JSON-serializable dictionary with the mean and 2.5/97.5 percentiles of
+             each parameter, the geometry metrics and the prior bounds.
+    """
+    stats = processed_data['stats']
+    summary = {key: dict(stats[key]) for key in ('mean', 'p2.5', 'p97.5')}
+    for metric in GEOMETRY_METRICS:
+        summary[metric] = float(np.asarray(processed_data[metric]).ravel()[0])
+    summary['xlim_low'] = np.asarray(processed_data['xlim_low'], dtype=float).ravel().tolist()
+    summary['xlim_up'] = np.asarray(processed_data['xlim_up'], dtype=float).ravel().tolist()
+    return summary
+
+
+class SummarySidecar:
+    """
+    A per-project store of result file summaries, kept next to results_summary.csv.
+
+    Entries are keyed by the file path relative to the project folder and are only
+    valid while the file's size and modification time are unchanged, so edited or
+    re-run results are summarized again.
+    """
+
+    def __init__(self, project_folder):
+        """
+        Initializes the SummarySidecar instance and reads the existing sidecar file if any.
+
+        :param project_folder: The project ("Clusters") folder.
+        """
+        self.project_folder = project_folder
+        self.path = os.path.join(project_folder, SIDECAR_FILE_NAME)
+        self.entries = {}
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable summary sidecar '{self.path}': {e}")
+            self.entries = {}
+
+    def save(self):
+        """
+        Writes the sidecar if it changed. The file is replaced atomically so an
+        interrupted write never leaves a truncated sidecar behind.
+        """
+        if not self.dirty:
+            return
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f)
+        os.replace(temp_path, self.path)
+        self.dirty = False
+
+    def get(self, mat_path):
+        """
+        Returns the stored summary of mat_path, or None if it is missing or stale.
+
+        :param mat_path: The path of the result file.
+        """
+        entry = self.entries.get(self._key(mat_path))
+        if entry is None:
+            return None
+        stat = os.stat(mat_path)
+        if entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+            return None
+        return entry['summary']
+
+    def put(self, mat_path, summary):
+        """
+        Stores the summary of mat_path together with its current size and modification time.
+
+        :param mat_path: The path of the result file.
+        :param summary: The dictionary returned by summarize_processed_data.
+        """
+        stat = os.stat(mat_path)
+        self.entries[self._key(mat_path)] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'summary': summary,
+        }
+        self.dirty = True
+
+    def prune(self, mat_paths):
+        """
+        Drops the entries of result files that no longer exist in the project.
+
+        :param mat_paths: The paths of all result files currently in the project.
+        """
+        keep = {self._key(mat_path) for mat_path in mat_paths}
+        for key in list(self.entries):
+            if key not in keep:
+                del self.entries[key]
+                self.dirty = True
+
+    def _key(self, mat_path):
+        return os.path.relpath(mat_path, self.project_folder).replace(os.sep, '/')
@@ -102,3 +102,44 @@ def get_unique_set(data):
     unique_set, indices = np.unique(data, return_index=True)
     unique_set = unique_set[np.argsort(indices)]
     return unique_set
+
+def find_all_closest_file_ids(file_ids, X, Y, num_closest=5):
+    """
+    Find the closest file IDs of every file ID at once, from a single distance matrix
+    instead of ranking all pairs once per file as find_closest_file_ids does.
+
+    The neighbours are those of find_closest_file_ids except at equal distances:
+    here tied neighbours are ordered by their position in file_ids, whereas
+    find_closest_file_ids takes them in the order of an unstable sort over all pairs.
+    As there, a file ID never lists itself and repeated file IDs are listed once.
+
+    Parameters:
+    - file_ids (list of str): List of all file IDs.
+    - X (iterable): X-coordinates associated with each file ID.
+    - Y (iterable): Y-coordinates associated with each file ID.
+    - num_closest (int, optional): Number of closest file IDs to find. Defaults to 5.
+
+    Returns:
+    - dict: Maps each file ID to the list of its closest file IDs, nearest first. A
+      repeated file ID maps to the neighbours of its last occurrence.
+    """
+    points = np.column_stack((np.ravel(X), np.ravel(Y))).astype(float)
+    if len(points) < 2:
+        return {file_id: [] for file_id in file_ids}
+    distances_matrix = squareform(pdist(points))
+    np.fill_diagonal(distances_matrix, np.inf)
+    if len(set(file_ids)) == len(file_ids):
+        closest = np.argsort(distances_matrix, axis=1, kind='stable')[:, :min(num_closest, len(points) - 1)]
+        return {file_id: [file_ids[j] for j in row] for file_id, row in zip(file_ids, closest)}
+
+    # Repeated file IDs: skip the file itself and names already listed
+    closest_file_ids = {}
+    for file_id, row in zip(file_ids, np.argsort(distances_matrix, axis=1, kind='stable')):
+        neighbours = []
+        for j in row:
+            if file_ids[j] != file_id and file_ids[j] not in neighbours:
+                neighbours.append(file_ids[j])
+                if len(neighbours) == num_closest:
+                    break
+        closest_file_ids[file_id] = neighbours
+    return closest_file_ids
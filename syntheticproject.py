@@ -0,0 +1,219 @@
+import os
+import sys
+import csv
+import argparse
+import numpy as np
+import pandas as pd
+from scipy.io import savemat
+from scipy.spatial.distance import pdist, squareform
+from projectscanner import CLUSTER_PREFIX, EXTRACTED_FOLDER_NAME, RESULTS_FOLDER_NAME
+from extract_data import GEOCODING_FIELDS
+
+SYNTHETIC_RESULTS_CSV = 'synthetic_results.csv'  # Input CSV of extract_data.py listing the fake result files
+FIRST_CLUSTER_NUMBER = 1000
+ORIGIN_X, ORIGIN_Y = 1570000.0, 5179000.0  # NZTM coordinates near Christchurch
+ORIGIN_LON, ORIGIN_LAT = 172.63, -43.54
+CLUSTER_SPACING = 500.0  # Distance between neighbouring cluster centres (m)
+SOUNDING_SPACING = 8.0  # Typical distance between neighbouring soundings of a cluster (m)
+# Prior bounds of the TMCMC samples, in the raw (log) space of x and in the order of PARAM_NAMES
+PRIOR_LOW = np.array([-2.0, -4.0, 0.0, -1.0, -1.0, -2.0, -4.0, 0.0])
+PRIOR_UP = np.array([6.0, 1.0, 5.0, 3.0, 3.0, 6.0, 1.0, 5.0])
+
+
+def synthetic_profile(rng, depth_length, start_depth=None):
+    """
+    Draws one CPT sounding: alternating sand and clay layers with a trend over
+    depth, correlated noise, a few spikes and a few non-positive readings, sampled
+    at an irregular depth spacing as in the exported CPT files.
+
+    :param rng: The numpy Generator to draw from.
+    :param depth_length: The deepest possible depth (m); soundings may refuse earlier.
+    :param start_depth: The first depth (m). Default is None, which draws a pre-drill depth of up to 1 m.
+    :return: A DataFrame with the columns 'Depth (m)' and 'qt (MPa)'.
+    """
+    if start_depth is None:
+        start_depth = rng.uniform(0.0, 1.0)
+    end_depth = max(start_depth + 1.0, depth_length * rng.uniform(0.7, 1.0))  # Early refusal
+    step = rng.uniform(0.01, 0.02)
+    depth = start_depth + np.cumsum(rng.uniform(0.8 * step, 1.2 * step, int((end_depth - start_depth) / step)))
+    depth = np.round(depth[depth <= end_depth], 3)
+
+    # Layer boundaries every 0.5 to 3 m, each layer either sand-like or clay-like
+    boundaries = np.cumsum(rng.uniform(0.5, 3.0, int(depth_length / 0.5) + 1)) + start_depth
+    layer = np.searchsorted(boundaries, depth)
+    sandy = rng.random(len(boundaries) + 1) < 0.5
+    base = np.where(sandy, rng.uniform(5.0, 25.0, sandy.size), rng.uniform(0.3, 2.0, sandy.size))[layer]
+
+    # AR(1) noise on the log scale gives the correlated wiggle of real soundings
+    innovations = rng.normal(0.0, 0.15, depth.size)
+    noise = np.empty_like(innovations)
+    level = 0.0
+    for i, innovation in enumerate(innovations):
+        level = 0.9 * level + innovation
+        noise[i] = level
+    qt = base * (1.0 + 0.03 * depth) * np.exp(noise)
+
+    spikes = rng.random(depth.size) < 0.002
+    qt[spikes] *= rng.uniform(3.0, 8.0, spikes.sum())
+    dropouts = rng.random(depth.size) < 0.001
+    qt[dropouts] = rng.choice([0.0, -0.1], dropouts.sum())
+    return pd.DataFrame({'Depth (m)': depth, 'qt (MPa)': np.round(qt, 4)})
+
+
+def synthetic_result_data(rng, X, Y, num_samples=2000, depth_range=None):
+    """
+    Draws the variables of one TMCMC result file for the given soundings.
+
+    :param rng: The numpy Generator to draw from.
+    :param X, Y: NZTM coordinates of the analyzed soundings.
+    :param num_samples: Number of posterior samples. Default is 2000.
+    :param depth_range: The analyzed (start, end) depth in m. Default is None, which draws one.
+    :return: A dictionary with x, x_low, x_up, X, Y, z, temp_z and temp_h, shaped as MATLAB writes them.
+    """
+    if depth_range is None:
+        depth_range = draw_depth_range(rng)
+    z = np.arange(depth_range[0], depth_range[1], 0.02).reshape(-1, 1)
+    X = np.asarray(X, dtype=float).reshape(-1, 1)
+    Y = np.asarray(Y, dtype=float).reshape(-1, 1)
+
+    # Some parameters are well constrained by the data and some barely move from the prior
+    width = PRIOR_UP - PRIOR_LOW
+    centre = PRIOR_LOW + width * rng.uniform(0.2, 0.8, width.size)
+    spread = width * np.where(rng.random(width.size) < 0.5, 0.03, 0.3)
+    x = np.clip(rng.normal(centre, spread, (num_samples, width.size)), PRIOR_LOW, PRIOR_UP)
+
+    return {
+        'x': x,
+        'x_low': PRIOR_LOW.reshape(1, -1),
+        'x_up': PRIOR_UP.reshape(1, -1),
+        'X': X,
+        'Y': Y,
+        'z': z,
+        'temp_z': np.abs(z - z.T),
+        'temp_h': squareform(pdist(np.hstack((X, Y)))),
+    }
+
+
+def draw_depth_range(rng):
+    # An analyzed interval of 2 to 5 m starting between 0.5 and 2 m, rounded as the analyst would enter it
+    start = round(rng.uniform(0.5, 2.0), 2)
+    return start, round(start + rng.uniform(2.0, 5.0), 2)
+
+
+def result_file_name(depth_range, num_samples):
+    # Named like the files the MATLAB scripts write, e.g. 0.5_3.3_TMCMC_2000.mat
+    return f"{depth_range[0]:g}_{depth_range[1]:g}_TMCMC_{num_samples}.mat"
+
+
+def write_synthetic_cluster(project_path, cluster_name, center, first_id, rng, num_soundings=20, depth_length=20.0,
+                            num_result_files=2, num_samples=2000):
+    """
+    Writes one fake cluster folder: <cluster>.csv with the sounding locations, one
+    CSV per sounding in Extracted and num_result_files files in results_TMCMC.
+
+    :param center: The NZTM (x, y) centre of the cluster.
+    :param first_id: The number of the first sounding; soundings are named CPT_<number>.
+    :return: A list of the written result file names.
+    """
+    cluster_folder = os.path.join(project_path, cluster_name)
+    extracted_folder = os.path.join(cluster_folder, EXTRACTED_FOLDER_NAME)
+    os.makedirs(extracted_folder, exist_ok=True)
+
+    file_ids = [f"CPT_{first_id + i}" for i in range(num_soundings)]
+    radius = SOUNDING_SPACING * np.sqrt(num_soundings)
+    angle = rng.uniform(0.0, 2 * np.pi, num_soundings)
+    distance = radius * np.sqrt(rng.random(num_soundings))
+    nztmX = np.round(center[0] + distance * np.cos(angle), 2)
+    nztmY = np.round(center[1] + distance * np.sin(angle), 2)
+    pd.DataFrame({'ID': file_ids, 'nztmX': nztmX, 'nztmY': nztmY}).to_csv(
+        os.path.join(cluster_folder, f"{cluster_name}.csv"), index=False)
+
+    for file_id in file_ids:
+        synthetic_profile(rng, depth_length).to_csv(os.path.join(extracted_folder, f"{file_id}.csv"), index=False)
+
+    mat_files = []
+    if num_result_files:
+        results_folder = os.path.join(cluster_folder, RESULTS_FOLDER_NAME)
+        os.makedirs(results_folder, exist_ok=True)
+    for _ in range(num_result_files):
+        chosen = np.sort(rng.choice(num_soundings, min(num_soundings, int(rng.integers(2, 9))), replace=False))
+        depth_range = draw_depth_range(rng)
+        mat_file = result_file_name(depth_range, num_samples)
+        if mat_file in mat_files:
+            continue
+        savemat(os.path.join(results_folder, mat_file),
+                synthetic_result_data(rng, nztmX[chosen], nztmY[chosen], num_samples, depth_range))
+        mat_files.append(mat_file)
+    return mat_files
+
+
+def generate_project(project_path, num_clusters=4, num_soundings=20, depth_length=20.0, num_result_files=2,
+                     num_samples=2000, seed=0, progress=None):
+    """
+    Writes a fake project in the layout the tools expect, plus SYNTHETIC_RESULTS_CSV,
+    which lists the result files with the location of their cluster as the input of
+    extract_data.py. The same arguments always give the same project.
+
+    :param project_path: The project folder; created if needed.
+    :param num_clusters: Number of cluster folders. Default is 4.
+    :param num_soundings: Number of soundings per cluster. Default is 20.
+    :param depth_length: Deepest depth of the soundings in m. Default is 20.
+    :param num_result_files: Number of TMCMC result files per cluster. Default is 2.
+    :param num_samples: Number of posterior samples per result file. Default is 2000.
+    :param seed: Seed of the random generator. Default is 0.
+    :param progress: Called as progress(clusters written, clusters total). Default is None.
+    :return: A list of the cluster names.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(project_path, exist_ok=True)
+    columns = int(np.ceil(np.sqrt(num_clusters)))
+    cluster_names = []
+    rows = []
+    for i in range(num_clusters):
+        cluster_name = f"{CLUSTER_PREFIX}{FIRST_CLUSTER_NUMBER + i}"
+        center = (ORIGIN_X + CLUSTER_SPACING * (i % columns), ORIGIN_Y + CLUSTER_SPACING * (i // columns))
+        mat_files = write_synthetic_cluster(project_path, cluster_name, center, i * num_soundings + 1, rng,
+                                            num_soundings=num_soundings, depth_length=depth_length,
+                                            num_result_files=num_result_files, num_samples=num_samples)
+        location = {
+            'X_c': center[0], 'Y_c': center[1],
+            # A flat approximation is close enough for fake data
+            'lon_c': ORIGIN_LON + (center[0] - ORIGIN_X) / 80800.0,
+            'lat_c': ORIGIN_LAT + (center[1] - ORIGIN_Y) / 111100.0,
+            'road': f"Synthetic Road {i + 1}", 'suburb': 'Synthetic', 'city': 'Christchurch',
+            'county': 'Christchurch City', 'state': 'Canterbury', 'postcode': '8011',
+            'site name': f"Synthetic_Synthetic Road {i + 1}",
+        }
+        rows.extend({'Cluster': cluster_name, 'mat_file_name': mat_file, **location} for mat_file in mat_files)
+        cluster_names.append(cluster_name)
+        if progress is not None:
+            progress(i + 1, num_clusters)
+
+    with open(os.path.join(project_path, SYNTHETIC_RESULTS_CSV), 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=['Cluster', 'mat_file_name'] + GEOCODING_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return cluster_names
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Write a fake CPT project (cluster CSVs, Extracted soundings and TMCMC result files) "
+                    "for testing and benchmarking the tools.")
+    parser.add_argument('project', help="Project folder to write; created if needed")
+    parser.add_argument('-c', '--clusters', type=int, default=4, help="Number of clusters (default: 4)")
+    parser.add_argument('-s', '--soundings', type=int, default=20, help="Soundings per cluster (default: 20)")
+    parser.add_argument('-d', '--depth', type=float, default=20.0, help="Deepest sounding depth in m (default: 20)")
+    parser.add_argument('-r', '--results', type=int, default=2, help="TMCMC result files per cluster (default: 2)")
+    parser.add_argument('--samples', type=int, default=2000, help="Posterior samples per result file (default: 2000)")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed (default: 0)")
+    args = parser.parse_args(argv)
+
+    generate_project(args.project, args.clusters, args.soundings, args.depth, args.results, args.samples, args.seed,
+                     progress=lambda done, total: print(f"{done}/{total} clusters written"))
+    print(f"Done: {args.project} (extract_data.py input: {SYNTHETIC_RESULTS_CSV})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
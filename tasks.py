@@ -0,0 +1,195 @@
+import threading
+import traceback
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from processdialog import ProgressDialog
+
+
+class TaskCanceled(Exception):
+    """
+    Raised inside a task function to stop it once the task was canceled.
+    """
+
+
+class TaskSignals(QObject):
+    progress = pyqtSignal(int, int)  # items done, items total
+    message = pyqtSignal(str)
+    partial = pyqtSignal(object)  # An intermediate result, e.g. a batch of loaded files
+    result = pyqtSignal(object)  # The return value of the task function
+    error = pyqtSignal(str)  # The exception raised by the task function, as text
+    canceled = pyqtSignal()
+    finished = pyqtSignal()  # Emitted last, whatever the outcome
+
+
+class Task(QRunnable):
+    """
+    A function run on a QThreadPool worker thread.
+
+    The function receives the task as its first argument and reports through it:
+    report_progress(done, total), set_message(text) and emit_partial(value). It
+    must not touch widgets; its return value and partial results are delivered
+    to the GUI thread through the signals. Cancellation is cooperative: the
+    function stops at its next report_progress or check_canceled call.
+    """
+
+    def __init__(self, key, function, *args, **kwargs):
+        """
+        Initializes the Task instance.
+
+        :param key: Identifies the request; see TaskRunner.submit.
+        :param function: Called as function(task, *args, **kwargs) on the worker thread.
+        """
+        super().__init__()
+        self.setAutoDelete(False)  # The runner keeps the task until it finished
+        self.key = key
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = TaskSignals()
+        self.detached = False  # Set when a newer request replaced the task; its signals are then ignored
+        self._canceled = threading.Event()
+
+    @property
+    def canceled(self):
+        return self._canceled.is_set()
+
+    def cancel(self):
+        self._canceled.set()
+
+    def check_canceled(self):
+        if self._canceled.is_set():
+            raise TaskCanceled()
+
+    def report_progress(self, done, total):
+        self.check_canceled()
+        self.signals.progress.emit(done, total)
+
+    def set_message(self, text):
+        self.signals.message.emit(text)
+
+    def emit_partial(self, value):
+        self.signals.partial.emit(value)
+
+    def run(self):
+        try:
+            result = self.function(self, *self.args, **self.kwargs)
+        except TaskCanceled:
+            self.signals.canceled.emit()
+        except Exception as e:
+            traceback.print_exc()
+            self.signals.error.emit(f"{type(e).__name__}: {e}")
+        else:
+            if self.canceled:
+                self.signals.canceled.emit()
+            else:
+                self.signals.result.emit(result)
+        finally:
+            # The connected callbacks keep the task alive; do not keep its inputs alive with it
+            self.function = self.args = self.kwargs = None
+            self.signals.finished.emit()
+
+
+class TaskRunner(QObject):
+    """
+    Runs tasks on a QThreadPool so the GUI thread never waits for I/O.
+
+    Requests are deduplicated by key: submitting a key whose task is still
+    running returns that task instead of starting another one, unless the
+    request replaces it. Callbacks run on the GUI thread.
+    """
+
+    def __init__(self, max_threads=None, parent=None):
+        """
+        Initializes the TaskRunner instance.
+
+        :param max_threads: Maximum number of tasks running at once. Default is None (one per CPU).
+        :param parent: The parent QObject, also used as the parent of progress dialogs. Default is None.
+        """
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        if max_threads is not None:
+            self.pool.setMaxThreadCount(max_threads)
+        self._tasks = {}  # key -> running Task
+
+    def submit(self, key, function, *args, on_result=None, on_partial=None, on_error=None, on_canceled=None,
+               on_finished=None, progress_title=None, progress_message="", modal=True, cancelable=True,
+               replace=False, **kwargs):
+        """
+        Runs function(task, *args, **kwargs) on the thread pool.
+
+        :param key: Identifies the request, e.g. ('export', cluster_name).
+        :param on_result: Called with the return value of the function.
+        :param on_partial: Called with each value the function passes to emit_partial.
+        :param on_error: Called with the error text if the function raised. Default prints it.
+        :param on_canceled: Called if the task was canceled.
+        :param on_finished: Called last, whatever the outcome.
+        :param progress_title: Shows a ProgressDialog with this title while the task runs. Default is None (no dialog).
+        :param progress_message: The initial message of the dialog.
+        :param modal: Whether the dialog blocks the window. Default is True.
+        :param cancelable: Whether the dialog has a Cancel button. Default is True.
+        :param replace: Cancel a running task with the same key and ignore its signals, instead
+                        of returning it. Default is False.
+        :return: The Task, which may be one submitted earlier with the same key.
+        """
+        running = self._tasks.get(key)
+        if running is not None:
+            if not replace:
+                return running
+            self.discard(key)
+
+        task = Task(key, function, *args, **kwargs)
+        signals = task.signals
+        # Signals of a detached task may still be queued; they are dropped here
+        for signal, callback in ((signals.result, on_result), (signals.partial, on_partial),
+                                 (signals.error, on_error or print), (signals.canceled, on_canceled)):
+            if callback is not None:
+                signal.connect(lambda *values, task=task, callback=callback:
+                               None if task.detached else callback(*values))
+        signals.finished.connect(lambda task=task, callback=on_finished: self._on_finished(task, callback))
+
+        if progress_title is not None:
+            dialog = ProgressDialog(title=progress_title, modal=modal, cancelable=cancelable, parent=self.parent())
+            dialog.set_message(progress_message)
+            dialog.set_busy()
+            signals.progress.connect(dialog.update_count)
+            signals.message.connect(dialog.set_message)
+            dialog.canceled.connect(task.cancel)
+            signals.finished.connect(dialog.accept)
+            dialog.show()
+
+        self._tasks[key] = task
+        self.pool.start(task)
+        return task
+
+    def is_running(self, key):
+        return key in self._tasks
+
+    def cancel(self, key):
+        """
+        Asks the task running for key to stop; its on_canceled and on_finished callbacks still run.
+        """
+        task = self._tasks.get(key)
+        if task is not None:
+            task.cancel()
+
+    def discard(self, key):
+        """
+        Cancels the task running for key and drops all its remaining signals.
+        """
+        task = self._tasks.pop(key, None)
+        if task is not None:
+            task.detached = True
+            task.cancel()
+
+    def discard_all(self):
+        for key in list(self._tasks):
+            self.discard(key)
+
+    def wait(self, msecs=-1):
+        # Blocks until all tasks, including discarded ones, have returned
+        return self.pool.waitForDone(msecs)
+
+    def _on_finished(self, task, callback):
+        if self._tasks.get(task.key) is task:
+            del self._tasks[task.key]
+        if callback is not None and not task.detached:
+            callback()
@@ -0,0 +1,79 @@
+import os
+import csv
+import json
+import shutil
+import tempfile
+import numpy as np
+from syntheticproject import generate_project, SYNTHETIC_RESULTS_CSV
+from extract_data import (extract_results, unique_work_items, geocoding_of, ExtractionManifest, _to_json_value,
+                          GEOCODING_FIELDS, MANIFEST_SUFFIX, ERRORS_SUFFIX)
+
+
+def test_synthetic_extraction():
+    # Summarizes a one-cluster synthetic project end to end, then again from the manifest
+    root = tempfile.mkdtemp(prefix='cpt_test_extract_')
+    try:
+        generate_project(root, num_clusters=1, num_soundings=6, depth_length=8.0, num_result_files=2,
+                         num_samples=500)
+        input_csv = os.path.join(root, SYNTHETIC_RESULTS_CSV)
+        output_csv = os.path.join(root, 'results_final.csv')
+
+        reused, summarized, errors = extract_results(root, input_csv, output_csv, max_workers=2)
+        assert (reused, summarized, errors) == (0, 2, []), (reused, summarized, errors)
+        assert not os.path.exists(output_csv + ERRORS_SUFFIX)
+        with open(output_csv, newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        assert len(rows) == 2
+        assert all(float(row['length']) > 0 for row in rows)
+        with open(output_csv + MANIFEST_SUFFIX, encoding='utf-8') as f:
+            assert len([json.loads(line) for line in f]) == 2
+
+        reused, summarized, errors = extract_results(root, input_csv, output_csv, max_workers=2)
+        assert (reused, summarized, errors) == (2, 0, []), (reused, summarized, errors)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def test_geocoding_per_file():
+    # Files of one cluster keep their own locations; a file missing from the CSV gets its cluster's
+    root = tempfile.mkdtemp(prefix='cpt_test_geocoding_')
+    try:
+        os.makedirs(os.path.join(root, 'Cluster 1', 'results_TMCMC'))
+        for mat_file in ('a.mat', 'b.mat', 'c.mat'):
+            open(os.path.join(root, 'Cluster 1', 'results_TMCMC', mat_file), 'w').close()
+        rows = [{'Cluster': 'Cluster 1', 'mat_file_name': mat_file, **dict.fromkeys(GEOCODING_FIELDS, ''), 'X_c': x_c}
+                for mat_file, x_c in (('a.mat', '1'), ('b.mat', '2'), ('a.mat', '3'))]
+        geocoding, work_items = unique_work_items(rows, root)
+        assert work_items == [('Cluster 1', 'a.mat'), ('Cluster 1', 'b.mat'), ('Cluster 1', 'c.mat')]
+        assert [geocoding_of(geocoding, key)['X_c'] for key in work_items] == ['1', '2', '1']
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def test_manifest_values():
+    # Array values are stored as scalars or lists; a value JSON cannot store is not kept
+    assert _to_json_value(np.array([2.5])) == 2.5
+    assert _to_json_value(np.array([[1.0, 2.0]])) == [[1.0, 2.0]]
+    assert _to_json_value(np.float64(1.5)) == 1.5
+
+    root = tempfile.mkdtemp(prefix='cpt_test_manifest_')
+    try:
+        manifest = ExtractionManifest(os.path.join(root, 'manifest.jsonl'))
+        stat = os.stat(root)
+        try:
+            manifest.put(('Cluster 1', 'a.mat'), stat, {'length': object()})
+        except TypeError:
+            pass
+        else:
+            raise AssertionError("An object JSON cannot store was accepted")
+        assert ('Cluster 1', 'a.mat') not in manifest.entries
+        manifest.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    test_synthetic_extraction()
+    test_geocoding_per_file()
+    test_manifest_values()
+    print("OK")
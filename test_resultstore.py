@@ -0,0 +1,58 @@
+import shutil
+import tempfile
+import pandas as pd
+from resultstore import ResultStore, SUGGESTION_COLUMNS
+
+
+def test_undecided_parameter_reopens_empty():
+    # A parameter left "to check" is stored as NULL, not as empty text
+    root = tempfile.mkdtemp(prefix='cpt_test_resultstore_')
+    try:
+        store = ResultStore.open(root)
+        store.add_row('C1', 'a.mat')
+        store.set('C1', 'a.mat', 'sofv', '')
+        store.set('C1', 'a.mat', 'nuv', 1.5)
+        store.commit_row('C1', 'a.mat')
+        store.close()
+
+        store = ResultStore.open(root)
+        assert pd.isna(store.get('C1', 'a.mat', 'sofv'))
+        assert store.get('C1', 'a.mat', 'nuv') == 1.5
+        store.suggest('C1', 'a.mat', {'sofv': 2.0})
+        assert store.get('C1', 'a.mat', 'sofv suggested') == 2.0
+        store.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def test_suggestions_are_replaced():
+    # Running the classifier again replaces the suggestions of undecided parameters only
+    root = tempfile.mkdtemp(prefix='cpt_test_resultstore_')
+    try:
+        store = ResultStore.open(root)
+        store.add_row('C1', 'a.mat', nuv=1.5)
+        store.suggest('C1', 'a.mat', {'sofv': 2.0, 'sofh': 3.0, 'nuv': 4.0})
+        store.flush()
+        store.suggest('C1', 'a.mat', {'sofv': 5.0})
+        store.flush()
+        store.close()
+
+        store = ResultStore.open(root)
+        assert store.get('C1', 'a.mat', 'sofv suggested') == 5.0
+        assert pd.isna(store.get('C1', 'a.mat', 'sofh suggested'))
+        assert pd.isna(store.get('C1', 'a.mat', 'nuv suggested'))
+        store.clear_suggestions('C1', 'a.mat')
+        store.commit_row('C1', 'a.mat', columns=SUGGESTION_COLUMNS)
+        store.close()
+
+        store = ResultStore.open(root)
+        assert pd.isna(store.get('C1', 'a.mat', 'sofv suggested'))
+        store.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    test_undecided_parameter_reopens_empty()
+    test_suggestions_are_replaced()
+    print("OK")
@@ -0,0 +1,39 @@
+import numpy as np
+from spatial_analysis_utils import find_closest_file_ids, find_all_closest_file_ids
+
+
+def test_tied_neighbours():
+    # b and c are both 1 m from a; ties are listed in file_ids order
+    file_ids = ['a', 'b', 'c', 'd']
+    X, Y = [0.0, -1.0, 1.0, 5.0], [0.0, 0.0, 0.0, 0.0]
+    closest = find_all_closest_file_ids(file_ids, X, Y, num_closest=2)
+    assert closest['a'] == ['b', 'c']
+    assert closest['d'] == ['c', 'a']
+    # Same neighbours as the pairwise ranking, whose tie order is not defined
+    for file_id in file_ids:
+        assert set(closest[file_id]) == set(find_closest_file_ids(file_id, file_ids, X, Y, num_closest=2))
+
+
+def test_matches_pairwise_ranking():
+    rng = np.random.default_rng(0)
+    file_ids = [f'CPT_{i}' for i in range(30)]
+    X, Y = rng.uniform(0, 100, 30), rng.uniform(0, 100, 30)
+    closest = find_all_closest_file_ids(file_ids, X, Y)
+    for file_id in file_ids:
+        assert closest[file_id] == find_closest_file_ids(file_id, file_ids, X, Y)
+
+
+def test_repeated_file_ids():
+    # A repeated file ID neither lists itself nor a neighbour twice
+    file_ids = ['a', 'b', 'b', 'c']
+    X, Y = [0.0, 1.0, 1.5, 4.0], [0.0, 0.0, 0.0, 0.0]
+    closest = find_all_closest_file_ids(file_ids, X, Y, num_closest=3)
+    assert closest['a'] == ['b', 'c']
+    assert closest['b'] == ['a', 'c']  # From the last 'b'
+
+
+if __name__ == '__main__':
+    test_tied_neighbours()
+    test_matches_pairwise_ranking()
+    test_repeated_file_ids()
+    print("OK")
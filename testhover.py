@@ -3,6 +3,7 @@ import matplotlib.pyplot as plt
 from scipy.stats import gaussian_kde
 from scipy.optimize import fmin
 from matplotlib.path import Path
+from posteriorstats import transform_samples, transform_bounds
 
 class ResultPlotter:
     def __init__(self, canvas, markersize=4, linewidth=1, color='0.5', marker='s'):
@@ -13,22 +14,8 @@ class ResultPlotter:
         self.marker = marker
 
     def plot_results(self, x, x_low_GP, x_up_GP):
-        sig = np.sqrt(1 / np.exp(x[:, 0]))
-        sofv = np.exp(x[:, 1])
-        sofh = np.exp(x[:, 2])
-        nuv = np.exp(x[:, 3])
-        nuh = np.exp(x[:, 4])
-        sig_t = np.sqrt(1 / np.exp(x[:, 5]))
-        sofv_t = np.exp(x[:, 6])
-        sofh_t = np.exp(x[:, 7])
-        
-        xlim_low = np.exp(x_low_GP)
-        xlim_low[0] = np.sqrt(1 / xlim_low[0])
-        xlim_low[5] = np.sqrt(1 / xlim_low[5])
-        
-        xlim_up = np.exp(x_up_GP)
-        xlim_up[0] = np.sqrt(1 / xlim_up[0])
-        xlim_up[5] = np.sqrt(1 / xlim_up[5])
+        sig, sofv, sofh, nuv, nuh, sig_t, sofv_t, sofh_t = transform_samples(x).T
+        xlim_low, xlim_up = transform_bounds(x_low_GP, x_up_GP)
 
         # Clear the current figure to prepare for new plots
         self.canvas.figure.clf()
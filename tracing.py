@@ -0,0 +1,261 @@
+import os
+import json
+import time
+import atexit
+import threading
+import functools
+import multiprocessing
+
+TRACE_ENV_VAR = 'CPT_TRACE'  # Set to a file path to record a trace from startup and write it at exit
+MAX_EVENTS = 1000000  # Events kept for the trace file; the per-stage totals keep counting beyond it
+
+# Module state. Spans only check _enabled while tracing is off, so instrumented
+# code costs a global lookup and a branch.
+_enabled = False
+_lock = threading.Lock()
+_events = []
+_stats = {}  # (category, name) -> [count, total seconds, max seconds]
+_thread_names = {}  # (pid, tid) -> thread name
+_exit_path = None
+
+
+class _NullSpan:
+    # Shared by every span while tracing is off
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """
+    Times a with-block and records it as one complete event. Values known only at
+    the end of the block, e.g. the number of files read, can be added with set().
+    """
+    __slots__ = ('name', 'category', 'args', 'start')
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _record(self.name, self.category, self.start, time.perf_counter(), self.args)
+        return False
+
+    def set(self, **args):
+        self.args.update(args)
+
+
+def span(name, category='cpt', **args):
+    """
+    Returns a context manager timing its block as the stage name.
+
+    :param name: The stage name shown in the trace and the summary.
+    :param category: Groups stages, e.g. 'io', 'compute' or 'render'. Default is 'cpt'.
+    :param args: Values attached to the event, shown by the trace viewer.
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(name, category, args)
+
+
+def traced(name=None, category='cpt'):
+    """
+    Decorator timing every call of a function as one span.
+
+    Only for plain functions and methods; do not decorate methods connected to Qt
+    signals, since PyQt passes the signal arguments to the generic wrapper.
+
+    :param name: The stage name. Default is None, which uses the qualified function name.
+    :param category: See span. Default is 'cpt'.
+    """
+    def decorator(function):
+        span_name = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _record(span_name, category, start, time.perf_counter(), None)
+        return wrapper
+    return decorator
+
+
+def _record(name, category, start, end, args):
+    # perf_counter is a system-wide monotonic clock, so events of worker processes line up
+    pid, tid = os.getpid(), threading.get_ident()
+    event = {'name': name, 'cat': category, 'ph': 'X', 'ts': start * 1e6, 'dur': (end - start) * 1e6,
+             'pid': pid, 'tid': tid}
+    if args:
+        event['args'] = args
+    with _lock:
+        if (pid, tid) not in _thread_names:
+            _thread_names[(pid, tid)] = threading.current_thread().name
+        if len(_events) < MAX_EVENTS:
+            _events.append(event)
+        _add_to_stats(category, name, end - start)
+
+
+def _add_to_stats(category, name, duration):
+    stats = _stats.get((category, name))
+    if stats is None:
+        _stats[(category, name)] = [1, duration, duration]
+    else:
+        stats[0] += 1
+        stats[1] += duration
+        stats[2] = max(stats[2], duration)
+
+
+def is_enabled():
+    return _enabled
+
+
+def enable(trace_path=None):
+    """
+    Starts recording spans.
+
+    :param trace_path: Write the trace to this file when the process exits. Default is None
+                       (the trace is only written by an explicit write_trace call).
+    """
+    global _enabled, _exit_path
+    _enabled = True
+    if trace_path and _exit_path is None:
+        atexit.register(_write_at_exit)
+    if trace_path:
+        _exit_path = trace_path
+
+
+def disable():
+    # Recorded events are kept until reset()
+    global _enabled
+    _enabled = False
+
+
+def reset():
+    with _lock:
+        _events.clear()
+        _stats.clear()
+        _thread_names.clear()
+
+
+def drain():
+    """
+    Takes the recorded events out of this process, e.g. to send them from a worker to the parent.
+
+    :return: A tuple (events, thread_names) to pass to merge.
+    """
+    with _lock:
+        events, thread_names = list(_events), dict(_thread_names)
+        _events.clear()
+        _stats.clear()
+        _thread_names.clear()
+    return events, thread_names
+
+
+def merge(drained):
+    """
+    Adds events recorded in another process, as returned by its drain(), to this process.
+    """
+    events, thread_names = drained
+    with _lock:
+        for key, thread_name in thread_names.items():
+            _thread_names.setdefault(key, thread_name)
+        for event in events:
+            if len(_events) < MAX_EVENTS:
+                _events.append(event)
+            _add_to_stats(event['cat'], event['name'], event['dur'] / 1e6)
+
+
+def run_traced(function, *args, **kwargs):
+    """
+    Process pool helper: calls function with tracing on in the worker process and
+    returns its result together with the worker's spans.
+
+    :return: A tuple (result, drained) where drained is passed to merge in the parent.
+    """
+    enable()
+    drain()  # Spans of an earlier call were already sent
+    result = function(*args, **kwargs)
+    return result, drain()
+
+
+def summary():
+    """
+    Aggregates the recorded spans per stage.
+
+    :return: A list of dictionaries with 'category', 'name', 'count', 'total', 'mean' and 'max'
+             (in seconds), slowest total first.
+    """
+    with _lock:
+        items = [(key, list(stats)) for key, stats in _stats.items()]
+    rows = [{'category': category, 'name': name, 'count': count, 'total': total, 'mean': total / count, 'max': longest}
+            for (category, name), (count, total, longest) in items]
+    rows.sort(key=lambda row: row['total'], reverse=True)
+    return rows
+
+
+def format_summary(rows=None):
+    # The summary as a text table, for the console and logs
+    rows = summary() if rows is None else rows
+    lines = [f"{'Stage':<44}{'Calls':>8}{'Total (ms)':>14}{'Mean (ms)':>12}{'Max (ms)':>12}"]
+    for row in rows:
+        lines.append(f"{row['category'] + ': ' + row['name']:<44}{row['count']:>8}{row['total'] * 1000:>14.1f}"
+                     f"{row['mean'] * 1000:>12.2f}{row['max'] * 1000:>12.2f}")
+    return '\n'.join(lines)
+
+
+def write_trace(path):
+    """
+    Writes the recorded spans in the Chrome trace event format, which chrome://tracing
+    and https://ui.perfetto.dev open directly.
+
+    :param path: The .json file to write.
+    :return: The number of span events written.
+    """
+    with _lock:
+        events = list(_events)
+        thread_names = dict(_thread_names)
+    metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': thread_name}}
+                for (pid, tid), thread_name in thread_names.items()]
+    metadata += [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0,
+                  'args': {'name': 'main' if pid == os.getpid() else f'worker {pid}'}}
+                 for pid in {pid for pid, _ in thread_names}]
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f)
+    os.replace(temp_path, path)
+    return len(events)
+
+
+def _write_at_exit():
+    if _exit_path is not None and (_events or _stats):
+        try:
+            count = write_trace(_exit_path)
+            print(f"Wrote {count} trace events to {_exit_path}")
+        except OSError as e:
+            print(f"Cannot write the trace to {_exit_path}: {e}")
+
+
+# Worker processes of a process pool re-import this module; only the main process
+# records from startup, workers send their spans back through run_traced.
+if os.environ.get(TRACE_ENV_VAR) and multiprocessing.parent_process() is None:
+    enable(os.environ[TRACE_ENV_VAR])
@@ -0,0 +1,101 @@
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QTableWidget,
+                             QTableWidgetItem, QHeaderView, QAction, QFileDialog)
+from PyQt5.QtCore import Qt
+import tracing
+
+SUMMARY_COLUMNS = ['Stage', 'Category', 'Calls', 'Total (ms)', 'Mean (ms)', 'Max (ms)']
+
+
+class TimingSummaryDialog(QDialog):
+    """
+    Shows the time spent in each instrumented stage since tracing was started,
+    slowest total first, and saves the trace for chrome://tracing or Perfetto.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Timing Summary")
+        self.resize(720, 480)
+        self.statusLabel = QLabel("", self)
+        self.table = QTableWidget(0, len(SUMMARY_COLUMNS), self)
+        self.table.setHorizontalHeaderLabels(SUMMARY_COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.setSortingEnabled(True)
+
+        buttons = QHBoxLayout()
+        for text, slot in (("Refresh", self.refresh), ("Reset", self.reset), ("Save trace...", self.save_trace),
+                           ("Close", self.accept)):
+            button = QPushButton(text, self)
+            button.clicked.connect(slot)
+            buttons.addWidget(button)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.statusLabel)
+        layout.addWidget(self.table)
+        layout.addLayout(buttons)
+        self.setLayout(layout)
+        self.refresh()
+
+    def refresh(self):
+        rows = tracing.summary()
+        self.table.setSortingEnabled(False)  # Sorting while filling would move rows under the cursor
+        self.table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            values = [row['name'], row['category'], row['count'],
+                      row['total'] * 1000, row['mean'] * 1000, row['max'] * 1000]
+            for j, value in enumerate(values):
+                item = QTableWidgetItem()
+                if isinstance(value, str):
+                    item.setText(value)
+                else:
+                    # Numbers are stored as numbers so the columns sort numerically
+                    item.setData(Qt.DisplayRole, round(value, 2) if isinstance(value, float) else value)
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(i, j, item)
+        self.table.setSortingEnabled(True)
+        state = "Recording" if tracing.is_enabled() else "Not recording; enable Help > Record timing trace"
+        self.statusLabel.setText(f"{state}. {len(rows)} stages.")
+
+    def reset(self):
+        tracing.reset()
+        self.refresh()
+
+    def save_trace(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Save Trace", "cpt_trace.json", "Chrome trace (*.json)")
+        if not path:
+            return
+        try:
+            count = tracing.write_trace(path)
+        except OSError as e:
+            self.statusLabel.setText(f"Cannot write {path}: {e}")
+            return
+        self.statusLabel.setText(f"Wrote {count} events to {path}. Open it in chrome://tracing or ui.perfetto.dev.")
+
+
+def add_tracing_actions(menu, parent):
+    """
+    Adds the tracing actions to a menu, normally the Help menu of a main window:
+    a checkable "Record timing trace" action and "Timing summary...".
+
+    :param menu: The QMenu to add the actions to.
+    :param parent: The window owning the actions and the summary dialog.
+    """
+    record_action = QAction("Record timing trace", parent, checkable=True)
+    record_action.setChecked(tracing.is_enabled())  # On already if started with CPT_TRACE set
+    record_action.toggled.connect(lambda checked: tracing.enable() if checked else tracing.disable())
+    menu.addAction(record_action)
+
+    dialog = None
+
+    def show_summary():
+        nonlocal dialog
+        if dialog is None:
+            dialog = TimingSummaryDialog(parent)
+        dialog.refresh()
+        dialog.show()
+        dialog.raise_()
+
+    summary_action = QAction("Timing summary...", parent)
+    summary_action.triggered.connect(show_summary)
+    menu.addAction(summary_action)